@@ -1,15 +1,160 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI
-from .routers import analyze
+import os
+import sys
+import time
+import logging
+from contextlib import asynccontextmanager
 
+from .services.warmup import WARMUP  # 最先导入：它的导入时刻作为启动计时起点
 
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from .routers import analyze, headlines, prices, reports
+from .services.cache import REPORT_CACHE
+from .services.poller import RSS_POLLER
+from .services.thesis_cache import THESIS_CACHE
+from .services.workers import WORKER_LEADER, worker_count
+from .services.metrics import METRICS, maybe_profile, request_spans, server_timing
 
-app = FastAPI(title="Stock Price Prediction API", version="1.0.0", description="API for predicting stock prices")
+logger = logging.getLogger("app.timing")
+
+
+# ---------- 后台预热的子系统（按顺序）：这里只写模块名，import app.main 时不加载 ----------
+def _svc(name: str):
+    return sys.modules.get(f"{__package__}.services.{name}")
+
+
+def _start_vector_index():
+    # 全局向量索引常驻内存，后台定期落盘；退出时再整体 flush 一次
+    _svc("rag").VECTOR_INDEX.start(flush_interval=float(os.getenv("VECTOR_INDEX_FLUSH_INTERVAL_SEC", "30")))
+
+
+WARMUP.register("market", [f"{__package__}.services.market"])
+WARMUP.register(
+    "rag", [f"{__package__}.services.rag"],
+    init=lambda: len(_svc("rag").VECTOR_INDEX),  # 把落盘的索引读进内存
+    start=_start_vector_index,
+    stop=lambda: _svc("rag").VECTOR_INDEX.stop(),
+)
+WARMUP.register(
+    "llm", [f"{__package__}.services.llm"],
+    init=lambda: _svc("llm").LLM_RUNTIME.chain(),  # 导入 langchain_openai / openai 并建好默认模型的 chain
+    stop=lambda: _svc("llm").LLM_RUNTIME.aclose(),
+)
+WARMUP.register(
+    "archive", [f"{__package__}.services.report_archive"],  # 导入 pyarrow
+    start=lambda: _svc("report_archive").REPORT_ARCHIVE.start(
+        flush_interval=float(os.getenv("REPORT_ARCHIVE_FLUSH_SEC", "10"))
+    ),
+    stop=lambda: _svc("report_archive").REPORT_ARCHIVE.stop(),
+)
+# watchlist 预计算（WATCHLIST 为空时不启动）依赖整条流水线，放在最后
+WARMUP.register(
+    "pipeline", [f"{__package__}.services.pipeline", f"{__package__}.services.scheduler"],
+    start=lambda: _svc("scheduler").WATCHLIST_SCHEDULER.start(),
+    stop=lambda: _svc("scheduler").WATCHLIST_SCHEDULER.stop(),
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 后台 RSS 轮询（RSS_POLLER_ENABLED=0 关闭，回退到按请求抓取）
+    if os.getenv("RSS_POLLER_ENABLED", "1") != "0":
+        RSS_POLLER.start()
+    # 重依赖在后台导入 / 初始化；/health 立即可用，/ready 在全部就绪后返回 200
+    WARMUP.start()
+    WARMUP.mark("lifespan_started")
+    yield
+    await WARMUP.stop()
+    await RSS_POLLER.stop()
+
+
+app = FastAPI(title="Stock Price Prediction API", version="1.0.0", description="API for predicting stock prices", lifespan=lifespan)
 # register routers
 app.include_router(analyze.router)
+app.include_router(headlines.router)
+app.include_router(reports.router)
+app.include_router(prices.router)
+
+
+@app.middleware("http")
+async def timing(request: Request, call_next):
+    """每个请求：收集各阶段 span -> Server-Timing 响应头 + 请求级直方图；可选慢请求采样。"""
+    t0 = time.perf_counter()
+    with request_spans() as spans, maybe_profile(request.url.path) as finish:
+        response = await call_next(request)
+        total_ms = (time.perf_counter() - t0) * 1000
+        finish(total_ms)
+    # 用路由模板做标签（/analyze/{ticker}），避免每个 ticker 一条时间序列
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    labels = {"route": route, "method": request.method}
+    METRICS.observe("http_request_duration_seconds", total_ms / 1000, help="Request latency until response headers", **labels)
+    METRICS.inc("http_requests_total", help="Requests by status", status=str(response.status_code), **labels)
+    response.headers["Server-Timing"] = server_timing(spans, total_ms)
+    if spans:
+        logger.debug("%s %s %d %s", request.method, request.url.path, response.status_code, response.headers["Server-Timing"])
+    return response
+
+
+def _cache_gauges():
+    st = REPORT_CACHE.stats()
+    out = {(("stage", s), ("result", r)): v[r] for s, v in st["stages"].items() for r in ("hits", "misses")}
+    th = THESIS_CACHE.stats()
+    out.update({(("stage", "thesis_fingerprint"), ("result", r)): th[r] for r in ("exact_hits", "near_hits", "misses")})
+    return out
+
+
+METRICS.register_gauge("cache_lookups", "Cache lookups by stage and result (cumulative)", _cache_gauges)
+METRICS.register_gauge("llm_runtime", "LLM runtime in-flight / queued / completed / failed / rejected",
+                       lambda: {(("state", k),): v for k, v in _svc("llm").LLM_RUNTIME.stats.items()} if _svc("llm") else {})
+METRICS.register_gauge("watchlist_precompute", "Watchlist precompute cycles / refreshed / failed tickers (cumulative)",
+                       lambda: {(("kind", k),): _svc("scheduler").WATCHLIST_SCHEDULER.stats[k]
+                                for k in ("cycles", "refreshed", "failed")} if _svc("scheduler") else {})
+METRICS.register_gauge("warmup_subsystem_ready", "1 when a lazily loaded subsystem is warm",
+                       lambda: {(("subsystem", n),): float(s["status"] == "ready") for n, s in WARMUP.report()["subsystems"].items()})
 
 @app.get("/health")
 def health():
-    return {"ok": True}
\ No newline at end of file
+    # 存活检查：不依赖任何重模块
+    return {"ok": True}
+
+@app.get("/ready")
+def ready():
+    # 就绪检查：各子系统预热状态 + 启动耗时拆分；未全部就绪时 503
+    report = WARMUP.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@app.get("/health/cache")
+def health_cache():
+    # thesis_fingerprint：按输入指纹复用 LLM 结果的命中率，用来调量化步长 / 容差
+    return {**REPORT_CACHE.stats(), "thesis_fingerprint": THESIS_CACHE.stats()}
+
+@app.get("/health/worker")
+def health_worker():
+    # 多 worker 部署：当前进程是否是 leader（负责向量索引落盘与 watchlist 预计算）
+    return {"pid": os.getpid(), "workers": worker_count(), "leader": WORKER_LEADER.held or worker_count() == 1}
+
+@app.get("/health/llm")
+def health_llm():
+    from .services.llm import LLM_RUNTIME
+    return {"max_concurrency": LLM_RUNTIME.max_concurrency, "max_queue": LLM_RUNTIME.max_queue, **LLM_RUNTIME.stats}
+
+@app.get("/health/scheduler")
+def health_scheduler():
+    from .services.scheduler import WATCHLIST_SCHEDULER
+    return {
+        "enabled": WATCHLIST_SCHEDULER.enabled,
+        "tickers": WATCHLIST_SCHEDULER.tickers,
+        "interval_sec": WATCHLIST_SCHEDULER.interval_sec,
+        **WATCHLIST_SCHEDULER.stats,
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus 文本格式
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+WARMUP.mark("app_import")
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Query
+
+from ..services.poller import HEADLINE_STORE, RSS_POLLER
+
+
+router = APIRouter(prefix="/headlines", tags=["headlines"])
+
+@router.get("")
+def list_headlines(since: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    # since=0 取全部；之后把返回的 cursor 传回来即可只拿新增条目
+    items, cursor = HEADLINE_STORE.since(since, limit=limit)
+    return {"cursor": cursor, "count": len(items), "items": items}
+
+@router.get("/stats")
+def headline_stats():
+    return {"size": len(HEADLINE_STORE), "cursor": HEADLINE_STORE.cursor, **RSS_POLLER.stats}
@@ -0,0 +1,74 @@
+import asyncio
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from ..services.warmup import WARMUP
+from .analyze import _validate_ticker
+
+
+router = APIRouter(prefix="/prices", tags=["prices"])
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+
+@router.get("/{ticker}")
+async def get_prices(
+    ticker: str,
+    request: Request,
+    period: str = Query("6mo", max_length=8),
+    fields: Optional[str] = Query(None, description="comma separated subset of Open,High,Low,Close,Volume"),
+    format: str = Query("arrow", pattern="^(arrow|json)$"),
+):
+    """
+    日线历史，直接读后端的本地 price store（与 /analyze 共用，不额外下载）。
+    默认返回 Arrow IPC stream（date 为 UTC 毫秒时间戳列 + 各价格列 float64）；format=json 时返回列式 JSON。
+    ETag 由最后一根 K 线和行数决定，If-None-Match 命中时 304。
+    """
+    ticker = _validate_ticker(ticker)
+    cols = [f.strip().capitalize() for f in fields.split(",")] if fields else list(_FIELDS)
+    if not cols or any(c not in _FIELDS for c in cols):
+        raise HTTPException(status_code=400, detail=f"fields must be a subset of {','.join(_FIELDS)}.")
+
+    await WARMUP.wait("market")
+    import pandas as pd
+    from ..services.market import PRICE_STORE
+    from ..services.price_store import period_start
+
+    try:
+        period_start(period, pd.Timestamp.now())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        df = await asyncio.to_thread(PRICE_STORE.get, ticker, period)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    last = int(df.index[-1].value) if len(df) else 0
+    etag = '"' + hashlib.blake2b(f"{ticker}|{period}|{','.join(cols)}|{format}|{len(df)}|{last}".encode(), digest_size=8).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": f"max-age={int(PRICE_STORE.refresh_sec)}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    ts_ms = (df.index.asi8 // 1_000_000).tolist() if len(df) else []
+    if format == "json":
+        return Response(
+            content=_json_body(ts_ms, df, cols), media_type="application/json", headers=headers
+        )
+
+    import pyarrow as pa
+
+    table = pa.table(
+        {"date": pa.array(ts_ms, type=pa.timestamp("ms", tz="UTC")), **{c: pa.array(df[c].to_numpy(dtype=float)) for c in cols}}
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(content=sink.getvalue().to_pybytes(), media_type=ARROW_STREAM, headers=headers)
+
+def _json_body(ts_ms, df, cols) -> bytes:
+    # 列式 JSON；NaN 写成 null
+    data = {c: [None if v != v else v for v in df[c].tolist()] for c in cols}
+    return json.dumps({"date": ts_ms, **data}).encode()
@@ -0,0 +1,39 @@
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from ..services.warmup import WARMUP
+
+
+router = APIRouter(prefix="/reports", tags=["reports"])
+
+@router.get("")
+async def list_reports(
+    ticker: Optional[str] = Query(None, max_length=10),
+    from_: Optional[date] = Query(None, alias="from"),
+    to: Optional[date] = Query(None),
+    limit: int = Query(100, ge=1, le=5000),
+    full: bool = Query(False, description="include the full LLMReport of each row"),
+):
+    # 只读归档（分区裁剪 + 列裁剪），不触发任何行情下载 / LLM 调用；按生成时间倒序
+    if from_ and to and from_ > to:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'.")
+    await WARMUP.wait("archive")
+    from ..services.report_archive import REPORT_ARCHIVE, SUMMARY_COLUMNS, report_from_row
+
+    if not REPORT_ARCHIVE.enabled:
+        raise HTTPException(status_code=503, detail="Report archive is disabled.")
+    columns = SUMMARY_COLUMNS + (["report_json"] if full else [])
+    rows = REPORT_ARCHIVE.query(ticker=ticker, start=from_, end=to, columns=columns, limit=limit)
+    if full:
+        for r in rows:
+            r["report"] = report_from_row(r)
+            del r["report_json"]
+    return {"count": len(rows), "items": rows}
+
+@router.get("/stats")
+async def report_stats():
+    await WARMUP.wait("archive")
+    from ..services.report_archive import REPORT_ARCHIVE
+    return {"enabled": REPORT_ARCHIVE.enabled, "root": str(REPORT_ARCHIVE.root), **REPORT_ARCHIVE.stats}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel,Field 
-from typing import List, Optional
+from typing import Any, List, Optional
 
 class IndicatorSnapshot(BaseModel):
     price: float
@@ -46,4 +46,25 @@ class LLMReport(BaseModel):
     indicators: IndicatorSnapshot
     top_news: List[NewsItem]
     thesis: Thesis
-    
\ No newline at end of file
+
+class BatchAnalyzeRequest(BaseModel):
+    tickers: List[str] = Field(min_length=1, max_length=500)
+
+class BatchResult(BaseModel):
+    # NDJSON 每行一个：成功时带 report，失败时带 status/error
+    ticker: str
+    ok: bool
+    report: Optional[LLMReport] = None
+    status: Optional[int] = None
+    error: Optional[str] = None
+
+class AnalysisEvent(BaseModel):
+    # /analyze/{ticker}/stream 的 NDJSON 每行一个；各阶段完成即推送
+    # event: indicators | news | evidences | thesis_partial | report | error
+    event: str
+    ticker: str
+    elapsed_ms: float
+    data: Optional[Any] = None
+    status: Optional[int] = None
+    error: Optional[str] = None
+    retry_after: Optional[int] = None   # 503 时建议的重试间隔（秒），对应 Retry-After
@@ -0,0 +1,290 @@
+# app/services/backtest.py
+"""
+历史回测：在过去一段日期上按 (ticker, 交易日) 重放分析流水线，用来评估 thesis 质量和成本。
+
+- 行情：所有 ticker 的完整历史一次批量取回（一次 provider 调用），
+  compute_indicators_history 一次算出每个交易日的指标（滑动窗口视图，向量化）
+- 新闻：历史 headlines 从本地 RSS / Atom / JSONL 归档读入；每个日期只用 as_of 之前发布的条目，
+  RAG 检索同样只看 as_of 之前 RAG_MAX_AGE_DAYS 天内的 chunk（search_evidences(as_of=...)）
+  as_of = 交易日次日 00:00 UTC，即当天收盘数据和当天发布的新闻都算“已知”
+- 执行：按 ticker 把日期分块交给进程池（spawn），结果逐条追加写入 JSONL；
+  对同一个输出文件重跑时跳过已完成的 (ticker, 日期)，中断后直接续跑
+- LLM：--llm live 走 LLM_RUNTIME（OPENAI_BASE_URL 可以指向 bench 的 stub），
+  --llm off 只统计 prompt token，不调用模型
+
+    python -m app.services.backtest --tickers AAPL,MSFT --start 2025-06-02 --end 2025-06-30 \\
+        --headlines data/bench/fixtures/rss --out data/backtest/june.jsonl
+"""
+
+import argparse
+import bisect
+import collections
+import concurrent.futures as cf
+import json
+import logging
+import multiprocessing as mp
+import os
+import pathlib
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger("services.backtest")
+
+_FEED_SUFFIXES = {".xml", ".rss", ".atom"}
+
+
+# ---------- 历史 headlines ----------
+def load_headline_archive(paths: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    读取本地归档：RSS / Atom 文件、JSONL（每行一个 {title, url, published, source, summary}）或包含它们的目录。
+    没有发布时间的条目无法放到时间轴上，直接丢弃。返回按时间倒序、按 URL 去重后的列表。
+    """
+    from .news import _dedupe_and_sort, _to_iso, _to_ts, parse_feed, select_headlines
+
+    files: List[pathlib.Path] = []
+    for p in map(pathlib.Path, paths):
+        files.extend(sorted(f for f in p.rglob("*") if f.is_file()) if p.is_dir() else [p])
+
+    items: List[Dict[str, Any]] = []
+    for f in files:
+        if f.suffix == ".jsonl":
+            with open(f, encoding="utf-8") as fh:
+                for line in fh:
+                    if not line.strip():
+                        continue
+                    it = json.loads(line)
+                    ts = it.get("published_ts") or _to_ts(it.get("published"))
+                    items.append({**it, "published_ts": ts, "published": it.get("published") or _to_iso(ts)})
+        elif f.suffix in _FEED_SUFFIXES:
+            raw = parse_feed(f.read_bytes())
+            items.extend(select_headlines(raw, len(raw)))
+    items = [it for it in items if it.get("published_ts")]
+    return _dedupe_and_sort(items, len(items))
+
+
+# ---------- 断点续跑 ----------
+def _done_keys(out: pathlib.Path) -> Set[Tuple[str, str]]:
+    done: Set[Tuple[str, str]] = set()
+    if not out.exists():
+        return done
+    with open(out, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue  # 上次中断时写了一半的行
+            if r.get("error") is None:
+                done.add((r["ticker"], r["date"]))
+    return done
+
+
+# ---------- 进程池 worker ----------
+_POOL: List[Dict[str, Any]] = []
+_POOL_TS: List[float] = []   # _POOL 的发布时间取负（升序），用于二分
+_LLM_MODE = "off"
+
+
+def _init_worker(pool: List[Dict[str, Any]], llm_mode: str) -> None:
+    global _POOL, _POOL_TS, _LLM_MODE
+    logging.basicConfig(level=logging.WARNING)
+    _POOL = pool
+    _POOL_TS = [-float(it["published_ts"]) for it in pool]
+    _LLM_MODE = llm_mode
+
+
+def _pool_as_of(as_of_ts: float, size: int) -> List[Dict[str, Any]]:
+    # 与线上相同：取 as_of 之前最新的 size 条作为候选池
+    i = bisect.bisect_right(_POOL_TS, -as_of_ts)
+    return _POOL[i:i + size]
+
+
+def _run_chunk(ticker: str, rows: List[Tuple[str, Dict[str, float]]]) -> List[Dict[str, Any]]:
+    from .llm import LLM_RUNTIME, _chain_inputs, _prompt_tokens, analyze_with_llm
+    from .pipeline import _pool_size
+    from .prompt_builder import pack_context
+    from .rag import risk_query, search_evidences
+    from .relevance import select_relevant
+
+    out = []
+    for date, indicators in rows:
+        as_of = datetime.fromisoformat(date).replace(tzinfo=timezone.utc) + timedelta(days=1)
+        rec: Dict[str, Any] = {"ticker": ticker, "date": date, "as_of": as_of.isoformat(), "indicators": indicators}
+        t0 = time.perf_counter()
+        try:
+            headlines = select_relevant(ticker, _pool_as_of(as_of.timestamp(), _pool_size()))
+            evidences = search_evidences(ticker, risk_query(ticker), k=5, as_of=as_of)
+            ctx = pack_context(headlines, evidences)
+            rec["headlines"] = [h.get("url") for h in headlines]
+            rec["evidences"] = [{"url": e["url"], "score": round(e["score"], 4)} for e in evidences]
+            rec["prompt_tokens"] = _prompt_tokens(_chain_inputs(ticker, indicators, ctx))
+            rec["llm_calls"] = 0
+            rec["thesis"] = None
+            if _LLM_MODE == "live":
+                before = LLM_RUNTIME.stats["completed"]
+                rec["thesis"] = analyze_with_llm(ticker, indicators, headlines, evidences)["thesis"]
+                rec["llm_calls"] = LLM_RUNTIME.stats["completed"] - before  # 指纹缓存命中时为 0
+            rec["error"] = None
+        except Exception as e:
+            rec["error"] = repr(e)
+        rec["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        out.append(rec)
+    return out
+
+
+# ---------- 主进程 ----------
+def _naive_dates(idx: pd.Index) -> pd.DatetimeIndex:
+    idx = pd.DatetimeIndex(idx)
+    return idx.tz_convert("UTC").tz_localize(None) if idx.tz is not None else idx
+
+
+def load_indicator_history(tickers: List[str], start: pd.Timestamp, end: pd.Timestamp) -> Dict[str, pd.DataFrame]:
+    """一次取回 [start - 预热窗口, end] 的行情，返回每个 ticker 在 [start, end] 内逐日的指标。"""
+    from .indicators import required_rows
+    from .market import compute_indicators_history
+    from .providers import get_provider
+
+    # 交易日约为自然日的 5/7，再留一点余量给节假日
+    warmup = pd.Timedelta(days=int(required_rows() * 1.6) + 10)
+    frames = get_provider().history(tickers, start=start - warmup, period=None)
+    frames = {t: df[_naive_dates(df.index) <= end] for t, df in frames.items()}
+    out = {}
+    for t, df in compute_indicators_history(frames).items():
+        dates = _naive_dates(df.index)
+        out[t] = df[(dates >= start) & (dates <= end)].set_axis(dates[(dates >= start) & (dates <= end)])
+    return out
+
+
+def _index_archive(tickers: List[str], pool: List[Dict[str, Any]]) -> None:
+    # 每个 ticker 把归档里提到它的条目全部入库；检索时再按 as_of 过滤，不会看到“未来”的 chunk
+    from .rag import VECTOR_INDEX, index_headlines
+    from .relevance import split_relevant
+
+    for t in tickers:
+        index_headlines(t, split_relevant(t, pool, limit=len(pool), fallback=0)[0])
+    VECTOR_INDEX.flush()
+
+
+def _summarize(out: pathlib.Path, elapsed: float, ran: int, resumed: int) -> Dict[str, Any]:
+    # 同一个 (ticker, 日期) 失败后重跑会再写一行，以最后一行为准
+    latest: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    with open(out, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue
+            latest[(r["ticker"], r["date"])] = r
+    ok = failed = tokens = calls = 0
+    views: "collections.Counter[str]" = collections.Counter()
+    for r in latest.values():
+        if r.get("error") is not None:
+            failed += 1
+            continue
+        ok += 1
+        tokens += r.get("prompt_tokens") or 0
+        calls += r.get("llm_calls") or 0
+        if r.get("thesis"):
+            views[r["thesis"].get("viewpoint", "?")] += 1
+    return {
+        "output": str(out),
+        "ran": ran,
+        "resumed": resumed,
+        "ok": ok,
+        "failed": failed,
+        "prompt_tokens": tokens,
+        "prompt_tokens_mean": round(tokens / ok, 1) if ok else 0.0,
+        "llm_calls": calls,
+        "viewpoints": dict(views),
+        "elapsed_sec": round(elapsed, 2),
+    }
+
+
+def run_backtest(
+    tickers: List[str],
+    start: str,
+    end: str,
+    headlines: List[str],
+    out: pathlib.Path,
+    workers: int = 4,
+    chunk: int = 20,
+    llm_mode: str = "off",
+) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    tickers = [t.upper() for t in dict.fromkeys(tickers)]
+    out.parent.mkdir(parents=True, exist_ok=True)
+    done = _done_keys(out)
+
+    history = load_indicator_history(tickers, pd.Timestamp(start), pd.Timestamp(end))
+    tasks: List[Tuple[str, List[Tuple[str, Dict[str, float]]]]] = []
+    resumed = 0
+    for t, df in history.items():
+        rows = []
+        for ts, row in zip(df.index, df.to_dict("records")):
+            date = ts.date().isoformat()
+            if (t, date) in done:
+                resumed += 1
+            else:
+                rows.append((date, row))
+        tasks.extend((t, rows[i:i + chunk]) for i in range(0, len(rows), chunk))
+    missing = [t for t in tickers if t not in history]
+    if missing:
+        logger.warning("No price history for %s", missing)
+
+    pool = load_headline_archive(headlines)
+    _index_archive(tickers, pool)
+    total = sum(len(rows) for _, rows in tasks)
+    logger.info("Backtest: %d (ticker, date) pairs to run, %d already done, %d archived headlines", total, resumed, len(pool))
+
+    ran = 0
+    # spawn：主进程里已有 SQLite 连接和线程，fork 出来的子进程不安全
+    ctx = mp.get_context("spawn")
+    with open(out, "a", encoding="utf-8") as fh, cf.ProcessPoolExecutor(
+        max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(pool, llm_mode)
+    ) as ex:
+        if fh.tell() and not out.read_bytes().endswith(b"\n"):
+            fh.write("\n")  # 上次中断留下的半行单独成行，_done_keys 会跳过它
+        futures = [ex.submit(_run_chunk, t, rows) for t, rows in tasks]
+        for fut in cf.as_completed(futures):
+            recs = fut.result()
+            for rec in recs:
+                fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())  # 每块落盘一次：中断后最多重跑一块
+            ran += len(recs)
+            logger.info("Backtest progress %d/%d", ran, total)
+
+    summary = _summarize(out, time.perf_counter() - t0, ran, resumed)
+    out.with_suffix(".summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Replay the analysis pipeline over historical dates")
+    ap.add_argument("--tickers", required=True, help="comma separated")
+    ap.add_argument("--start", required=True, help="YYYY-MM-DD (inclusive)")
+    ap.add_argument("--end", required=True, help="YYYY-MM-DD (inclusive)")
+    ap.add_argument("--headlines", action="append", default=[], help="RSS/Atom/JSONL file or directory (repeatable)")
+    ap.add_argument("--out", default=None, help="JSONL output; re-running with the same path resumes")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    ap.add_argument("--chunk", type=int, default=20, help="dates per task")
+    ap.add_argument("--llm", choices=["off", "live"], default="off")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    out = pathlib.Path(args.out or f"data/backtest/{args.start}_{args.end}.jsonl")
+    # 回测用单独的向量索引，不往线上索引里写历史 chunk（embedding 缓存仍然共用）
+    os.environ.setdefault("VECTOR_INDEX_PATH", str(out.with_suffix(".vindex.npz")))
+    summary = run_backtest(
+        [t.strip() for t in args.tickers.split(",") if t.strip()],
+        args.start, args.end, args.headlines, out,
+        workers=max(1, args.workers), chunk=max(1, args.chunk), llm_mode=args.llm,
+    )
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,306 @@
+# app/services/cache.py
+"""
+进程内报告缓存：
+- 有界 LRU（超过容量淘汰最久未访问的条目）
+- 分阶段 TTL：prices / headlines / evidences / thesis
+- single-flight：同一个 key 并发请求只跑一次计算，其余请求等待结果
+- 命中 / 未命中 / 淘汰 计数，供 /health/cache 暴露
+- 可选的跨进程共享层（cache_backend.py，CACHE_BACKEND=sqlite）：本地未命中时再查共享层，
+  写入时两边都写；single-flight 通过共享层的租约扩展到多个 worker（只有一个 worker 调用 LLM）
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from .cache_backend import CacheBackend, backend_from_env
+
+logger = logging.getLogger("services.cache")
+
+_DEFAULT_TTLS: Dict[str, int] = {
+    "prices": 5 * 60,
+    "headlines": 3 * 60,
+    "evidences": 10 * 60,
+    "thesis": 10 * 60,
+}
+
+_MISSING = object()
+
+
+def _ttl_from_env(stage: str, default: int) -> int:
+    # 例如 CACHE_TTL_PRICES=120
+    try:
+        return int(os.getenv(f"CACHE_TTL_{stage.upper()}", default))
+    except ValueError:
+        return default
+
+
+class _LeaderCancelled(Exception):
+    """single-flight 的 leader 被取消（客户端断开 / 自身超时）：跟随者重新竞争，而不是一起被取消。"""
+
+
+class ReportCache:
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttls: Optional[Dict[str, int]] = None,
+        backend: Optional[CacheBackend] = None,
+        shared_stages: Iterable[str] = ("headlines", "evidences", "thesis"),
+        lease_sec: float = 90.0,
+    ):
+        self.max_entries = max_entries
+        self.ttls = dict(ttls or {s: _ttl_from_env(s, t) for s, t in _DEFAULT_TTLS.items()})
+        # prices 默认不共享：行情本来就在磁盘上的 price store 里，各 worker 直接读文件
+        self.backend = backend
+        self.shared_stages = frozenset(shared_stages) if backend is not None else frozenset()
+        self.lease_sec = lease_sec
+        # { (stage, key): (expire_ts, value) }，按访问顺序排列
+        self._data: "OrderedDict[Tuple[str, Hashable], Tuple[float, Any]]" = OrderedDict()
+        self._aflights: Dict[Tuple[str, Hashable], "asyncio.Future[Any]"] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    # ---------- 计数 ----------
+    def _bump(self, stage: str, field: str, n: int = 1) -> None:
+        st = self._stats.setdefault(
+            stage, {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "coalesced": 0, "shared_hits": 0}
+        )
+        st[field] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {s: dict(v) for s, v in self._stats.items()}
+            size = len(self._data)
+            inflight = len(self._aflights)
+        totals: Dict[str, int] = {}
+        for v in stages.values():
+            for f, n in v.items():
+                totals[f] = totals.get(f, 0) + n
+        lookups = totals.get("hits", 0) + totals.get("misses", 0)
+        # shared_hits 是本地未命中、但在共享层命中的那部分
+        served = totals.get("hits", 0) + totals.get("shared_hits", 0)
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "inflight": inflight,
+            "ttls": dict(self.ttls),
+            "backend": type(self.backend).__name__ if self.backend is not None else "memory",
+            "shared_stages": sorted(self.shared_stages),
+            "hit_rate": (served / lookups) if lookups else 0.0,
+            "totals": totals,
+            "stages": stages,
+        }
+
+    # ---------- 基本读写 ----------
+    def _get_locked(self, stage: str, key: Hashable) -> Any:
+        k = (stage, key)
+        item = self._data.get(k)
+        if item is None:
+            self._bump(stage, "misses")
+            return _MISSING
+        expire_ts, value = item
+        if time.time() > expire_ts:
+            self._data.pop(k, None)
+            self._bump(stage, "expired")
+            self._bump(stage, "misses")
+            return _MISSING
+        self._data.move_to_end(k)
+        self._bump(stage, "hits")
+        return value
+
+    def _put_locked(self, stage: str, key: Hashable, expire_ts: float, value: Any) -> None:
+        k = (stage, key)
+        self._data[k] = (expire_ts, value)
+        self._data.move_to_end(k)
+        while len(self._data) > self.max_entries:
+            (old_stage, _), _ = self._data.popitem(last=False)
+            self._bump(old_stage, "evictions")
+
+    def get(self, stage: str, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._get_locked(stage, key)
+        if value is _MISSING:
+            value = self._shared_get(stage, key)
+        return default if value is _MISSING else value
+
+    async def aget(self, stage: str, key: Hashable, default: Any = None) -> Any:
+        """get 的协程版本：本地未命中时在线程里查共享层。"""
+        with self._lock:
+            value = self._get_locked(stage, key)
+        if value is _MISSING and stage in self.shared_stages:
+            value = await asyncio.to_thread(self._shared_get, stage, key)
+        return default if value is _MISSING else value
+
+    def peek(self, stage: str, key: Hashable, default: Any = None) -> Any:
+        """只看不算：不计命中 / 未命中，也不调整 LRU 顺序（后台任务用）。"""
+        with self._lock:
+            item = self._data.get((stage, key))
+        if (item is None or time.time() > item[0]) and stage in self.shared_stages:
+            try:
+                item = self.backend.get(stage, key)
+            except Exception as e:
+                logger.warning("Shared cache peek failed for %s/%r: %r", stage, key, e)
+                item = None
+        if item is None or time.time() > item[0]:
+            return default
+        return item[1]
+
+    def set(self, stage: str, key: Hashable, value: Any, ttl: Optional[int] = None) -> None:
+        ttl = self.ttls.get(stage, _DEFAULT_TTLS["thesis"]) if ttl is None else ttl
+        expire_ts = time.time() + ttl
+        with self._lock:
+            self._put_locked(stage, key, expire_ts, value)
+        self._shared_set(stage, key, value, expire_ts)
+
+    async def aset(self, stage: str, key: Hashable, value: Any, ttl: Optional[int] = None) -> None:
+        """set 的协程版本：共享层写入放到线程里，不阻塞事件循环。"""
+        ttl = self.ttls.get(stage, _DEFAULT_TTLS["thesis"]) if ttl is None else ttl
+        expire_ts = time.time() + ttl
+        with self._lock:
+            self._put_locked(stage, key, expire_ts, value)
+        if stage in self.shared_stages:
+            await asyncio.to_thread(self._shared_set, stage, key, value, expire_ts)
+
+    def invalidate(self, stage: str, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop((stage, key), None)
+        if stage in self.shared_stages:
+            try:
+                self.backend.delete(stage, key)
+            except Exception as e:
+                logger.warning("Shared cache delete failed for %s/%r: %r", stage, key, e)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._stats.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    # ---------- 共享层 ----------
+    def _shared_get(self, stage: str, key: Hashable) -> Any:
+        """本地未命中后查共享层；命中时按原过期时间放进本地 LRU。共享层出错时当作未命中。"""
+        if stage not in self.shared_stages:
+            return _MISSING
+        try:
+            item = self.backend.get(stage, key)
+        except Exception as e:
+            logger.warning("Shared cache read failed for %s/%r: %r", stage, key, e)
+            return _MISSING
+        if item is None:
+            return _MISSING
+        with self._lock:
+            self._put_locked(stage, key, item[0], item[1])
+            self._bump(stage, "shared_hits")
+        return item[1]
+
+    def _shared_set(self, stage: str, key: Hashable, value: Any, expire_ts: float) -> None:
+        if stage not in self.shared_stages:
+            return
+        try:
+            self.backend.set(stage, key, value, expire_ts)
+        except Exception as e:
+            logger.warning("Shared cache write failed for %s/%r: %r", stage, key, e)
+
+    def _try_lease(self, stage: str, key: Hashable) -> bool:
+        try:
+            return self.backend.try_lease(stage, key, self.lease_sec)
+        except Exception as e:
+            logger.warning("Shared cache lease failed for %s/%r: %r", stage, key, e)
+            return True  # 共享层不可用时退化为进程内 single-flight
+
+    def _release_lease(self, stage: str, key: Hashable) -> None:
+        try:
+            self.backend.release_lease(stage, key)
+        except Exception as e:
+            logger.warning("Shared cache lease release failed for %s/%r: %r", stage, key, e)
+
+    async def _await_shared(self, stage: str, key: Hashable) -> Any:
+        """
+        跨进程 single-flight：共享层已有结果就直接用；否则抢租约，抢到的进程去计算（返回 _MISSING），
+        没抢到的轮询共享层，直到结果出现或租约过期后自己接手。
+        共享层是同步 sqlite（可能等锁），每次访问都放到线程里做，不占事件循环。
+        """
+        delay = 0.05
+        while True:
+            value = await asyncio.to_thread(self._shared_get, stage, key)
+            if value is not _MISSING or await asyncio.to_thread(self._try_lease, stage, key):
+                return value
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    # ---------- single-flight ----------
+    async def aget_or_compute(
+        self, stage: str, key: Hashable, fn: Callable[[], Awaitable[Any]], ttl: Optional[int] = None
+    ) -> Any:
+        """
+        命中直接返回；未命中时同一 (stage, key) 只有一个调用方（leader）await fn()，
+        其余并发调用方 await 同一个 Future 共享结果（异常也一起共享，但不缓存）。
+        """
+        k = (stage, key)
+        with self._lock:
+            value = self._get_locked(stage, key)
+            if value is not _MISSING:
+                return value
+            fut = self._aflights.get(k)
+            leader = fut is None
+            if leader:
+                fut = self._aflights[k] = asyncio.get_running_loop().create_future()
+            else:
+                self._bump(stage, "coalesced")
+
+        if not leader:
+            # shield：某个跟随者被取消时不影响 leader 与其他跟随者
+            try:
+                return await asyncio.shield(fut)
+            except _LeaderCancelled:
+                # leader 的取消与本请求无关：flight 已经摘掉，重新来一次（其中一个跟随者成为新 leader）
+                return await self.aget_or_compute(stage, key, fn, ttl=ttl)
+
+        shared = stage in self.shared_stages
+        try:
+            value = await self._await_shared(stage, key) if shared else _MISSING
+            if value is _MISSING:
+                value = await fn()
+                await self.aset(stage, key, value, ttl=ttl)
+            fut.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # 不能 fut.cancel()：那会把 CancelledError 传给所有跟随者
+            fut.set_exception(_LeaderCancelled())
+            fut.exception()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # 标记已读取，避免没有跟随者时出现 "never retrieved" 警告
+            raise
+        finally:
+            with self._lock:
+                self._aflights.pop(k, None)
+            if shared:
+                # 可能正处在取消流程中：释放租约不等结果，失败了租约也会自然过期
+                asyncio.get_running_loop().run_in_executor(None, self._release_lease, stage, key)
+
+
+def _max_entries_from_env() -> int:
+    try:
+        return int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+    except ValueError:
+        return 512
+
+
+def _shared_stages_from_env() -> Tuple[str, ...]:
+    return tuple(s.strip() for s in os.getenv("CACHE_SHARED_STAGES", "headlines,evidences,thesis").split(",") if s.strip())
+
+
+# 进程级单例
+REPORT_CACHE = ReportCache(
+    max_entries=_max_entries_from_env(),
+    backend=backend_from_env(),
+    shared_stages=_shared_stages_from_env(),
+    lease_sec=float(os.getenv("CACHE_LEASE_SEC", "90")),
+)
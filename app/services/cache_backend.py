@@ -0,0 +1,124 @@
+# app/services/cache_backend.py
+"""
+ReportCache 的跨进程共享层（可插拔）：
+- CacheBackend：get / set / delete / clear + 租约（lease），租约用来在多个 worker 之间做 single-flight：
+  拿到租约的 worker 负责计算，其余 worker 轮询共享层等结果（或等租约过期后自己接手）
+- SQLiteCacheBackend：本机所有 worker 共用一个 SQLite 文件（WAL），值用 pickle 序列化
+- CACHE_BACKEND=memory（默认，仅进程内）| sqlite；CACHE_SQLITE_PATH 指定文件位置
+"""
+
+import logging
+import os
+import pathlib
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Hashable, Optional, Tuple
+
+logger = logging.getLogger("services.cache_backend")
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    def get(self, stage: str, key: Hashable) -> Optional[Tuple[float, Any]]:
+        """返回 (expire_ts, value)；不存在或已过期时 None。"""
+
+    @abstractmethod
+    def set(self, stage: str, key: Hashable, value: Any, expire_ts: float) -> None: ...
+
+    @abstractmethod
+    def delete(self, stage: str, key: Hashable) -> None: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    @abstractmethod
+    def try_lease(self, stage: str, key: Hashable, ttl: float) -> bool:
+        """没有其它进程持有未过期的租约时占住它并返回 True。"""
+
+    @abstractmethod
+    def release_lease(self, stage: str, key: Hashable) -> None: ...
+
+
+def _k(stage: str, key: Hashable) -> str:
+    # key 只会是 str / 数字 / 由它们组成的 tuple，repr 在各进程间是稳定的
+    return f"{stage}\0{key!r}"
+
+
+class SQLiteCacheBackend(CacheBackend):
+    def __init__(self, path: pathlib.Path, sweep_every: int = 200):
+        self.path = pathlib.Path(path)
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.sweep_every = sweep_every
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (k TEXT PRIMARY KEY, expire REAL, value BLOB)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (k TEXT PRIMARY KEY, owner TEXT, expire REAL)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, stage: str, key: Hashable) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            row = self._db().execute("SELECT expire, value FROM cache WHERE k = ?", (_k(stage, key),)).fetchone()
+        if row is None or row[0] < time.time():
+            return None
+        try:
+            return row[0], pickle.loads(row[1])
+        except Exception:
+            logger.warning("Dropping undecodable shared cache entry %s/%r", stage, key)
+            self.delete(stage, key)
+            return None
+
+    def set(self, stage: str, key: Hashable, value: Any, expire_ts: float) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO cache (k, expire, value) VALUES (?, ?, ?)", (_k(stage, key), expire_ts, blob))
+            self._writes += 1
+            if self._writes % self.sweep_every == 0:
+                db.execute("DELETE FROM cache WHERE expire < ?", (time.time(),))
+
+    def delete(self, stage: str, key: Hashable) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM cache WHERE k = ?", (_k(stage, key),))
+
+    def clear(self) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM cache")
+            db.execute("DELETE FROM leases")
+
+    def try_lease(self, stage: str, key: Hashable, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cur = self._db().execute(
+                "INSERT INTO leases (k, owner, expire) VALUES (?, ?, ?) "
+                "ON CONFLICT(k) DO UPDATE SET owner = excluded.owner, expire = excluded.expire "
+                "WHERE leases.expire < ? OR leases.owner = excluded.owner",
+                (_k(stage, key), self.owner, now + ttl, now),
+            )
+            return cur.rowcount == 1
+
+    def release_lease(self, stage: str, key: Hashable) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM leases WHERE k = ? AND owner = ?", (_k(stage, key), self.owner))
+
+
+def backend_from_env() -> Optional[CacheBackend]:
+    kind = os.getenv("CACHE_BACKEND", "memory").lower()
+    if kind == "sqlite":
+        return SQLiteCacheBackend(pathlib.Path(os.getenv("CACHE_SQLITE_PATH", "data/cache.sqlite3")))
+    if kind != "memory":
+        logger.warning("Unknown CACHE_BACKEND=%s; using in-process memory only", kind)
+    return None
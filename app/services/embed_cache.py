@@ -0,0 +1,93 @@
+# app/services/embed_cache.py
+"""
+内容寻址的 embedding 缓存：
+- key = sha256(模型名 + "\\0" + chunk 文本)，与 ticker 无关；同一篇文章被多个 ticker 入库时只 embed 一次
+- 存在本地 SQLite（float32 BLOB），进程重启后依然有效
+- CachedEmbeddings 包一层任意 LangChain Embeddings：先查缓存，只把未命中的文本（去重后）
+  一次性批量发给底层 embedder
+"""
+
+import hashlib
+import pathlib
+import sqlite3
+import threading
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def embedding_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class SQLiteEmbeddingCache:
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dim INTEGER, vec BLOB)")
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        out: Dict[str, List[float]] = {}
+        if not keys:
+            return out
+        with self._lock:
+            db = self._db()
+            # SQLite 单条语句参数个数有上限，分批查
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                q = f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(batch))})"
+                for k, blob in db.execute(q, batch):
+                    out[k] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return out
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        rows = [(k, len(v), np.asarray(v, dtype=np.float32).tobytes()) for k, v in items.items()]
+        with self._lock:
+            db = self._db()
+            db.executemany("INSERT OR REPLACE INTO embeddings (key, dim, vec) VALUES (?, ?, ?)", rows)
+            db.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, inner: Embeddings, model_name: str, cache: SQLiteEmbeddingCache):
+        self.inner = inner
+        self.model_name = model_name
+        self.cache = cache
+        self.stats = {"hits": 0, "misses": 0, "embed_calls": 0}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_key(self.model_name, t) for t in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        # 未命中的文本去重后一次性发出
+        missing: Dict[str, str] = {}
+        for k, t in zip(keys, texts):
+            if k not in found and k not in missing:
+                missing[k] = t
+        self.stats["hits"] += len(texts) - sum(1 for k in keys if k in missing)
+        self.stats["misses"] += len(missing)
+
+        if missing:
+            self.stats["embed_calls"] += 1
+            vecs = self.inner.embed_documents(list(missing.values()))
+            # 统一按 float32 精度返回，命中与未命中的结果逐位一致
+            fresh = {k: np.asarray(v, dtype=np.float32).tolist() for k, v in zip(missing.keys(), vecs)}
+            self.cache.put_many(fresh)
+            found.update(fresh)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,251 @@
+# app/services/indicators.py
+"""
+多 ticker 指标引擎（纯 NumPy）：
+- 输入是 (T, N) 的宽表：T 根 K 线 × N 个 ticker，按行号右对齐，缺失处为 NaN
+- 每个指标只看最后一个窗口（不生成完整 rolling 序列），一次对 N 列同时计算
+- 指标通过 register_indicator 注册，新增指标不需要任何 per-ticker 循环
+
+compute_history 给回测用：同一套注册的指标对每一行（日期）都算一遍，用滑动窗口视图把
+“第 t 天的最后 L 根”摊成 (L, T×N) 的面板，一次调用覆盖所有日期，结果与逐日调用 compute_panel 一致。
+
+默认指标与 IndicatorSnapshot 字段一一对应，结果与原 compute_indicators 在浮点误差内一致：
+rolling(20) 的语义是“窗口内有 NaN 就得 NaN”，这里保持一致，最后把 NaN 归零。
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_FIELDS = ["price", "change_pct_1d", "volume_zscore", "volatility_20d", "gap_open_pct"]
+
+
+@dataclass
+class Panel:
+    tickers: List[str]
+    open: np.ndarray    # (T, N)
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    @property
+    def rows(self) -> int:
+        return self.close.shape[0]
+
+    @classmethod
+    def from_frames(cls, frames: Dict[str, pd.DataFrame], rows: int = 60) -> "Panel":
+        """
+        把 {ticker: 单 ticker OHLCV df} 打包成宽表：每个 ticker 取自己的最后 rows 根，
+        按行号右对齐（不按日期对齐，不同交易日历不会引入 NaN）。
+        """
+        tickers = [t for t, df in frames.items() if df is not None and not df.empty]
+        n_rows = min(rows, max((len(frames[t]) for t in tickers), default=0))
+        fields = ["Open", "High", "Low", "Close", "Volume"]
+        # (field, T, N) 一次分配；按列取 ndarray（比 df[fields] 的整表拷贝快一个数量级）
+        cube = np.full((len(fields), n_rows, len(tickers)), np.nan)
+        for j, t in enumerate(tickers):
+            df = frames[t]
+            k = min(n_rows, len(df))
+            for i, c in enumerate(fields):
+                if c in df.columns:
+                    cube[i, n_rows - k:, j] = df[c].to_numpy(dtype=float)[-k:]
+        return cls(tickers, *cube)
+
+    @classmethod
+    def from_wide(cls, wide: pd.DataFrame, rows: Optional[int] = None) -> "Panel":
+        """
+        直接接收 (field, ticker) 两层列的宽表，例如 yf.download(..., group_by="column")。
+        按日期对齐，某 ticker 缺失的交易日保持 NaN。
+        """
+        if rows is not None:
+            wide = wide.iloc[-rows:]
+        tickers = list(dict.fromkeys(wide["Close"].columns))
+
+        def _field(name: str) -> np.ndarray:
+            if name not in wide.columns.get_level_values(0):
+                return np.full((len(wide), len(tickers)), np.nan)
+            return wide[name].reindex(columns=tickers).to_numpy(dtype=float)
+
+        return cls(tickers, _field("Open"), _field("High"), _field("Low"), _field("Close"), _field("Volume"))
+
+
+# { name: (fn(panel) -> (N,), 需要的最少行数) }
+_REGISTRY: Dict[str, "tuple[Callable[[Panel], np.ndarray], int]"] = {}
+
+
+def register_indicator(name: str, lookback: int) -> Callable:
+    """装饰器：注册一个指标；fn 接收 Panel，返回长度为 N 的数组（NaN 会被归零）。"""
+    def deco(fn: Callable[[Panel], np.ndarray]) -> Callable[[Panel], np.ndarray]:
+        _REGISTRY[name] = (fn, lookback)
+        return fn
+    return deco
+
+
+def available_indicators() -> List[str]:
+    return list(_REGISTRY)
+
+
+# ---------- 基础工具（只作用于最后一个窗口） ----------
+def _last_returns(close: np.ndarray, window: int) -> np.ndarray:
+    c = close[-(window + 1):]
+    if c.shape[0] < window + 1:
+        return np.full((window, close.shape[1]), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return c[1:] / c[:-1] - 1.0
+
+
+def _window_std(x: np.ndarray) -> np.ndarray:
+    # ddof=1，与 pandas rolling().std() 一致；窗口内任一 NaN -> NaN
+    if x.shape[0] < 2:
+        return np.full(x.shape[1], np.nan)
+    return np.std(x, axis=0, ddof=1)
+
+
+def _last_window(x: np.ndarray, window: int) -> np.ndarray:
+    if x.shape[0] < window:
+        return np.full((window, x.shape[1]), np.nan)
+    return x[-window:]
+
+
+# ---------- 默认指标（IndicatorSnapshot） ----------
+@register_indicator("price", lookback=1)
+def _price(p: Panel) -> np.ndarray:
+    return p.close[-1]
+
+
+@register_indicator("change_pct_1d", lookback=2)
+def _change_pct_1d(p: Panel) -> np.ndarray:
+    return _last_returns(p.close, 1)[-1]
+
+
+def volatility(window: int) -> Callable[[Panel], np.ndarray]:
+    """window 日收益率标准差 × sqrt(252)。"""
+    def _fn(p: Panel) -> np.ndarray:
+        return _window_std(_last_returns(p.close, window)) * np.sqrt(252)
+    return _fn
+
+
+def volume_zscore(window: int) -> Callable[[Panel], np.ndarray]:
+    """最新成交量相对最近 window 根（含当根）的 z-score；std 为 0/NaN 时记 0。"""
+    def _fn(p: Panel) -> np.ndarray:
+        v = _last_window(p.volume, window)
+        mean, std = np.mean(v, axis=0), _window_std(v)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = (v[-1] - mean) / std
+        return np.where(np.isfinite(std) & (std != 0), z, 0.0)
+    return _fn
+
+
+register_indicator("volatility_20d", lookback=21)(volatility(20))
+register_indicator("volume_zscore", lookback=20)(volume_zscore(20))
+
+
+@register_indicator("gap_open_pct", lookback=2)
+def _gap_open_pct(p: Panel) -> np.ndarray:
+    if p.rows < 2:
+        return np.zeros(len(p.tickers))
+    prev_close = p.close[-2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gap = p.open[-1] / prev_close - 1.0
+    return np.where(prev_close != 0, gap, 0.0)
+
+
+# ---------- 扩展指标 ----------
+def rsi(window: int) -> Callable[[Panel], np.ndarray]:
+    """Cutler RSI：最近 window 个涨跌幅的简单均值（只需最后一个窗口，不做 Wilder 递推）。"""
+    def _fn(p: Panel) -> np.ndarray:
+        c = _last_window(p.close, window + 1)
+        d = np.diff(c, axis=0)
+        gain = np.mean(np.clip(d, 0, None), axis=0)
+        loss = np.mean(np.clip(-d, 0, None), axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rs = gain / loss
+            out = 100.0 - 100.0 / (1.0 + rs)
+        # 没有下跌：RSI=100；完全不动：50
+        out = np.where(loss == 0, np.where(gain == 0, 50.0, 100.0), out)
+        return np.where(np.isnan(gain) | np.isnan(loss), np.nan, out)
+    return _fn
+
+
+def atr(window: int) -> Callable[[Panel], np.ndarray]:
+    """平均真实波幅：最近 window 根 TR 的简单均值。"""
+    def _fn(p: Panel) -> np.ndarray:
+        h = _last_window(p.high, window)
+        lo = _last_window(p.low, window)
+        pc = _last_window(p.close, window + 1)[:-1]
+        tr = np.maximum.reduce([h - lo, np.abs(h - pc), np.abs(lo - pc)])
+        return np.mean(tr, axis=0)
+    return _fn
+
+
+register_indicator("rsi_14", lookback=15)(rsi(14))
+register_indicator("atr_14", lookback=15)(atr(14))
+for _w in (5, 10, 40):
+    register_indicator(f"volatility_{_w}d", lookback=_w + 1)(volatility(_w))
+register_indicator("volume_zscore_60d", lookback=60)(volume_zscore(60))
+
+
+# ---------- 入口 ----------
+def compute_panel(panel: Panel, names: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, float]]:
+    """对 panel 的全部 ticker 计算 names 中的指标，返回 {ticker: {name: value}}。"""
+    names = list(names or SNAPSHOT_FIELDS)
+    cols = {}
+    for name in names:
+        fn, _ = _REGISTRY[name]
+        cols[name] = np.nan_to_num(np.asarray(fn(panel), dtype=float), nan=0.0, posinf=0.0, neginf=0.0)
+    return {t: {name: float(cols[name][j]) for name in names} for j, t in enumerate(panel.tickers)}
+
+
+def required_rows(names: Optional[Iterable[str]] = None) -> int:
+    return max(_REGISTRY[n][1] for n in (names or SNAPSHOT_FIELDS))
+
+
+def compute_frames(frames: Dict[str, pd.DataFrame], names: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, float]]:
+    names = list(names or SNAPSHOT_FIELDS)
+    return compute_panel(Panel.from_frames(frames, rows=required_rows(names)), names)
+
+
+def compute_history(panel: Panel, names: Optional[Iterable[str]] = None, max_cells: int = 4_000_000) -> Dict[str, np.ndarray]:
+    """
+    每一行都算一遍 names 中的指标，返回 {name: (T, N)}；第 t 行只用 t 及之前的 required_rows 根，
+    不足时前面补 NaN（与 from_frames 的右对齐一致）。按时间分块，每块的窗口面板不超过 max_cells 个元素。
+    """
+    names = list(names or SNAPSHOT_FIELDS)
+    lookback = required_rows(names)
+    n = len(panel.tickers)
+    out = {name: np.zeros((panel.rows, n)) for name in names}
+    if not panel.rows or not n:
+        return out
+    head = np.full((lookback - 1, n), np.nan)
+    fields = [np.vstack([head, f]) for f in (panel.open, panel.high, panel.low, panel.close, panel.volume)]
+    step = max(1, max_cells // (lookback * n))
+    for a in range(0, panel.rows, step):
+        b = min(panel.rows, a + step)
+        # (b-a, N, L) -> (L, (b-a)*N)：第 (t, j) 列是 ticker j 截至第 t 行的最后 L 根
+        wins = [
+            np.lib.stride_tricks.sliding_window_view(f[a:b + lookback - 1], lookback, axis=0)
+            .transpose(2, 0, 1).reshape(lookback, -1)
+            for f in fields
+        ]
+        sub = Panel(panel.tickers * (b - a), *wins)
+        for name in names:
+            fn, _ = _REGISTRY[name]
+            col = np.nan_to_num(np.asarray(fn(sub), dtype=float), nan=0.0, posinf=0.0, neginf=0.0)
+            out[name][a:b] = col.reshape(b - a, n)
+    return out
+
+
+def compute_history_frames(frames: Dict[str, pd.DataFrame], names: Optional[Iterable[str]] = None) -> Dict[str, pd.DataFrame]:
+    """{ticker: OHLCV df} -> {ticker: 每个交易日一行、每个指标一列的 df}（索引沿用原 df）。"""
+    names = list(names or SNAPSHOT_FIELDS)
+    frames = {t: df for t, df in frames.items() if df is not None and not df.empty}
+    rows = max((len(df) for df in frames.values()), default=0)
+    panel = Panel.from_frames(frames, rows=rows)
+    cols = compute_history(panel, names)
+    out: Dict[str, pd.DataFrame] = {}
+    for j, t in enumerate(panel.tickers):
+        k = len(frames[t])
+        out[t] = pd.DataFrame({name: cols[name][rows - k:, j] for name in names}, index=frames[t].index[-k:])
+    return out
@@ -0,0 +1,268 @@
+# app/services/live_indicators.py
+"""
+盘中增量指标：每个 ticker 维护一份 O(1) 可更新的状态，新 K 线到达时不再重算 60 行 DataFrame。
+
+- 20 日收益率波动率、20 日成交量 z-score：滑动窗口 Welford（加入新值、移出最旧值各 O(1)）
+- change / gap：只需要上一根收盘价
+- 同一交易日的多次推送（盘中日线不断变化）走 revise：先移出旧的当根贡献再加入新的
+- 每 resync_every 次更新按窗口原值重算一次均值 / M2，防止长时间运行的浮点漂移
+
+结果与 market.compute_indicators 对同一段数据的输出在浮点误差内一致（NaN 同样归零），见 tests/test_live_indicators.py。
+
+目前只是库：请求路径上的指标仍由 compute_indicators_panel 从日线算出（行情源没有实时推送），
+这里供接入实时行情时使用，bench 的 live_indicators_on_bar 用它测单根 K 线的更新开销。
+
+BarReplayFeed 把历史日线（如 FixtureProvider 的 CSV）按时间顺序重放成 Bar 流，
+可选把每根日线拆成若干次盘中修订，完全离线，用于测试 / 压测。
+"""
+
+import asyncio
+import math
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from .indicators import SNAPSHOT_FIELDS
+
+_ANNUALIZE = math.sqrt(252)
+
+
+@dataclass(frozen=True)
+class Bar:
+    ticker: str
+    ts: pd.Timestamp
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+
+class RollingMoments:
+    """定长滑动窗口的均值 / 样本方差（Welford 加入 + 反向 Welford 移出）。"""
+
+    def __init__(self, window: int, resync_every: int = 512):
+        self.window = window
+        self.resync_every = resync_every
+        self.values: Deque[float] = deque()
+        self._bad = 0          # 窗口内非有限值个数；>0 时结果为 NaN（与 rolling 语义一致）
+        self._n = 0            # 参与 Welford 的有限值个数
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._updates = 0
+
+    def _add(self, x: float) -> None:
+        if not math.isfinite(x):
+            self._bad += 1
+            return
+        self._n += 1
+        d = x - self._mean
+        self._mean += d / self._n
+        self._m2 += d * (x - self._mean)
+
+    def _remove(self, x: float) -> None:
+        if not math.isfinite(x):
+            self._bad -= 1
+            return
+        self._n -= 1
+        if self._n == 0:
+            self._mean = self._m2 = 0.0
+            return
+        d = x - self._mean
+        self._mean -= d / self._n
+        self._m2 -= d * (x - self._mean)
+
+    def _tick(self) -> None:
+        self._updates += 1
+        if self._updates % self.resync_every == 0:
+            self.resync()
+
+    def resync(self) -> None:
+        finite = [v for v in self.values if math.isfinite(v)]
+        self._bad = len(self.values) - len(finite)
+        self._n = len(finite)
+        self._mean = sum(finite) / self._n if finite else 0.0
+        self._m2 = sum((v - self._mean) ** 2 for v in finite)
+
+    def push(self, x: float) -> None:
+        self.values.append(x)
+        self._add(x)
+        if len(self.values) > self.window:
+            self._remove(self.values.popleft())
+        self._tick()
+
+    def replace_last(self, x: float) -> None:
+        if not self.values:
+            self.push(x)
+            return
+        self._remove(self.values[-1])
+        self.values[-1] = x
+        self._add(x)
+        self._tick()
+
+    @property
+    def full(self) -> bool:
+        return len(self.values) == self.window
+
+    @property
+    def mean(self) -> float:
+        return self._mean if self.full and not self._bad else math.nan
+
+    @property
+    def std(self) -> float:
+        # ddof=1；窗口没满或含 NaN -> NaN
+        if not self.full or self._bad or self._n < 2:
+            return math.nan
+        return math.sqrt(max(self._m2, 0.0) / (self._n - 1))
+
+
+def _ratio(a: float, b: float) -> float:
+    if b == 0 or not (math.isfinite(a) and math.isfinite(b)):
+        return math.nan
+    return a / b - 1.0
+
+
+def _zero_nan(x: float) -> float:
+    return x if math.isfinite(x) else 0.0
+
+
+class IndicatorState:
+    """单个 ticker 的增量指标状态。push = 新的一根 K 线；revise = 当根 K 线（盘中）被更新。"""
+
+    def __init__(self, vol_window: int = 20, z_window: int = 20):
+        self.returns = RollingMoments(vol_window)
+        self.volumes = RollingMoments(z_window)
+        self.last_ts: Optional[pd.Timestamp] = None
+        self.prev_close = math.nan   # 当根之前那一根的收盘价
+        self.open = math.nan
+        self.close = math.nan
+        self.volume = math.nan
+        self.bars = 0
+
+    def push(self, bar: Bar) -> None:
+        if self.bars:
+            self.prev_close = self.close
+            self.returns.push(_ratio(bar.close, self.prev_close))
+        self.volumes.push(float(bar.volume))
+        self._set_last(bar)
+        self.bars += 1
+
+    def revise(self, bar: Bar) -> None:
+        if not self.bars:
+            self.push(bar)
+            return
+        if self.bars > 1:
+            self.returns.replace_last(_ratio(bar.close, self.prev_close))
+        self.volumes.replace_last(float(bar.volume))
+        self._set_last(bar)
+
+    def _set_last(self, bar: Bar) -> None:
+        self.last_ts = bar.ts
+        self.open, self.close, self.volume = float(bar.open), float(bar.close), float(bar.volume)
+
+    def snapshot(self) -> Dict[str, float]:
+        std_v = self.volumes.std
+        z = (self.volume - self.volumes.mean) / std_v if math.isfinite(std_v) and std_v != 0 else 0.0
+        out = {
+            "price": self.close,
+            "change_pct_1d": _ratio(self.close, self.prev_close) if self.bars > 1 else 0.0,
+            "volume_zscore": z,
+            "volatility_20d": self.returns.std * _ANNUALIZE,
+            "gap_open_pct": _ratio(self.open, self.prev_close) if self.bars > 1 else 0.0,
+        }
+        return {k: _zero_nan(out[k]) for k in SNAPSHOT_FIELDS}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, ticker: str = "") -> "IndicatorState":
+        """用历史日线预热：只需要最后 max(窗口)+1 根。"""
+        st = cls()
+        keep = max(st.returns.window + 1, st.volumes.window)
+        for bar in _bars_from_frame(df.tail(keep), ticker):
+            st.push(bar)
+        return st
+
+
+class IndicatorBook:
+    """
+    整个股票池的增量状态。on_bar 按时间戳分派：
+    与上一根同一交易日 -> revise；更晚 -> push；更早（乱序 / 重放重复）-> 忽略。
+    """
+
+    def __init__(self):
+        self._states: Dict[str, IndicatorState] = {}
+
+    def warm(self, frames: Dict[str, pd.DataFrame]) -> None:
+        for t, df in frames.items():
+            if df is not None and not df.empty:
+                self._states[t.upper()] = IndicatorState.from_frame(df, t.upper())
+
+    def on_bar(self, bar: Bar) -> Dict[str, float]:
+        t = bar.ticker.upper()
+        st = self._states.get(t)
+        if st is None:
+            st = self._states[t] = IndicatorState()
+        if st.last_ts is None or bar.ts.normalize() > st.last_ts.normalize():
+            st.push(bar)
+        elif bar.ts.normalize() == st.last_ts.normalize():
+            st.revise(bar)
+        return st.snapshot()
+
+    def snapshot(self, ticker: str) -> Optional[Dict[str, float]]:
+        st = self._states.get(ticker.upper())
+        return st.snapshot() if st is not None else None
+
+    def snapshots(self) -> Dict[str, Dict[str, float]]:
+        return {t: st.snapshot() for t, st in self._states.items()}
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker.upper() in self._states
+
+
+# ---------- 离线重放 ----------
+def _bars_from_frame(df: pd.DataFrame, ticker: str) -> Iterator[Bar]:
+    cols = [df[c].to_numpy(dtype=float) for c in ("Open", "High", "Low", "Close", "Volume")]
+    for i, ts in enumerate(df.index):
+        yield Bar(ticker, pd.Timestamp(ts), *(float(c[i]) for c in cols))
+
+
+def _intraday_revisions(bar: Bar, steps: int) -> Iterator[Bar]:
+    """
+    把一根日线拆成 steps 次盘中修订：开盘价固定，收盘价从开盘线性走到收盘，
+    成交量按比例累积，高低点取到目前为止的极值；最后一次修订就是完整日线。
+    """
+    for k in range(1, steps + 1):
+        f = k / steps
+        close = bar.open + (bar.close - bar.open) * f
+        if k == steps:
+            yield bar
+        else:
+            yield Bar(
+                bar.ticker, bar.ts + pd.Timedelta(minutes=k), bar.open,
+                max(bar.open, close), min(bar.open, close), close, bar.volume * f,
+            )
+
+
+class BarReplayFeed:
+    """按时间顺序重放多个 ticker 的历史日线；steps_per_bar > 1 时每根日线先推若干盘中修订。"""
+
+    def __init__(self, frames: Dict[str, pd.DataFrame], steps_per_bar: int = 1):
+        self.frames = {t.upper(): df for t, df in frames.items() if df is not None and not df.empty}
+        self.steps_per_bar = max(1, steps_per_bar)
+
+    @classmethod
+    def from_provider(cls, provider, tickers: List[str], period: str = "1y", steps_per_bar: int = 1) -> "BarReplayFeed":
+        return cls(provider.history(tickers, period=period), steps_per_bar=steps_per_bar)
+
+    def __iter__(self) -> Iterator[Bar]:
+        bars = [b for t, df in self.frames.items() for b in _bars_from_frame(df, t)]
+        bars.sort(key=lambda b: (b.ts, b.ticker))
+        for bar in bars:
+            yield from _intraday_revisions(bar, self.steps_per_bar)
+
+    async def stream(self, interval: float = 0.0) -> AsyncIterator[Bar]:
+        """协程版本；interval 秒推一根，模拟实时行情。"""
+        for bar in self:
+            yield bar
+            await asyncio.sleep(interval)
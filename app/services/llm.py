@@ -1,12 +1,24 @@
 # app/services/llm.py  (LangChain + RAG 证据池)
 import os, json
-from typing import List, Dict, Any, Optional
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 
-from langchain.prompts import PromptTemplate
+import httpx
+
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import JsonOutputParser
 from langchain_openai import ChatOpenAI
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 from ..schemas.analysis import Thesis  # Thesis 内含 RiskItem/Evidence 等
+from .thesis_cache import THESIS_CACHE, thesis_cache_enabled
+from .prompt_builder import PackedContext, count_tokens, pack_context
+
+
+logger = logging.getLogger("services.llm")
 
 
 class ThesisOnly(BaseModel):
@@ -44,27 +56,236 @@ Return JSON ONLY. No commentary.
 """.strip()
 
 
-def _format_headlines(headlines: List[Dict[str, Any]]) -> str:
-    lines: List[str] = []
-    for h in headlines[:8]:
-        title = h.get("title", "") or ""
-        source = h.get("source", "") or ""
-        published = h.get("published") or h.get("published_at") or ""
-        url = h.get("url", "") or ""
-        lines.append(f"- {title} | {source} | {published} | {url}")
-    return "\n".join(lines) if lines else "- (no headlines)"
+class LLMOverloaded(RuntimeError):
+    """排队已满或排队超时；调用方应返回 503 + Retry-After，而不是 502。"""
+
+
+class LLMIncomplete(RuntimeError):
+    """流式输出结束时 thesis 为空或残缺（校验不通过）。"""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def coerce_thesis(raw: dict) -> dict:
+    """补齐 thesis 的缺省字段（viewpoint / 列表 / 证据字段 / severity / confidence），再交给 Thesis 校验。"""
+    t = raw or {}
+    t.setdefault("viewpoint", "neutral")
+    t.setdefault("reasoning", [])
+    t.setdefault("catalysts", [])
+    t.setdefault("risks", [])
+    fixed_risks = []
+    for r in (t.get("risks") or []):
+        r = r or {}
+        # evidences 归一化
+        evs = r.get("evidences", []) or []
+        fixed_evs = []
+        for e in evs:
+            e = e or {}
+            e.setdefault("source", None)
+            e.setdefault("url", None)
+            e.setdefault("quote", None)
+            e.setdefault("title", None)
+            e.setdefault("summary", None)
+            fixed_evs.append(e)
+        r["evidences"] = fixed_evs
+        if r.get("severity") not in {"low", "medium", "high"}:
+            r["severity"] = r.get("severity") or "medium"
+        fixed_risks.append(r)
+    t["risks"] = fixed_risks
+    t.setdefault("confidence_0_1", 0.5)
+    return t
+
+
+class _LLMRuntime:
+    """
+    进程级 LLM 运行时：
+    - 每个模型名只构建一次 ChatOpenAI / PromptTemplate / structured-output chain
+      （流式 chain 另建一条：同一 JSON schema，按 token 增量解析出部分 thesis）
+    - 同步、异步各一个长连接池（httpx keep-alive），所有请求复用 TLS 连接
+    - 并发上限 LLM_MAX_CONCURRENCY，超出的请求排队（最多 LLM_MAX_QUEUE 个，
+      最长等待 LLM_QUEUE_TIMEOUT_SEC 秒），再多就抛 LLMOverloaded
+    - OPENAI_BASE_URL 可指向本地 OpenAI 兼容的 stub 服务做测试 / 压测
+    """
+
+    def __init__(self):
+        self.max_concurrency = max(1, _env_int("LLM_MAX_CONCURRENCY", 8))
+        self.max_queue = max(0, _env_int("LLM_MAX_QUEUE", 64))
+        self.queue_timeout = float(os.getenv("LLM_QUEUE_TIMEOUT_SEC", "30"))
+        self._chains: Dict[str, Any] = {}
+        self._chains_lock = threading.Lock()
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+        self._sync_sem = threading.BoundedSemaphore(self.max_concurrency)
+        self._async_sem: Optional[asyncio.Semaphore] = None
+        self._count_lock = threading.Lock()
+        self.stats = {"in_flight": 0, "queued": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_concurrency * 2,
+            max_keepalive_connections=self.max_concurrency,
+            keepalive_expiry=60.0,
+        )
+
+    def chain(self, model_name: Optional[str] = None, streaming: bool = False):
+        model_name = model_name or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        key = (model_name, streaming)
+        with self._chains_lock:
+            chain = self._chains.get(key)
+            if chain is None:
+                if self._http_client is None:
+                    timeout = httpx.Timeout(60.0, connect=10.0)
+                    self._http_client = httpx.Client(limits=self._limits(), timeout=timeout)
+                    self._http_async_client = httpx.AsyncClient(limits=self._limits(), timeout=timeout)
+                llm = ChatOpenAI(
+                    model=model_name,
+                    temperature=0.2,
+                    base_url=os.getenv("OPENAI_BASE_URL") or None,
+                    max_retries=_env_int("LLM_MAX_RETRIES", 2),
+                    http_client=self._http_client,
+                    http_async_client=self._http_async_client,
+                )
+                tmpl = PromptTemplate(
+                    template=_PROMPT,
+                    input_variables=["ticker", "indicators_json", "headlines_bullets", "evidences_bullets"],
+                )
+                if streaming:
+                    # JsonOutputParser 在流式模式下每来一段 token 就产出一次当前能解析出的部分 JSON
+                    fmt = {"type": "json_schema", "json_schema": {"name": "ThesisOnly", "schema": ThesisOnly.model_json_schema()}}
+                    chain = tmpl | llm.bind(response_format=fmt) | JsonOutputParser()
+                else:
+                    chain = tmpl | llm.with_structured_output(ThesisOnly)
+                self._chains[key] = chain
+            return chain
+
+    # ---------- 排队 / 计数 ----------
+    def _enqueue(self) -> None:
+        with self._count_lock:
+            if self.stats["queued"] >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise LLMOverloaded("LLM queue is full")
+            self.stats["queued"] += 1
+
+    def _bump(self, **delta: int) -> None:
+        with self._count_lock:
+            for k, v in delta.items():
+                self.stats[k] += v
+
+    def invoke(self, inputs: Dict[str, str]):
+        # 有空闲槽位直接执行；否则排队（队列满立即拒绝）
+        if not self._sync_sem.acquire(blocking=False):
+            self._enqueue()
+            acquired = self._sync_sem.acquire(timeout=self.queue_timeout)
+            self._bump(queued=-1)
+            if not acquired:
+                self._bump(rejected=1)
+                raise LLMOverloaded("Timed out waiting for an LLM slot")
+        self._bump(in_flight=1)
+        try:
+            out = self.chain().invoke(inputs)
+            self._bump(completed=1)
+            return out
+        except Exception:
+            self._bump(failed=1)
+            raise
+        finally:
+            self._bump(in_flight=-1)
+            self._sync_sem.release()
+
+    async def _acquire_async(self, timeout: float) -> bool:
+        """
+        限时等一个异步槽位。不用 wait_for：3.11 上 acquire 刚好在超时那一刻成功时，wait_for 仍抛 TimeoutError，
+        这个许可就永远不会被释放。这里 acquire 单独跑成 task，放弃等待时如果它其实已经拿到了就还回去。
+        """
+        acq = asyncio.ensure_future(self._async_sem.acquire())
+        try:
+            done, _ = await asyncio.wait({acq}, timeout=timeout)
+        except BaseException:
+            self._abandon_acquire(acq)  # 调用方被取消
+            raise
+        if done:
+            return True
+        self._abandon_acquire(acq)
+        return False
+
+    def _abandon_acquire(self, acq: "asyncio.Future[bool]") -> None:
+        acq.cancel()
+        acq.add_done_callback(
+            lambda f: None if f.cancelled() or f.exception() is not None else self._async_sem.release()
+        )
+
+    @asynccontextmanager
+    async def _aslot(self):
+        if self._async_sem is None:
+            self._async_sem = asyncio.Semaphore(self.max_concurrency)
+        if self._async_sem.locked():
+            self._enqueue()
+            try:
+                acquired = await self._acquire_async(self.queue_timeout)
+            finally:
+                self._bump(queued=-1)
+            if not acquired:
+                self._bump(rejected=1)
+                raise LLMOverloaded("Timed out waiting for an LLM slot")
+        else:
+            await self._async_sem.acquire()
+        self._bump(in_flight=1)
+        try:
+            yield
+            self._bump(completed=1)
+        except Exception:
+            self._bump(failed=1)
+            raise
+        finally:
+            self._bump(in_flight=-1)
+            self._async_sem.release()
+
+    async def ainvoke(self, inputs: Dict[str, str]):
+        async with self._aslot():
+            return await self.chain().ainvoke(inputs)
 
+    async def astream(self, inputs: Dict[str, str]) -> AsyncIterator[Dict[str, Any]]:
+        """流式调用：逐个产出部分解析的 JSON（dict），最后一个就是完整结果。占用一个并发槽位。"""
+        async with self._aslot():
+            async for partial in self.chain(streaming=True).astream(inputs):
+                yield partial
 
-def _format_evidences(evs: Optional[List[Dict[str, Any]]]) -> str:
-    if not evs:
-        return "- (no evidences)"
-    lines = []
-    for e in evs[:8]:
-        summary = (e.get("summary") or "").replace("\n", " ").strip()
-        source = e.get("source", "") or ""
-        url = e.get("url", "") or ""
-        lines.append(f"- {summary} | {source} | {url}")
-    return "\n".join(lines)
+    async def aclose(self) -> None:
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+        if self._http_client is not None:
+            self._http_client.close()
+        self._http_client = self._http_async_client = None
+        with self._chains_lock:
+            self._chains.clear()
+
+
+LLM_RUNTIME = _LLMRuntime()
+
+
+def _chain_inputs(ticker: str, indicators: Dict[str, Any], ctx: PackedContext) -> Dict[str, str]:
+    inputs = {
+        "ticker": ticker,
+        "indicators_json": json.dumps(indicators, ensure_ascii=False),
+        "headlines_bullets": ctx.headlines_bullets,
+        "evidences_bullets": ctx.evidences_bullets,
+    }
+    logger.info(
+        "prompt ticker=%s tokens=%d headlines=%d(-%d, %d tok) evidences=%d(-%d, %d tok)",
+        ticker, _prompt_tokens(inputs),
+        len(ctx.headlines), ctx.dropped_headlines, ctx.headline_tokens,
+        len(ctx.evidences), ctx.dropped_evidences, ctx.evidence_tokens,
+    )
+    return inputs
+
+
+def _prompt_tokens(inputs: Dict[str, str]) -> int:
+    return count_tokens(_PROMPT.format(**inputs))
 
 
 def analyze_with_llm(
@@ -73,20 +294,67 @@ def analyze_with_llm(
     headlines: List[Dict[str, Any]],
     evidences: Optional[List[Dict[str, Any]]] = None,  # ⬅️ RAG 检索来的证据池
 ):
-    model_name = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    llm = ChatOpenAI(model=model_name, temperature=0.2)
+    # 先按 token 预算挑出真正进入 prompt 的条目，指纹也只看这些条目
+    ctx = pack_context(headlines, evidences)
+    # 输入指纹相同（或在容差内）时直接复用上一次的 thesis，不调用 LLM
+    if thesis_cache_enabled():
+        cached = THESIS_CACHE.lookup(ticker, indicators, ctx.headlines, ctx.evidences)
+        if cached is not None:
+            return {"thesis": cached}
+    payload = LLM_RUNTIME.invoke(_chain_inputs(ticker, indicators, ctx))
+    thesis = payload.thesis.model_dump()
+    if thesis_cache_enabled():
+        THESIS_CACHE.store(ticker, indicators, ctx.headlines, ctx.evidences, thesis)
+    return {"thesis": thesis}
 
-    tmpl = PromptTemplate(
-        template=_PROMPT,
-        input_variables=["ticker", "indicators_json", "headlines_bullets", "evidences_bullets"],
-    )
-    chain = tmpl | llm.with_structured_output(ThesisOnly)
 
-    payload = chain.invoke({
-        "ticker": ticker,
-        "indicators_json": json.dumps(indicators, ensure_ascii=False),
-        "headlines_bullets": _format_headlines(headlines),
-        "evidences_bullets": _format_evidences(evidences),
-    })
+async def analyze_with_llm_async(
+    ticker: str,
+    indicators: Dict[str, Any],
+    headlines: List[Dict[str, Any]],
+    evidences: Optional[List[Dict[str, Any]]] = None,
+):
+    ctx = pack_context(headlines, evidences)
+    if thesis_cache_enabled():
+        cached = THESIS_CACHE.lookup(ticker, indicators, ctx.headlines, ctx.evidences)
+        if cached is not None:
+            return {"thesis": cached}
+    payload = await LLM_RUNTIME.ainvoke(_chain_inputs(ticker, indicators, ctx))
+    thesis = payload.thesis.model_dump()
+    if thesis_cache_enabled():
+        THESIS_CACHE.store(ticker, indicators, ctx.headlines, ctx.evidences, thesis)
+    return {"thesis": thesis}
+
 
-    return {"thesis": payload.thesis.model_dump()}
+async def astream_thesis(
+    ticker: str,
+    indicators: Dict[str, Any],
+    headlines: List[Dict[str, Any]],
+    evidences: Optional[List[Dict[str, Any]]] = None,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    流式生成 thesis：产出 ("partial", 部分 thesis dict)，最后产出一次 ("final", 完整 thesis dict)。
+    指纹缓存命中时只产出 final。
+    """
+    ctx = pack_context(headlines, evidences)
+    if thesis_cache_enabled():
+        cached = THESIS_CACHE.lookup(ticker, indicators, ctx.headlines, ctx.evidences)
+        if cached is not None:
+            yield "final", cached
+            return
+    last: Dict[str, Any] = {}
+    async for partial in LLM_RUNTIME.astream(_chain_inputs(ticker, indicators, ctx)):
+        if isinstance(partial, dict) and isinstance(partial.get("thesis"), dict):
+            last = partial["thesis"]
+            yield "partial", last
+    # 与非流式路径一致：先补缺省字段再按 ThesisOnly 校验；流中途断开导致的残缺对象不直接抛 ValidationError
+    if not last:
+        raise LLMIncomplete("stream ended before any thesis field was produced")
+    try:
+        thesis = ThesisOnly(thesis=coerce_thesis(dict(last))).thesis.model_dump()
+    except ValidationError as e:
+        bad = ", ".join(".".join(str(p) for p in err["loc"][1:]) or "thesis" for err in e.errors()[:5])
+        raise LLMIncomplete(f"invalid or missing fields: {bad}") from None
+    if thesis_cache_enabled():
+        THESIS_CACHE.store(ticker, indicators, ctx.headlines, ctx.evidences, thesis)
+    yield "final", thesis
@@ -1,106 +1,81 @@
-import yfinance as yf
-import numpy as np
+import os
+import pathlib
 import pandas as pd
+from typing import Dict, List, Optional
 
-def fetch_price_df(ticker: str, period="6mo", interval="1d") -> pd.DataFrame:
-    df = yf.download(
-        ticker,
-        period=period,
-        interval=interval,
-        auto_adjust=False,
-        progress=False,
-        threads=False,
-    )
+from .indicators import compute_frames, compute_history_frames
+from .metrics import span
+from .price_store import PriceStore
+from .providers import get_provider
 
-    if df is None or df.empty:
-        try:
-            df = yf.Ticker(ticker).history(period="1y", interval="1d", auto_adjust=False)
-        except Exception:
-            df = pd.DataFrame()
 
-    if df is None or df.empty:
-        df = yf.download(
-            ticker,
-            period="1y",
-            interval="1d",
-            auto_adjust=True,
-            progress=False,
-            threads=False,
-        )
+def _provider_fetch(tickers: List[str], start: Optional[pd.Timestamp], period: Optional[str]) -> Dict[str, pd.DataFrame]:
+    # 每次取当前 provider，测试 / 压测里 set_provider() 之后立即生效
+    return get_provider().history(tickers, start=start, period=period)
 
-    if df is None or df.empty:
-        raise ValueError(f"No market data for {ticker}. Try another symbol (e.g., MSFT) or retry later.")
-
-    
-    df = df.copy()
-
-    # 情况 A：MultiIndex（('Open','TSLA') 这种）
-    if isinstance(df.columns, pd.MultiIndex):
-        # 取第 1 层（Open/High/Low/Close/Adj Close/Volume）
-        df.columns = [c[0] for c in df.columns]
-
-    # 情况 B：已经被拼成了 'Open_TSLA' 这种
-    if any(col.endswith(f"_{ticker}") for col in df.columns):
-        newcols = {}
-        for col in df.columns:
-            if col.endswith(f"_{ticker}"):
-                base = col[:-(len(ticker)+1)]  # 去掉 '_TSLA'
-                newcols[col] = base
-        df = df.rename(columns=newcols)
-
-    # 到这里我们希望有标准列名
-    needed = ["Open", "High", "Low", "Close", "Volume"]
-    have = set(df.columns)
-    # 个别情况下 auto_adjust=True 只给 'Adj Close'，补一份 Close
-    if "Close" not in have and "Adj Close" in have:
-        df["Close"] = df["Adj Close"]
-
-    # 最终检查
-    if not set(["Open", "Close", "Volume"]).issubset(df.columns):
-        raise ValueError(f"Incomplete columns for {ticker}: got {list(df.columns)}")
-
-    # 去掉关键列为空的行，并只保留最近 60 根（加速）
-    df = df.dropna(subset=["Open", "Close", "Volume"])
-    if len(df) > 60:
-        df = df.tail(60)
-
-    return df
 
-def compute_indicators(df: pd.DataFrame) -> dict:
-    # Ensure we have enough rows
-    if df is None or df.empty:
-        raise ValueError("Empty market data")
+PRICE_STORE = PriceStore(
+    pathlib.Path(os.getenv("PRICE_STORE_DIR", "data/prices")),
+    _provider_fetch,
+    refresh_sec=float(os.getenv("PRICE_STORE_REFRESH_SEC", "300")),
+    bootstrap_period=os.getenv("PRICE_STORE_BOOTSTRAP", "1y"),
+)
 
-    close = df["Close"]
-    vol = df["Volume"].astype(float)
 
-    # 1) daily return
-    ret_1d = close.pct_change()
+def _use_store(interval: str) -> bool:
+    # 本地存储只保存日线；PRICE_STORE_ENABLED=0 时回退到每次直接下载
+    return interval == "1d" and os.getenv("PRICE_STORE_ENABLED", "1") != "0"
 
-    # 2) 20d volatility (annualized-ish) — handle NaN safely
-    ret20_std = ret_1d.rolling(20).std().iloc[-1]
-    vol20 = float(ret20_std * np.sqrt(252)) if pd.notna(ret20_std) else 0.0
 
-    # 3) Volume z-score vs last 20d — handle NaN/0 safely
-    vol_mean = vol.rolling(20).mean().iloc[-1]
-    vol_std = vol.rolling(20).std().iloc[-1]
-    if pd.isna(vol_mean) or pd.isna(vol_std) or vol_std == 0:
-        vol_z = 0.0
+def _tail(df: pd.DataFrame, n: int = 60) -> pd.DataFrame:
+    # 只保留最近 60 根（加速）
+    return df.tail(n) if len(df) > n else df
+
+
+@span("market_fetch")
+def fetch_price_df(ticker: str, period="6mo", interval="1d") -> pd.DataFrame:
+    if _use_store(interval):
+        return _tail(PRICE_STORE.get(ticker, period))
+    return _tail(get_provider().history_one(ticker, period=period, interval=interval))
+
+
+@span("market_fetch")
+def fetch_price_panel(tickers: List[str], period="6mo", interval="1d") -> Dict[str, pd.DataFrame]:
+    """
+    多 ticker 一次性取数；返回 {ticker: 标准 OHLCV df}，取不到数据的 ticker 不出现在结果里。
+    走本地存储时，需要首次下载 / 增量更新的 ticker 各合并成一次 provider 调用。
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return {}
+    if _use_store(interval):
+        frames = PRICE_STORE.get_many(tickers, period)
     else:
-        vol_z = float((float(vol.iloc[-1]) - float(vol_mean)) / float(vol_std))
-
-    # 4) Gap open %
-    gap_pct = 0.0
-    if df.shape[0] >= 2:
-        prev_close = float(close.iloc[-2])
-        today_open = float(df["Open"].iloc[-1])
-        if prev_close != 0.0:
-            gap_pct = (today_open / prev_close) - 1.0
-
-    return {
-        "price": float(close.iloc[-1]),
-        "change_pct_1d": float(ret_1d.iloc[-1]) if pd.notna(ret_1d.iloc[-1]) else 0.0,
-        "volume_zscore": float(vol_z),
-        "volatility_20d": float(vol20),
-        "gap_open_pct": float(gap_pct),
-    }
+        frames = get_provider().history(tickers, period=period, interval=interval)
+    return {t: _tail(df) for t, df in frames.items() if not df.empty}
+
+@span("indicators")
+def compute_indicators(df: pd.DataFrame) -> dict:
+    # Ensure we have enough rows
+    if df is None or df.empty:
+        raise ValueError("Empty market data")
+    # 单 ticker 就是 N=1 的面板；只看最后一个窗口，不生成完整 rolling 序列
+    return compute_frames({"_": df})["_"]
+
+
+@span("indicators")
+def compute_indicators_panel(frames: Dict[str, pd.DataFrame], names: Optional[List[str]] = None) -> Dict[str, dict]:
+    """
+    多 ticker 一次性计算，结果与逐个调用 compute_indicators 一致。
+    names 可以选 indicators.available_indicators() 里的任意指标（RSI/ATR/多窗口波动率等）。
+    """
+    return compute_frames(frames, names)
+
+
+@span("indicators")
+def compute_indicators_history(frames: Dict[str, pd.DataFrame], names: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+    """
+    回测用：每个 ticker 每个交易日的指标（df 每行与“截至当天的数据调用 compute_indicators”一致）。
+    frames 传完整历史即可，不要先 _tail。
+    """
+    return compute_history_frames(frames, names)
@@ -0,0 +1,257 @@
+# app/services/metrics.py
+"""
+进程内指标与请求级耗时拆分：
+- span("stage")：计时上下文管理器，同步 / 协程 / to_thread 里的代码都能用
+  * 耗时进 stage_duration_seconds{stage} 直方图；抛异常时 stage_errors_total{stage,error} +1（异常照常抛出）
+  * 同时记到当前请求的 span 列表里（contextvars；create_task / to_thread 会继承），用于 Server-Timing
+- render_prometheus()：Prometheus 文本格式（不依赖 prometheus_client）
+- StackSampler：可选的采样分析器，慢请求时把所有线程的调用栈按 collapsed-stack 格式落盘
+  （flamegraph.pl / speedscope 可直接读取）
+"""
+
+import contextvars
+import logging
+import os
+import pathlib
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("services.metrics")
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        for i, b in enumerate(_BUCKETS):
+            if v <= b:
+                self.counts[i] += 1
+        self.sum += v
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._gauges: List[Tuple[str, str, Callable[[], Dict[LabelKey, float]]]] = []
+
+    def observe(self, name: str, value: float, help: str = "", **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help)
+            series = self._hist.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                h = series[key] = _Histogram()
+            h.observe(value)
+
+    def inc(self, name: str, value: float = 1.0, help: str = "", **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def register_gauge(self, name: str, help: str, fn: Callable[[], Dict[LabelKey, float]]) -> None:
+        """fn() 在每次抓取时调用，返回 {labels: value}；无标签用 {(): value}。"""
+        self._gauges.append((name, help, fn))
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def _labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+            items = list(key) + ([extra] if extra else [])
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+        with self._lock:
+            hists = {n: {k: (list(h.counts), h.sum, h.count) for k, h in s.items()} for n, s in self._hist.items()}
+            counters = {n: dict(s) for n, s in self._counters.items()}
+            helps = dict(self._help)
+
+        for name, series in sorted(hists.items()):
+            lines.append(f"# HELP {name} {helps.get(name, '')}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, (counts, total, n) in sorted(series.items()):
+                for b, c in zip(_BUCKETS, counts):
+                    lines.append(f"{name}_bucket{_labels(key, ('le', repr(b)))} {c}")
+                lines.append(f"{name}_bucket{_labels(key, ('le', '+Inf'))} {n}")
+                lines.append(f"{name}_sum{_labels(key)} {total}")
+                lines.append(f"{name}_count{_labels(key)} {n}")
+        for name, series in sorted(counters.items()):
+            lines.append(f"# HELP {name} {helps.get(name, '')}")
+            lines.append(f"# TYPE {name} counter")
+            for key, v in sorted(series.items()):
+                lines.append(f"{name}{_labels(key)} {v}")
+        for name, help, fn in self._gauges:
+            try:
+                values = fn()
+            except Exception:
+                logger.exception("Gauge %s failed", name)
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, v in sorted(values.items()):
+                lines.append(f"{name}{_labels(key)} {float(v)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# 进程级单例
+METRICS = MetricsRegistry()
+
+
+# ---------- 请求级 span ----------
+_SPANS: "contextvars.ContextVar[Optional[List[Tuple[str, float]]]]" = contextvars.ContextVar("spans", default=None)
+
+
+@contextmanager
+def request_spans() -> Iterator[List[Tuple[str, float]]]:
+    """在一个请求范围内收集 (stage, 毫秒)；列表是共享的，子任务 / 线程里记录的 span 也会进来。"""
+    spans: List[Tuple[str, float]] = []
+    token = _SPANS.set(spans)
+    try:
+        yield spans
+    finally:
+        _SPANS.reset(token)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        # 取消不是错误（客户端断开 / 超时后被取消的阶段）
+        if not isinstance(e, (GeneratorExit, KeyboardInterrupt)) and type(e).__name__ != "CancelledError":
+            METRICS.inc("stage_errors_total", help="Errors raised inside a pipeline stage", stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        dt = time.perf_counter() - t0
+        METRICS.observe("stage_duration_seconds", dt, help="Pipeline stage latency", stage=stage)
+        spans = _SPANS.get()
+        if spans is not None:
+            spans.append((stage, dt * 1000))
+
+
+def record_error(stage: str, exc: BaseException) -> None:
+    """被降级处理（不再往上抛）的异常也要计数。"""
+    METRICS.inc("stage_errors_total", help="Errors raised inside a pipeline stage", stage=stage, error=type(exc).__name__)
+
+
+def server_timing(spans: List[Tuple[str, float]], total_ms: Optional[float] = None) -> str:
+    # 同名 stage 多次出现（例如批量里的多次 embedding）时累加
+    agg: Dict[str, float] = {}
+    for stage, ms in spans:
+        agg[stage] = agg.get(stage, 0.0) + ms
+    parts = [f"{stage};dur={ms:.1f}" for stage, ms in agg.items()]
+    if total_ms is not None:
+        parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+# ---------- 慢请求采样分析 ----------
+class StackSampler:
+    """
+    后台线程每 interval 秒抓一次所有线程的调用栈（sys._current_frames），
+    统计 collapsed stack（"f1;f2;f3 count"）。开销与采样频率成正比，与被测代码无关。
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _collapse(self, frame) -> str:
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid != me:
+                    self.samples[self._collapse(frame)] += 1
+
+    def start(self) -> "StackSampler":
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def dump(self, path: pathlib.Path) -> pathlib.Path:
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+        return path
+
+
+def slow_profile_threshold_ms() -> Optional[float]:
+    # PROFILE_SLOW_MS 未设置时不做任何采样
+    v = os.getenv("PROFILE_SLOW_MS")
+    try:
+        return float(v) if v else None
+    except ValueError:
+        return None
+
+
+_PROFILING = threading.Semaphore(1)  # 同一时刻最多一个采样器，避免互相干扰
+
+
+@contextmanager
+def maybe_profile(label: str) -> Iterator[Callable[[float], None]]:
+    """
+    PROFILE_SLOW_MS 设置时对请求采样；请求结束后调用 yield 出来的 finish(total_ms)，
+    超过阈值才把栈写到 PROFILE_DIR（默认 data/profiles）。
+    """
+    threshold = slow_profile_threshold_ms()
+    sampler = None
+    if threshold is not None and _PROFILING.acquire(blocking=False):
+        sampler = StackSampler(interval=float(os.getenv("PROFILE_INTERVAL_SEC", "0.005"))).start()
+
+    def finish(total_ms: float) -> None:
+        if sampler is None or total_ms < threshold:
+            return
+        sampler.stop()
+        name = f"{int(time.time() * 1000)}-{label.strip('/').replace('/', '_') or 'root'}.collapsed"
+        path = sampler.dump(pathlib.Path(os.getenv("PROFILE_DIR", "data/profiles")) / name)
+        logger.warning("Slow request %s took %.0f ms; profile written to %s", label, total_ms, path)
+
+    try:
+        yield finish
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            _PROFILING.release()
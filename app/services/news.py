@@ -1,55 +1,238 @@
+import asyncio
+import calendar
+import html
+import logging
+import os
+import re
+import httpx
 import requests
-from bs4 import BeautifulSoup
+import xml.etree.ElementTree as ET
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 from typing import List, Dict, Optional
 import feedparser
 from typing import Any
 
+from .metrics import record_error, span
 
+try:
+    from defusedxml import ElementTree as SafeET
+    from defusedxml import DefusedXmlException
+except ImportError:  # 可选依赖：没有 defusedxml 时只在没有 DTD 的文档上用标准库 ET
+    SafeET = None
+    DefusedXmlException = ()
 
+logger = logging.getLogger("services.news")
 
-def _to_iso(published: Any) -> Optional[str]:
+
+# 市场级 RSS 源（目前与具体 ticker 无关）；RSS_FEEDS（逗号分隔）可整体替换，例如指向本地回放服务
+MARKET_FEEDS: List[str] = [u.strip() for u in os.getenv("RSS_FEEDS", "").split(",") if u.strip()] or [
+    "https://feeds.a.dj.com/rss/RSSMarketsMain.xml",
+    "https://www.investopedia.com/feedbuilder/feed/getfeed?feedName=news",
+    "https://www.marketwatch.com/feeds/topstories",
+]
+
+# 解析流程：原始条目（只取字段、解析时间戳，不碰 HTML）-> 按 url 去重、按时间取前 N -> 只对留下的条目去标签。
+# RSS 2.0 / Atom 用 ElementTree 直接解析；其它格式或不规范的 XML 回退到 feedparser。
+
+_ATOM = "{http://www.w3.org/2005/Atom}"
+
+
+def _to_ts(published: Any) -> Optional[float]:
+    """struct_time / datetime / RFC 822 / ISO 8601 -> UTC epoch 秒；无法解析时 None。"""
     if not published:
         return None
-    try:
-        return published.isoformat()
-    except AttributeError:
+    if hasattr(published, "tm_year"):  # feedparser 的 *_parsed 是 UTC 的 struct_time
+        return float(calendar.timegm(published))
+    if isinstance(published, datetime):
+        dt = published
+    else:
+        s = str(published).strip()
+        try:
+            dt = parsedate_to_datetime(s)
+        except (TypeError, ValueError, IndexError):
+            try:
+                dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+            except ValueError:
+                return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _to_iso(published: Any) -> Optional[str]:
+    ts = _to_ts(published)
+    if ts is None:
         return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
 
-def fetch_rss_headlines(feeds: List[str], limit: int = 10) -> List[Dict[str, Any]]:
-    items: List[Dict[str, Any]] = []
-    for url in feeds:
-        d = feedparser.parse(url)
-        for e in d.entries[:limit]:
-            
-            title = getattr(e, "title", "")
-            link = getattr(e, "link", "")
-            published = getattr(e, "published_parsed", None) or getattr(e, "published", None)
-            src = getattr(d.feed, "title", "") or getattr(e, "source", "")
-
-            summary_raw = getattr(e, "summary", None)
-            if summary_raw:
-                try:
-                    summary = BeautifulSoup(summary_raw, "html.parser").get_text(" ", strip=True)
-                except Exception:
-                    summary = summary_raw
-            else:
-                summary = None
-
-            items.append({
-                "title": title,
-                "url": link,
-                "published": _to_iso(published),  # <<< 统一为 published
-                "source": src,
-                "summary": summary
-            })
-
-   
+
+_DROP_BLOCKS = re.compile(r"<(script|style)\b.*?</\1\s*>", re.I | re.S)
+_TAGS = re.compile(r"<[^>]*>")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def _strip_html(raw: str) -> str:
+    """正则去标签 + 反转义 HTML 实体；同一段摘要在多次轮询之间只处理一次。"""
+    if "<" not in raw and "&" not in raw:
+        return _SPACES.sub(" ", raw).strip()
+    text = _TAGS.sub(" ", _DROP_BLOCKS.sub(" ", raw))
+    return _SPACES.sub(" ", html.unescape(text)).strip()
+
+
+def _text(el: Optional[ET.Element]) -> str:
+    return (el.text or "").strip() if el is not None else ""
+
+
+def _raw_from_rss(channel: ET.Element) -> List[Dict[str, Any]]:
+    src = _text(channel.find("title"))
+    out = []
+    for it in channel.iter("item"):
+        link = _text(it.find("link")) or _text(it.find("guid"))
+        published = _text(it.find("pubDate")) or _text(it.find("{http://purl.org/dc/elements/1.1/}date"))
+        out.append({
+            "title": _text(it.find("title")),
+            "url": link,
+            "published_ts": _to_ts(published),
+            "source": src,
+            "summary_raw": _text(it.find("description")) or None,
+        })
+    return out
+
+
+def _raw_from_atom(feed: ET.Element) -> List[Dict[str, Any]]:
+    src = _text(feed.find(f"{_ATOM}title"))
+    out = []
+    for e in feed.iter(f"{_ATOM}entry"):
+        link = ""
+        for ln in e.iter(f"{_ATOM}link"):
+            if ln.get("rel", "alternate") == "alternate":
+                link = ln.get("href", "")
+                break
+        published = _text(e.find(f"{_ATOM}published")) or _text(e.find(f"{_ATOM}updated"))
+        out.append({
+            "title": _text(e.find(f"{_ATOM}title")),
+            "url": link,
+            "published_ts": _to_ts(published),
+            "source": src,
+            "summary_raw": _text(e.find(f"{_ATOM}summary")) or _text(e.find(f"{_ATOM}content")) or None,
+        })
+    return out
+
+
+def _raw_from_feedparser(d: Any) -> List[Dict[str, Any]]:
+    src = getattr(d.feed, "title", "")
+    out = []
+    for e in d.entries:
+        published = getattr(e, "published_parsed", None) or getattr(e, "published", None)
+        out.append({
+            "title": getattr(e, "title", ""),
+            "url": getattr(e, "link", ""),
+            "published_ts": _to_ts(published),
+            "source": src or getattr(e, "source", ""),
+            "summary_raw": getattr(e, "summary", None),
+        })
+    return out
+
+
+def parse_feed(content: bytes) -> List[Dict[str, Any]]:
+    """RSS / Atom 原文 -> 原始条目（summary 仍是 HTML）。"""
+    # feed 来自外部：带 DTD / 实体声明的文档不交给 ET（实体展开炸弹），直接走 feedparser（它会去掉 DOCTYPE）
+    root = None
+    if SafeET is not None:
+        try:
+            root = SafeET.fromstring(content)
+        except (ET.ParseError, DefusedXmlException):
+            root = None
+    elif b"<!DOCTYPE" not in content and b"<!ENTITY" not in content:
+        try:
+            root = ET.fromstring(content)
+        except ET.ParseError:
+            root = None
+    if root is not None:
+        if root.tag == "rss" and root.find("channel") is not None:
+            return _raw_from_rss(root.find("channel"))
+        if root.tag == f"{_ATOM}feed":
+            return _raw_from_atom(root)
+    # RSS 1.0 / 带 HTML 实体的不规范 XML 等：交给 feedparser（我们自己去标签，不需要它的 sanitizer）
+    d = feedparser.parse(content, sanitize_html=False, resolve_relative_uris=False)
+    return _raw_from_feedparser(d)
+
+
+def _finalize(raw: Dict[str, Any]) -> Dict[str, Any]:
+    title = raw.get("title") or ""
+    if "<" in title or "&" in title:
+        title = _strip_html(title)
+    summary_raw = raw.get("summary_raw")
+    ts = raw.get("published_ts")
+    return {
+        "title": title,
+        "url": raw.get("url") or "",
+        "published": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat() if ts is not None else None,
+        "published_ts": ts,
+        "source": raw.get("source") or "",
+        "summary": _strip_html(summary_raw) if summary_raw else None,
+    }
+
+
+def _dedupe_and_sort(items: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
     seen, uniq = set(), []
     for it in items:
         k = it.get("url")
         if k and k not in seen:
             seen.add(k)
             uniq.append(it)
-    uniq.sort(key=lambda x: x.get("published") or "", reverse=True)
-    return uniq[:limit]
\ No newline at end of file
+    # 按解析后的时间戳排序；没有时间的排最后
+    uniq.sort(key=lambda x: x.get("published_ts") or 0.0, reverse=True)
+    return uniq[:limit]
+
+
+def select_headlines(raw_items: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """先去重、按时间截断，再只对留下的条目做 HTML 处理。"""
+    return [_finalize(r) for r in _dedupe_and_sort(raw_items, limit)]
+
+
+def _read_feed(src: str, timeout: float = 8.0) -> bytes:
+    if os.path.exists(src):
+        with open(src, "rb") as f:
+            return f.read()
+    resp = requests.get(src, timeout=timeout)
+    resp.raise_for_status()
+    return resp.content
+
+
+def fetch_rss_headlines(feeds: List[str], limit: int = 10) -> List[Dict[str, Any]]:
+    raw: List[Dict[str, Any]] = []
+    for url in feeds:
+        try:
+            raw.extend(parse_feed(_read_feed(url)))
+        except Exception as e:
+            logger.warning("RSS fetch failed for %s: %r", url, e)
+    return select_headlines(raw, limit)
+
+
+async def fetch_rss_headlines_async(
+    feeds: List[str], limit: int = 10, timeout: float = 8.0
+) -> List[Dict[str, Any]]:
+    """
+    异步版本：用 httpx 并发下载所有源，单个源失败/超时只跳过该源。
+    解析只针对已下载的字节，不再自己发请求。
+    """
+    with span("rss_fetch"):
+        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+            results = await asyncio.gather(*(client.get(u) for u in feeds), return_exceptions=True)
+
+    raw: List[Dict[str, Any]] = []
+    with span("rss_parse"):
+        for url, resp in zip(feeds, results):
+            if isinstance(resp, BaseException):
+                logger.warning("RSS fetch failed for %s: %r", url, resp)
+                record_error("rss_fetch", resp)
+                continue
+            if resp.status_code >= 400:
+                logger.warning("RSS fetch for %s returned HTTP %d", url, resp.status_code)
+                continue
+            raw.extend(parse_feed(resp.content))
+        return select_headlines(raw, limit)
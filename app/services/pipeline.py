@@ -0,0 +1,376 @@
+# app/services/pipeline.py
+"""
+异步分析流水线：
+
+    market ──────────────────────────┐
+                                     ├──> LLM ──> LLMReport
+    news ──> relevance ──> RAG ──────┘
+
+market 与 news(+RAG) 互不依赖，并发执行；总耗时 ≈ max(market, news+RAG) + LLM。
+stream_analysis 是流式版本：每个阶段一完成就产出一个事件，thesis 按 token 增量产出。
+每个阶段有独立超时（环境变量 STAGE_TIMEOUT_<STAGE>，单位秒）。
+阻塞型调用（yfinance / FAISS）放到线程里跑，不占用事件循环。
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import HTTPException
+
+from .cache import REPORT_CACHE
+from .metrics import span
+from .market import fetch_price_df, fetch_price_panel, compute_indicators, compute_indicators_panel
+from .news import MARKET_FEEDS, _dedupe_and_sort, fetch_rss_headlines_async
+from .poller import HEADLINE_STORE
+from .relevance import select_relevant, split_relevant, ticker_feeds
+from .llm import LLMIncomplete, LLMOverloaded, analyze_with_llm_async, astream_thesis, coerce_thesis
+from .rag import index_headlines, risk_query, search_evidences
+from .report_archive import REPORT_ARCHIVE
+from ..schemas.analysis import LLMReport, IndicatorSnapshot, NewsItem, Thesis, BatchResult, AnalysisEvent
+
+logger = logging.getLogger("services.pipeline")
+
+_DEFAULT_TIMEOUTS = {"market": 15.0, "batch_market": 60.0, "news": 8.0, "rag": 15.0, "llm": 40.0}
+
+
+def _timeout(stage: str) -> float:
+    try:
+        return float(os.getenv(f"STAGE_TIMEOUT_{stage.upper()}", _DEFAULT_TIMEOUTS[stage]))
+    except ValueError:
+        return _DEFAULT_TIMEOUTS[stage]
+
+
+# ---------- 工具：容错修正 ----------
+def _coerce_news_item(n: dict) -> dict:
+    n = n or {}
+    return {
+        "title": n.get("title") or "",
+        "url": n.get("url") or "",
+        "published": n.get("published") or n.get("published_at") or None,
+        "source": n.get("source") or "",
+        "summary": n.get("summary") or None,
+    }
+
+def rss_sources_for(ticker: str) -> List[str]:
+    return list(MARKET_FEEDS) + ticker_feeds(ticker)
+
+
+def _pool_size() -> int:
+    try:
+        return max(1, int(os.getenv("NEWS_POOL_SIZE", "200")))
+    except ValueError:
+        return 200
+
+
+# ---------- 各阶段 ----------
+# 超时放在被缓存的计算内部：leader 超时后异常会同步给所有 single-flight 跟随者
+async def market_stage(ticker: str) -> Dict[str, Any]:
+    async def _load():
+        return await asyncio.wait_for(asyncio.to_thread(fetch_price_df, ticker), _timeout("market"))
+
+    try:
+        with span("market"):
+            df = await REPORT_CACHE.aget_or_compute("prices", ticker, _load)
+            return compute_indicators(df)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Market data timeout for {ticker}")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _fetch_feeds(feeds: List[str], limit: int) -> List[Dict[str, Any]]:
+    async def _load():
+        return await asyncio.wait_for(fetch_rss_headlines_async(feeds, limit=limit), _timeout("news"))
+
+    # 按源列表缓存：市场源所有 ticker 共享，个股源按 ticker 各自一份
+    return await REPORT_CACHE.aget_or_compute("headlines", (tuple(feeds), limit), _load)
+
+
+async def headline_pool(ticker: str) -> List[Dict[str, Any]]:
+    """相关性过滤之前的候选池（按时间倒序）：市场新闻 + 可选的个股源。"""
+    n = _pool_size()
+    # 后台轮询器已经有数据时市场新闻直接读内存 store，不再按请求抓 RSS
+    pool = HEADLINE_STORE.latest(n) if HEADLINE_STORE.ready else []
+    sources = [] if HEADLINE_STORE.ready else [list(MARKET_FEEDS)]
+    own = ticker_feeds(ticker)
+    if own:
+        sources.append(own)
+    if not sources:
+        return pool
+    results = await asyncio.gather(*(_fetch_feeds(f, n) for f in sources), return_exceptions=True)
+    for feeds, r in zip(sources, results):
+        if isinstance(r, BaseException):
+            logger.warning("News fetch failed for %s (%s): %r", ticker, feeds, r)
+            continue
+        pool = pool + r
+    return _dedupe_and_sort(pool, n)
+
+
+async def news_stage(ticker: str, limit: int = 8) -> List[Dict[str, Any]]:
+    # 只有提到该 ticker 的条目才进入 RAG 与 prompt；新闻拿不到时降级为空列表继续分析
+    try:
+        with span("news"):
+            pool = await headline_pool(ticker)
+        with span("relevance"):
+            return select_relevant(ticker, pool, limit)
+    except Exception as e:
+        logger.warning("News stage failed for %s: %r", ticker, e)
+        return []
+
+
+async def rag_stage(ticker: str, headlines: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # RAG：把最新 headlines 里真正提到该 ticker 的条目入库（补足用的市场新闻不入库），然后做一次相似度检索拿证据
+    def _evidences() -> List[Dict[str, Any]]:
+        matched, _ = split_relevant(ticker, headlines, limit=len(headlines), fallback=0)
+        index_headlines(ticker, matched)
+        return search_evidences(ticker, risk_query(ticker), k=5)
+
+    async def _load():
+        return await asyncio.wait_for(asyncio.to_thread(_evidences), _timeout("rag"))
+
+    try:
+        with span("rag"):
+            return await REPORT_CACHE.aget_or_compute("evidences", ticker, _load)
+    except Exception as e:
+        logger.warning("RAG stage failed for %s: %r", ticker, e)
+        return []
+
+
+async def llm_stage(
+    ticker: str,
+    indicators: Dict[str, Any],
+    headlines: List[Dict[str, Any]],
+    evidences: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    try:
+        with span("llm"):
+            return await asyncio.wait_for(
+                analyze_with_llm_async(ticker, indicators, headlines, evidences), _timeout("llm")
+            )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="LLM timeout")
+    except LLMOverloaded as e:
+        # 排队已满：让客户端稍后重试，而不是当作上游错误
+        raise HTTPException(status_code=503, detail=f"LLM busy: {e}", headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"LLM error: {e}")
+
+
+def build_report(
+    ticker: str,
+    indicators: Dict[str, Any],
+    headlines: List[Dict[str, Any]],
+    raw: Dict[str, Any],
+) -> LLMReport:
+    # 组装响应（仍然以本地指标 + 我们抓到的新闻为准）
+    try:
+        with span("assemble"):
+            raw_news = raw.get("top_news") or headlines
+            raw_thesis = coerce_thesis(raw.get("thesis") or {})
+
+            report = LLMReport(
+                ticker=ticker.upper(),
+                date=datetime.now(timezone.utc).isoformat(),
+                indicators=IndicatorSnapshot(**indicators),
+                top_news=[NewsItem(**_coerce_news_item(n)) for n in raw_news],
+                thesis=Thesis(**raw_thesis),
+            )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Invalid LLM payload: {e}")
+    # 每份新组装的报告进列式归档（缓存命中不会走到这里，不会重复归档）
+    REPORT_ARCHIVE.append(report)
+    return report
+
+
+async def run_analysis(ticker: str) -> LLMReport:
+    async def _news_then_rag():
+        headlines = await news_stage(ticker)
+        evidences = await rag_stage(ticker, headlines)
+        return headlines, evidences
+
+    indicators, (headlines, evidences) = await asyncio.gather(market_stage(ticker), _news_then_rag())
+    raw = await llm_stage(ticker, indicators, headlines, evidences)
+    return build_report(ticker, indicators, headlines, raw)
+
+
+# ---------- 流式 ----------
+async def stream_analysis(ticker: str) -> AsyncIterator[AnalysisEvent]:
+    """
+    与 run_analysis 相同的流水线，但逐段推送：
+    indicators / news 谁先完成谁先发，evidences 紧跟 news，
+    然后是若干 thesis_partial，最后一个 report（与 GET /analyze/{ticker} 的响应相同）。
+    出错时发一个 error 事件并结束（503 时带 retry_after）。
+
+    与 /analyze/{ticker} 共用 "thesis" 的 single-flight：只有成为 leader 的请求真正跑流水线并推送中间事件，
+    同一 ticker 的其它并发请求（流式或非流式）等 leader 的结果，只收到最后的 report。
+    """
+    t0 = time.perf_counter()
+    events: "asyncio.Queue[Any]" = asyncio.Queue()
+    done = object()
+
+    def _event(name: str, data: Any = None, **kw: Any) -> AnalysisEvent:
+        return AnalysisEvent(event=name, ticker=ticker, elapsed_ms=(time.perf_counter() - t0) * 1000, data=data, **kw)
+
+    async def _compute() -> LLMReport:
+        # 只有本请求是 leader 时才会被调用
+        market = asyncio.create_task(market_stage(ticker))
+        news = asyncio.create_task(news_stage(ticker))
+        pending = {market, news}
+        rag = None
+        indicators: Dict[str, Any] = {}
+        headlines: List[Dict[str, Any]] = []
+        evidences: List[Dict[str, Any]] = []
+        try:
+            while pending:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    if task is market:
+                        indicators = task.result()
+                        events.put_nowait(_event("indicators", IndicatorSnapshot(**indicators).model_dump()))
+                    elif task is news:
+                        headlines = task.result()
+                        events.put_nowait(_event("news", [_coerce_news_item(n) for n in headlines]))
+                        rag = asyncio.create_task(rag_stage(ticker, headlines))
+                        pending.add(rag)
+                    elif task is rag:
+                        evidences = task.result()
+                        events.put_nowait(_event("evidences", evidences))
+        finally:
+            # 出错或被取消时，不再需要的阶段直接取消
+            for task in (market, news, rag):
+                if task is not None and not task.done():
+                    task.cancel()
+
+        try:
+            async with asyncio.timeout(_timeout("llm")):
+                with span("llm"):
+                    async for kind, thesis in astream_thesis(ticker, indicators, headlines, evidences):
+                        if kind == "partial":
+                            events.put_nowait(_event("thesis_partial", thesis))
+                        else:
+                            raw = {"thesis": thesis}
+        except TimeoutError:
+            raise HTTPException(status_code=504, detail="LLM timeout")
+        except LLMOverloaded as e:
+            raise HTTPException(status_code=503, detail=f"LLM busy: {e}", headers={"Retry-After": "5"})
+        except LLMIncomplete as e:
+            raise HTTPException(status_code=502, detail=f"LLM returned an incomplete thesis: {e}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"LLM error: {e}")
+        return build_report(ticker, indicators, headlines, raw)
+
+    async def _run() -> None:
+        try:
+            report = await REPORT_CACHE.aget_or_compute("thesis", ticker, _compute)
+            events.put_nowait(_event("report", report.model_dump()))
+        except HTTPException as e:
+            retry = (e.headers or {}).get("Retry-After")
+            events.put_nowait(_event("error", status=e.status_code, error=str(e.detail),
+                                     retry_after=int(retry) if retry else None))
+        except Exception as e:
+            logger.warning("Streaming analysis failed for %s: %r", ticker, e)
+            events.put_nowait(_event("error", status=502, error=f"Analysis error: {e}"))
+        finally:
+            events.put_nowait(done)
+
+    runner = asyncio.create_task(_run())
+    try:
+        while True:
+            ev = await events.get()
+            if ev is done:
+                break
+            yield ev
+    finally:
+        # 客户端断开：取消本请求；若它是 leader，跟随者会接手重新计算
+        if not runner.done():
+            runner.cancel()
+
+
+# ---------- 批量（watchlist） ----------
+def _batch_concurrency() -> int:
+    try:
+        return max(1, int(os.getenv("BATCH_CONCURRENCY", "8")))
+    except ValueError:
+        return 8
+
+
+async def run_batch(tickers: List[str]) -> AsyncIterator[BatchResult]:
+    """
+    批量分析：已缓存的报告立即返回；其余 ticker 共用一次多 ticker 行情下载、
+    一次向量化指标计算，headline 候选池共享（内存 store / 缓存），按 ticker 各自做相关性过滤，
+    然后 RAG+LLM 按 BATCH_CONCURRENCY 并发，谁先完成谁先产出。
+    """
+    pending: List[str] = []
+    for t in tickers:
+        cached = await REPORT_CACHE.aget("thesis", t)
+        if cached is not None:
+            yield BatchResult(ticker=t, ok=True, report=cached)
+        else:
+            pending.append(t)
+    if not pending:
+        return
+
+    async def _prices() -> Dict[str, Any]:
+        frames = {t: await REPORT_CACHE.aget("prices", t) for t in pending}
+        missing = [t for t, df in frames.items() if df is None]
+        if missing:
+            fetched = await asyncio.wait_for(
+                asyncio.to_thread(fetch_price_panel, missing), _timeout("batch_market")
+            )
+            for t, df in fetched.items():
+                await REPORT_CACHE.aset("prices", t, df)
+                frames[t] = df
+        return {t: df for t, df in frames.items() if df is not None}
+
+    # 响应已经开始流式输出，这里的任何异常都要落成逐 ticker 的失败行，不能让它截断整个流
+    try:
+        frames = await _prices()
+        indicators = compute_indicators_panel(frames)
+    except asyncio.TimeoutError:
+        for t in pending:
+            yield BatchResult(ticker=t, ok=False, status=504, error=f"Market data timeout for {t}")
+        return
+    except Exception as e:
+        logger.warning("Batch market stage failed for %s: %r", pending, e)
+        for t in pending:
+            yield BatchResult(ticker=t, ok=False, status=502, error=f"Market data error: {e}")
+        return
+    ready = [t for t in pending if t in indicators]
+    for t in pending:
+        if t not in indicators:
+            yield BatchResult(ticker=t, ok=False, status=400, error=f"No market data for {t}.")
+
+    sem = asyncio.Semaphore(_batch_concurrency())
+
+    async def _one(t: str) -> BatchResult:
+        async def _run() -> LLMReport:
+            headlines = await news_stage(t)
+            evidences = await rag_stage(t, headlines)
+            raw = await llm_stage(t, indicators[t], headlines, evidences)
+            return build_report(t, indicators[t], headlines, raw)
+
+        async with sem:
+            try:
+                report = await REPORT_CACHE.aget_or_compute("thesis", t, _run)
+                return BatchResult(ticker=t, ok=True, report=report)
+            except HTTPException as e:
+                return BatchResult(ticker=t, ok=False, status=e.status_code, error=str(e.detail))
+            except Exception as e:
+                logger.warning("Batch analysis failed for %s: %r", t, e)
+                return BatchResult(ticker=t, ok=False, status=502, error=f"Analysis error: {e}")
+
+    # 自己建 task：客户端断开（生成器被关闭）时取消还没完成的，不让它们在没人听的情况下继续调 news/RAG/LLM
+    tasks = [asyncio.create_task(_one(t)) for t in ready]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,181 @@
+# app/services/poller.py
+"""
+后台 RSS 轮询 + 进程内 headline store：
+- 轮询器按固定间隔并发拉取所有源，带 ETag / Last-Modified 条件请求（304 直接跳过解析），
+  已入库的 url 不再重复处理摘要
+- store 按 url 去重，每条新 headline 分配一个单调递增的 seq，
+  消费者用 since(cursor) 只取新增条目
+- 请求路径只读 store 的快照，不做任何网络 IO
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from .metrics import span
+from .news import MARKET_FEEDS, _dedupe_and_sort, parse_feed, select_headlines
+
+logger = logging.getLogger("services.poller")
+
+
+class HeadlineStore:
+    def __init__(self, capacity: int = 2000):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._by_url: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        # 与 seq 同序的两个平行数组，since() 用 bisect 定位
+        self._seqs: List[int] = []
+        self._urls: List[str] = []
+        self._seq = 0
+        self._sorted: Optional[List[Dict[str, Any]]] = None  # latest() 的快照，写入时失效
+
+    @property
+    def ready(self) -> bool:
+        return self._seq > 0
+
+    @property
+    def cursor(self) -> int:
+        return self._seq
+
+    def __len__(self) -> int:
+        return len(self._by_url)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._by_url
+
+    def add(self, items: List[Dict[str, Any]]) -> int:
+        """写入一批 headline，返回新增条数（已见过的 url 忽略）。"""
+        added = 0
+        with self._lock:
+            for it in items:
+                url = it.get("url")
+                if not url or url in self._by_url:
+                    continue
+                self._seq += 1
+                self._by_url[url] = (self._seq, it)
+                self._seqs.append(self._seq)
+                self._urls.append(url)
+                added += 1
+            overflow = len(self._urls) - self.capacity
+            if overflow > 0:
+                for url in self._urls[:overflow]:
+                    self._by_url.pop(url, None)
+                del self._urls[:overflow]
+                del self._seqs[:overflow]
+            if added:
+                self._sorted = None
+        return added
+
+    def latest(self, limit: int = 10) -> List[Dict[str, Any]]:
+        snap = self._sorted
+        if snap is None:
+            with self._lock:
+                snap = _dedupe_and_sort([it for _, it in self._by_url.values()], len(self._by_url))
+                self._sorted = snap
+        return snap[:limit]
+
+    def since(self, cursor: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """返回 seq > cursor 的条目（按到达顺序）以及新的 cursor。"""
+        with self._lock:
+            i = bisect.bisect_right(self._seqs, cursor)
+            urls = self._urls[i:] if limit is None else self._urls[i:i + limit]
+            out = [self._by_url[u][1] for u in urls]
+            next_cursor = self._by_url[urls[-1]][0] if urls else max(cursor, self._seqs[-1] if self._seqs else 0)
+        return out, next_cursor
+
+
+class RSSPoller:
+    def __init__(
+        self,
+        store: HeadlineStore,
+        feeds: List[str],
+        interval_sec: float = 60.0,
+        per_feed_limit: int = 30,
+        timeout: float = 8.0,
+    ):
+        self.store = store
+        self.feeds = list(feeds)
+        self.interval_sec = interval_sec
+        self.per_feed_limit = per_feed_limit
+        self.timeout = timeout
+        # { feed_url: {"etag": ..., "last_modified": ...} }
+        self._validators: Dict[str, Dict[str, str]] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.stats = {"polls": 0, "fetched": 0, "not_modified": 0, "errors": 0, "new_items": 0}
+
+    async def _fetch(self, url: str) -> List[Dict[str, Any]]:
+        headers = {}
+        v = self._validators.get(url, {})
+        if v.get("etag"):
+            headers["If-None-Match"] = v["etag"]
+        if v.get("last_modified"):
+            headers["If-Modified-Since"] = v["last_modified"]
+
+        resp = await self._client.get(url, headers=headers)
+        if resp.status_code == 304:
+            self.stats["not_modified"] += 1
+            return []
+        resp.raise_for_status()
+        self.stats["fetched"] += 1
+        self._validators[url] = {
+            "etag": resp.headers.get("ETag", ""),
+            "last_modified": resp.headers.get("Last-Modified", ""),
+        }
+        with span("rss_parse"):
+            # 已经在 store 里的 url 不再做 HTML 处理（源更新时通常只多出几条）
+            raw = [r for r in parse_feed(resp.content) if r.get("url") not in self.store]
+            return select_headlines(raw, self.per_feed_limit)
+
+    async def poll_once(self) -> int:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=True)
+        results = await asyncio.gather(*(self._fetch(u) for u in self.feeds), return_exceptions=True)
+        items: List[Dict[str, Any]] = []
+        for url, r in zip(self.feeds, results):
+            if isinstance(r, BaseException):
+                self.stats["errors"] += 1
+                logger.warning("RSS poll failed for %s: %s", url, r)
+                continue
+            items.extend(r)
+        added = self.store.add(items)
+        self.stats["polls"] += 1
+        self.stats["new_items"] += added
+        return added
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.exception("RSS poll loop error")
+            await asyncio.sleep(self.interval_sec)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+HEADLINE_STORE = HeadlineStore(capacity=int(os.getenv("HEADLINE_STORE_CAPACITY", "2000")))
+RSS_POLLER = RSSPoller(
+    HEADLINE_STORE,
+    MARKET_FEEDS,
+    interval_sec=float(os.getenv("RSS_POLL_INTERVAL_SEC", "60")),
+)
@@ -0,0 +1,229 @@
+# app/services/price_store.py
+"""
+本地日线 OHLCV 存储（每个 ticker 一个内存映射的 .npy 结构化数组）：
+- 首次访问时拉一段完整历史（PRICE_STORE_BOOTSTRAP，默认 1y）；请求的 period 更长（2y / 5y / max）时
+  按该 period 重新拉一次完整历史，已覆盖的区间记在 <TICKER>.period 里
+- 之后只拉“最后一根 K 线及之后”的增量（最后一根可能是盘中未收盘的，需要覆盖）
+- 文件 mtime 即最近一次同步时间；PRICE_STORE_REFRESH_SEC 内的重复请求零网络调用
+- 写入先写临时文件再 os.replace，读者永远看到完整文件
+
+数据来源是一个可替换的 fetcher：fetch(tickers, start, period) -> {ticker: df}，
+df 为标准 OHLCV 列 + DatetimeIndex；离线测试时传入假的 fetcher 即可。
+"""
+
+import logging
+import os
+import pathlib
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .metrics import record_error
+
+logger = logging.getLogger("services.price_store")
+
+_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+_DTYPE = np.dtype([("ts", "<i8")] + [(f, "<f8") for f in _FIELDS])
+
+Fetcher = Callable[[List[str], Optional[pd.Timestamp], Optional[str]], Dict[str, pd.DataFrame]]
+
+
+def period_start(period: str, end: pd.Timestamp) -> Optional[pd.Timestamp]:
+    """'6mo' / '1y' / '5d' / '2wk' / 'ytd' / 'max' -> 起始时间（max 返回 None）。"""
+    p = (period or "").strip().lower()
+    if p in ("", "max"):
+        return None
+    if p == "ytd":
+        return pd.Timestamp(year=end.year, month=1, day=1)
+    for suffix, unit in (("mo", "months"), ("wk", "weeks"), ("y", "years"), ("d", "days")):
+        if p.endswith(suffix) and p[: -len(suffix)].isdigit():
+            return end - pd.DateOffset(**{unit: int(p[: -len(suffix)])})
+    raise ValueError(f"Unsupported period: {period}")
+
+
+def _period_covers(have: str, want: str) -> bool:
+    """have 这段历史是否包含 want 这段（两者按同一个结束时间比较起点）。"""
+    end = pd.Timestamp.now().normalize()
+    have_start, want_start = period_start(have, end), period_start(want, end)
+    if have_start is None:
+        return True
+    return want_start is not None and have_start <= want_start
+
+
+def _to_naive_index(idx: pd.Index) -> pd.DatetimeIndex:
+    idx = pd.DatetimeIndex(idx)
+    if idx.tz is not None:
+        idx = idx.tz_convert("UTC").tz_localize(None)
+    # 统一存纳秒（pandas 2.x/3.x 默认分辨率不同）
+    return idx.as_unit("ns")
+
+
+def _frame_to_records(df: pd.DataFrame) -> np.ndarray:
+    df = df.dropna(subset=["Open", "Close", "Volume"])
+    rec = np.empty(len(df), dtype=_DTYPE)
+    rec["ts"] = _to_naive_index(df.index).asi8
+    for f in _FIELDS:
+        rec[f] = df[f].to_numpy(dtype=float) if f in df.columns else np.nan
+    return rec
+
+
+def _records_to_frame(rec: np.ndarray) -> pd.DataFrame:
+    idx = pd.DatetimeIndex(np.asarray(rec["ts"]).astype("datetime64[ns]"), name="Date")
+    return pd.DataFrame({f: np.asarray(rec[f]) for f in _FIELDS}, index=idx)
+
+
+class PriceStore:
+    def __init__(
+        self,
+        root: pathlib.Path,
+        fetcher: Fetcher,
+        refresh_sec: float = 300.0,
+        bootstrap_period: str = "1y",
+    ):
+        self.root = pathlib.Path(root)
+        self.fetcher = fetcher
+        self.refresh_sec = refresh_sec
+        self.bootstrap_period = bootstrap_period
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self.stats = {"local_hits": 0, "incremental_syncs": 0, "bootstraps": 0, "backfills": 0, "fetch_errors": 0}
+
+    # ---------- 文件 ----------
+    def _path(self, ticker: str) -> pathlib.Path:
+        return self.root / f"{ticker.upper()}.npy"
+
+    def _coverage_path(self, ticker: str) -> pathlib.Path:
+        return self.root / f"{ticker.upper()}.period"
+
+    def _coverage(self, ticker: str) -> str:
+        # 没有记录的旧文件按 bootstrap_period 算
+        try:
+            return self._coverage_path(ticker).read_text().strip() or self.bootstrap_period
+        except OSError:
+            return self.bootstrap_period
+
+    def _covers(self, ticker: str, period: str) -> bool:
+        return _period_covers(self._coverage(ticker), period)
+
+    def _lock(self, ticker: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(ticker.upper(), threading.Lock())
+
+    def load(self, ticker: str) -> np.ndarray:
+        path = self._path(ticker)
+        if not path.exists():
+            return np.empty(0, dtype=_DTYPE)
+        return np.load(path, mmap_mode="r")
+
+    def _write(self, ticker: str, rec: np.ndarray) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(ticker)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, rec)
+        os.replace(tmp, path)
+
+    def _is_fresh(self, ticker: str) -> bool:
+        path = self._path(ticker)
+        return path.exists() and (time.time() - path.stat().st_mtime) < self.refresh_sec
+
+    # ---------- 同步 ----------
+    def _merge(self, ticker: str, old: np.ndarray, new_df: Optional[pd.DataFrame]) -> None:
+        if new_df is None or new_df.empty:
+            if len(old):
+                self._path(ticker).touch()  # 没有新 K 线也记录一次同步时间
+            return
+        new = _frame_to_records(new_df)
+        if len(old) and len(new):
+            old = old[old["ts"] < new["ts"].min()]
+        merged = np.concatenate([np.asarray(old), new]) if len(old) else new
+        merged = merged[np.argsort(merged["ts"], kind="stable")]
+        self._write(ticker, merged)
+
+    def _needs_sync(self, ticker: str, period: str) -> bool:
+        return not self._is_fresh(ticker) or not self._covers(ticker, period)
+
+    def sync_many(self, tickers: List[str], period: Optional[str] = None) -> None:
+        """
+        把过期 / 不存在 / 历史不够 period 长的 ticker 一次性补齐：
+        完整下载（首次或回补更长历史）与增量下载各最多一次调用。
+        """
+        want = self.bootstrap_period
+        if period and not _period_covers(want, period):
+            want = period
+        stale = [t for t in tickers if self._needs_sync(t, want)]
+        if not stale:
+            self.stats["local_hits"] += len(tickers)
+            return
+        self.stats["local_hits"] += len(tickers) - len(stale)
+
+        locks = [self._lock(t) for t in sorted(stale)]  # 固定加锁顺序，避免死锁
+        for lk in locks:
+            lk.acquire()
+        try:
+            # 拿到锁之后再检查一次：可能别的线程刚同步完
+            stale = [t for t in stale if self._needs_sync(t, want)]
+            existing = {t: self.load(t) for t in stale}
+            bootstrap = [t for t in stale if not len(existing[t]) or not self._covers(t, want)]
+            incremental = [t for t in stale if t not in bootstrap]
+
+            if bootstrap:
+                backfills = sum(1 for t in bootstrap if len(existing[t]))
+                self.stats["backfills"] += backfills
+                self.stats["bootstraps"] += len(bootstrap) - backfills
+                self._fetch_and_merge(bootstrap, existing, start=None, period=want)
+            if incremental:
+                self.stats["incremental_syncs"] += len(incremental)
+                # 从最早的“最后一根”开始拉，一次调用覆盖所有 ticker
+                start = pd.Timestamp(min(int(existing[t]["ts"][-1]) for t in incremental))
+                self._fetch_and_merge(incremental, existing, start=start, period=None)
+        finally:
+            for lk in locks:
+                lk.release()
+
+    def _fetch_and_merge(
+        self,
+        tickers: List[str],
+        existing: Dict[str, np.ndarray],
+        start: Optional[pd.Timestamp],
+        period: Optional[str],
+    ) -> None:
+        try:
+            frames = self.fetcher(tickers, start, period)
+        except Exception as e:
+            # 增量失败时继续用本地旧数据；首次下载失败的 ticker 在 get() 里报错
+            self.stats["fetch_errors"] += 1
+            logger.warning("Price fetch failed for %s: %r", tickers, e)
+            record_error("market_fetch", e)
+            return
+        for t in tickers:
+            df = frames.get(t)
+            self._merge(t, existing[t], df)
+            if period is not None and df is not None and not df.empty:
+                # 记下这次完整下载覆盖到的 period；上市不满 period 的 ticker 也算覆盖，避免每次重拉
+                self._coverage_path(t).write_text(period)
+
+    # ---------- 读取 ----------
+    def get(self, ticker: str, period: str = "6mo") -> pd.DataFrame:
+        out = self.get_many([ticker], period)
+        if ticker.upper() not in out:
+            raise ValueError(f"No market data for {ticker}. Try another symbol (e.g., MSFT) or retry later.")
+        return out[ticker.upper()]
+
+    def get_many(self, tickers: List[str], period: str = "6mo") -> Dict[str, pd.DataFrame]:
+        tickers = [t.upper() for t in dict.fromkeys(tickers)]
+        self.sync_many(tickers, period)
+        out: Dict[str, pd.DataFrame] = {}
+        for t in tickers:
+            rec = self.load(t)
+            if not len(rec):
+                continue
+            last = pd.Timestamp(int(rec["ts"][-1]))
+            start = period_start(period, last)
+            if start is not None:
+                rec = rec[rec["ts"] >= start.value]
+            out[t] = _records_to_frame(rec)
+        return out
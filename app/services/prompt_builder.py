@@ -0,0 +1,205 @@
+# app/services/prompt_builder.py
+"""
+按 token 预算打包 prompt 里的 headlines / evidences：
+- 用 tiktoken 计数（编码表取不到时退化为 ~4 字符/token 的估算，保证离线可用）
+- headlines 按发布时间从新到旧排序，标题近似重复（词集合 Jaccard >= 阈值）的只保留最新一条
+- evidences 按检索分数排序（同分看发布时间），同一 URL 只保留分数最高的一条
+- 单条过长的摘要截断到 PROMPT_ITEM_MAX_TOKENS；在总预算 PROMPT_CONTEXT_TOKENS 内贪心装入，
+  headlines 用不完的预算顺延给 evidences
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("services.prompt_builder")
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+# ---------- token 计数 ----------
+@lru_cache(maxsize=4)
+def _encoding(model: str):
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # 没装 tiktoken 或取不到编码表（离线环境）
+        logger.warning("tiktoken encoding unavailable for %s; falling back to length estimate", model)
+        return None
+
+
+def _model() -> str:
+    return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    enc = _encoding(model or _model())
+    if enc is None:
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    if max_tokens <= 0:
+        return ""
+    enc = _encoding(model or _model())
+    if enc is None:
+        return text if len(text) <= max_tokens * 4 else text[: max_tokens * 4].rstrip() + "…"
+    ids = enc.encode(text, disallowed_special=())
+    return text if len(ids) <= max_tokens else enc.decode(ids[:max_tokens]).rstrip() + "…"
+
+
+# ---------- 排序 / 去重 ----------
+def _published_ts(item: Dict[str, Any]) -> float:
+    ts = item.get("published_ts")
+    if isinstance(ts, (int, float)) and ts > 0:
+        return float(ts)
+    raw = item.get("published") or item.get("published_at")
+    if not raw:
+        return 0.0
+    try:
+        dt = datetime.fromisoformat(str(raw).replace("Z", "+00:00"))
+    except ValueError:
+        return 0.0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _words(text: str) -> frozenset:
+    return frozenset(_WORD_RE.findall((text or "").lower()))
+
+
+def _near_duplicate(a: frozenset, b: frozenset, threshold: float) -> bool:
+    if not a or not b:
+        return a == b
+    return len(a & b) / len(a | b) >= threshold
+
+
+def rank_headlines(headlines: List[Dict[str, Any]], dedupe_threshold: float = 0.8) -> List[Dict[str, Any]]:
+    """新到旧；近似重复的标题（不同源转载同一条新闻）只保留最新的一条。"""
+    ordered = sorted(headlines or [], key=_published_ts, reverse=True)
+    kept: List[Dict[str, Any]] = []
+    seen: List[frozenset] = []
+    for h in ordered:
+        w = _words(h.get("title", ""))
+        if any(_near_duplicate(w, s, dedupe_threshold) for s in seen):
+            continue
+        seen.append(w)
+        kept.append(h)
+    return kept
+
+
+def rank_evidences(evidences: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """分数高到低、同分新到旧；同一 URL 只保留分数最高的 chunk。"""
+    ordered = sorted(evidences or [], key=lambda e: (float(e.get("score") or 0.0), _published_ts(e)), reverse=True)
+    kept: List[Dict[str, Any]] = []
+    urls = set()
+    for e in ordered:
+        url = e.get("url") or ""
+        if url and url in urls:
+            continue
+        urls.add(url)
+        kept.append(e)
+    return kept
+
+
+# ---------- 单行格式 ----------
+def headline_line(h: Dict[str, Any], max_title_tokens: Optional[int] = None) -> str:
+    # 只截标题：来源 / 时间 / URL 必须完整保留，否则 LLM 没法引用这条新闻
+    title = h.get("title", "") or ""
+    if max_title_tokens is not None:
+        title = truncate_tokens(title, max_title_tokens)
+    source = h.get("source", "") or ""
+    published = h.get("published") or h.get("published_at") or ""
+    url = h.get("url", "") or ""
+    return f"- {title} | {source} | {published} | {url}"
+
+
+def evidence_line(e: Dict[str, Any], max_item_tokens: int) -> str:
+    summary = (e.get("summary") or "").replace("\n", " ").strip()
+    summary = truncate_tokens(summary, max_item_tokens)
+    source = e.get("source", "") or ""
+    url = e.get("url", "") or ""
+    return f"- {summary} | {source} | {url}"
+
+
+# ---------- 打包 ----------
+@dataclass
+class PackedContext:
+    headlines: List[Dict[str, Any]] = field(default_factory=list)
+    evidences: List[Dict[str, Any]] = field(default_factory=list)
+    headlines_bullets: str = "- (no headlines)"
+    evidences_bullets: str = "- (no evidences)"
+    headline_tokens: int = 0
+    evidence_tokens: int = 0
+    dropped_headlines: int = 0
+    dropped_evidences: int = 0
+
+
+def _pack(items: List[Dict[str, Any]], render: Callable[[Dict[str, Any]], str], budget: int, max_items: int) -> Tuple[List[Dict[str, Any]], List[str], int]:
+    picked, lines, used = [], [], 0
+    for it in items:
+        if len(picked) >= max_items:
+            break
+        line = render(it)
+        n = count_tokens(line) + 1  # +1：换行
+        if used + n > budget:
+            continue  # 这一条太长，后面更短的也许还放得下
+        picked.append(it)
+        lines.append(line)
+        used += n
+    return picked, lines, used
+
+
+def pack_context(
+    headlines: List[Dict[str, Any]],
+    evidences: Optional[List[Dict[str, Any]]],
+    budget: Optional[int] = None,
+    headline_share: Optional[float] = None,
+) -> PackedContext:
+    budget = _env_int("PROMPT_CONTEXT_TOKENS", 1200) if budget is None else budget
+    if headline_share is None:
+        try:
+            headline_share = float(os.getenv("PROMPT_HEADLINE_SHARE", "0.4"))
+        except ValueError:
+            headline_share = 0.4
+    max_item = _env_int("PROMPT_ITEM_MAX_TOKENS", 120)
+    max_items = _env_int("PROMPT_MAX_ITEMS", 12)
+
+    ranked_h = rank_headlines(headlines)
+    ranked_e = rank_evidences(evidences)
+
+    h_budget = int(budget * headline_share) if ranked_e else budget
+    h_items, h_lines, h_used = _pack(ranked_h, lambda h: headline_line(h, max_item), h_budget, max_items)
+    e_items, e_lines, e_used = _pack(ranked_e, lambda e: evidence_line(e, max_item), budget - h_used, max_items)
+
+    ctx = PackedContext(
+        headlines=h_items,
+        evidences=e_items,
+        headline_tokens=h_used,
+        evidence_tokens=e_used,
+        dropped_headlines=len(headlines or []) - len(h_items),
+        dropped_evidences=len(evidences or []) - len(e_items),
+    )
+    if h_lines:
+        ctx.headlines_bullets = "\n".join(h_lines)
+    if e_lines:
+        ctx.evidences_bullets = "\n".join(e_lines)
+    return ctx
@@ -0,0 +1,243 @@
+# app/services/providers.py
+"""
+行情数据源抽象：所有实现都返回同一种标准 OHLCV 结构，
+列名归一化只在这里做一次（后端与 Streamlit 前端共用）。
+
+标准结构：
+    index   DatetimeIndex（tz-naive，升序，名为 "Date"；日线及以上周期为交易日 00:00）
+    columns Open, High, Low, Close, Volume（float）
+
+实现：
+- YFinanceProvider  线上 yfinance
+- FixtureProvider   读本地 CSV（<dir>/<TICKER>.csv），完全离线、结果确定，可用于压测/回放
+
+MARKET_PROVIDER=yfinance|fixture 选择默认数据源，MARKET_FIXTURE_DIR 指定 fixture 目录。
+"""
+
+import os
+import pathlib
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from .metrics import span
+
+OHLCV = ["Open", "High", "Low", "Close", "Volume"]
+
+
+@span("normalize")
+def normalize_ohlcv(df: pd.DataFrame, ticker: str, interval: str = "1d") -> pd.DataFrame:
+    """
+    各种 yfinance 返回形态 -> 标准 OHLCV：
+    - MultiIndex（('Open','TSLA') 或 ('TSLA','Open')）
+    - 被拼成 'Open_TSLA' / 'Close_TSLA' 的列
+    - auto_adjust=True 时只有 'Adj Close' 没有 'Close'
+    - 日期在列里（'Date' / 'date' / 'Datetime'）而不在 index
+    - 日线的时间戳：yf.download 给 tz-naive 的 00:00，Ticker.history 给交易所时区的 00:00（UTC 04:00/05:00）；
+      统一成交易所本地日期的 00:00，否则同一个交易日会在 price store 里出现两根
+    """
+    if df is None or df.empty:
+        raise ValueError(f"No market data for {ticker}.")
+    df = df.copy()
+
+    # 情况 A：MultiIndex，取字段那一层
+    if isinstance(df.columns, pd.MultiIndex):
+        level = 0
+        for i in range(df.columns.nlevels):
+            if set(OHLCV) & {str(c) for c in df.columns.get_level_values(i)}:
+                level = i
+                break
+        df.columns = [str(c) for c in df.columns.get_level_values(level)]
+
+    # 情况 B：已经被拼成了 'Open_TSLA' 这种
+    suffix = f"_{ticker}"
+    df = df.rename(columns={c: c[: -len(suffix)] for c in df.columns if str(c).endswith(suffix)})
+
+    # 日期在列里
+    for c in ("Date", "date", "Datetime", "datetime"):
+        if c in df.columns:
+            df = df.set_index(c)
+            break
+
+    # 个别情况下 auto_adjust=True 只给 'Adj Close'，补一份 Close
+    if "Close" not in df.columns and "Adj Close" in df.columns:
+        df["Close"] = df["Adj Close"]
+
+    if not {"Open", "Close", "Volume"}.issubset(df.columns):
+        raise ValueError(f"Incomplete columns for {ticker}: got {list(df.columns)}")
+
+    out = pd.DataFrame(index=df.index)
+    for c in OHLCV:
+        out[c] = pd.to_numeric(df[c], errors="coerce") if c in df.columns else float("nan")
+    out = out.astype(float)
+
+    idx = pd.DatetimeIndex(pd.to_datetime(out.index, errors="coerce"))
+    daily = interval.endswith(("d", "wk", "mo"))
+    if idx.tz is not None:
+        # 日线取交易所本地日期；盘中数据统一成 UTC
+        idx = idx.tz_localize(None) if daily else idx.tz_convert("UTC").tz_localize(None)
+    if daily:
+        idx = idx.normalize()
+    out.index = idx.rename("Date")
+    out = out[out.index.notna()]
+    out = out[~out.index.duplicated(keep="last")].sort_index()
+    return out.dropna(subset=["Open", "Close", "Volume"])
+
+
+class MarketDataProvider(ABC):
+    name = "base"
+
+    @abstractmethod
+    def history(
+        self,
+        tickers: List[str],
+        start: Optional[pd.Timestamp] = None,
+        period: Optional[str] = None,
+        interval: str = "1d",
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        返回 {ticker: 标准 OHLCV df}；给了 start 就从 start（含）开始，否则取最近 period。
+        拿不到数据的 ticker 不出现在结果里（不抛异常）。
+        """
+
+    def history_one(self, ticker: str, period: str = "6mo", interval: str = "1d") -> pd.DataFrame:
+        out = self.history([ticker], period=period, interval=interval)
+        if ticker not in out or out[ticker].empty:
+            raise ValueError(f"No market data for {ticker}. Try another symbol (e.g., MSFT) or retry later.")
+        return out[ticker]
+
+
+class YFinanceProvider(MarketDataProvider):
+    name = "yfinance"
+
+    def _download_one(self, ticker: str, start, period: str, interval: str) -> pd.DataFrame:
+        import yfinance as yf
+
+        kwargs = {"start": start} if start is not None else {"period": period}
+        df = yf.download(ticker, interval=interval, auto_adjust=False, progress=False, threads=False, **kwargs)
+
+        # 首次全量下载时保留原来的兜底链路：Ticker.history -> auto_adjust=True（沿用请求的 period / interval）
+        if start is None:
+            if df is None or df.empty:
+                try:
+                    df = yf.Ticker(ticker).history(period=period, interval=interval, auto_adjust=False)
+                except Exception:
+                    df = pd.DataFrame()
+            if df is None or df.empty:
+                df = yf.download(ticker, period=period, interval=interval, auto_adjust=True, progress=False, threads=False)
+        return df
+
+    @staticmethod
+    def _slice_ticker(raw: pd.DataFrame, ticker: str) -> pd.DataFrame:
+        # 多 ticker 下载（group_by="ticker"）得到 (ticker, field) 两层列；个别版本顺序相反
+        if raw is None or raw.empty or not isinstance(raw.columns, pd.MultiIndex):
+            return pd.DataFrame()
+        for level in range(raw.columns.nlevels):
+            if ticker in raw.columns.get_level_values(level):
+                return raw.xs(ticker, axis=1, level=level)
+        return pd.DataFrame()
+
+    def history(self, tickers, start=None, period=None, interval="1d"):
+        import yfinance as yf
+
+        tickers = list(dict.fromkeys(tickers))
+        period = period or "1y"
+        if len(tickers) == 1:
+            t = tickers[0]
+            try:
+                return {t: normalize_ohlcv(self._download_one(t, start, period, interval), t, interval)}
+            except ValueError:
+                return {}
+
+        kwargs = {"start": start} if start is not None else {"period": period}
+        try:
+            raw = yf.download(
+                tickers, interval=interval, auto_adjust=False, progress=False, threads=True,
+                group_by="ticker", **kwargs,
+            )
+        except Exception:
+            raw = pd.DataFrame()
+
+        out: Dict[str, pd.DataFrame] = {}
+        for t in tickers:
+            df = self._slice_ticker(raw, t).dropna(how="all")
+            try:
+                out[t] = normalize_ohlcv(df, t, interval)
+            except ValueError:
+                continue
+        return out
+
+
+class FixtureProvider(MarketDataProvider):
+    """
+    从 <root>/<TICKER>.csv 读取（列：Date,Open,High,Low,Close,Volume）。
+    文件只解析、归一化一次后常驻内存；period 相对文件里最后一根 K 线计算，
+    因此同一份 fixture 无论何时回放结果都一样。as_of 可把数据截断到某个历史时点。
+    """
+
+    name = "fixture"
+
+    def __init__(self, root: pathlib.Path, as_of: Optional[pd.Timestamp] = None):
+        self.root = pathlib.Path(root)
+        self.as_of = as_of
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, ticker: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            if ticker not in self._frames:
+                path = self.root / f"{ticker.upper()}.csv"
+                if not path.exists():
+                    return None
+                self._frames[ticker] = normalize_ohlcv(pd.read_csv(path), ticker)
+            return self._frames[ticker]
+
+    def history(self, tickers, start=None, period=None, interval="1d"):
+        from .price_store import period_start
+
+        out: Dict[str, pd.DataFrame] = {}
+        for t in dict.fromkeys(tickers):
+            df = self._load(t)
+            if df is None or df.empty:
+                continue
+            if self.as_of is not None:
+                df = df[df.index <= self.as_of]
+            if start is not None:
+                df = df[df.index >= start]
+            elif period and len(df):
+                begin = period_start(period, df.index[-1])
+                if begin is not None:
+                    df = df[df.index >= begin]
+            if not df.empty:
+                out[t] = df.copy()
+        return out
+
+
+def save_fixture(df: pd.DataFrame, root: pathlib.Path, ticker: str) -> pathlib.Path:
+    """把标准 OHLCV df 写成 FixtureProvider 能读的 CSV（用于录制线上数据做离线回放）。"""
+    root = pathlib.Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / f"{ticker.upper()}.csv"
+    normalize_ohlcv(df, ticker).to_csv(path, index_label="Date")
+    return path
+
+
+_PROVIDER: Optional[MarketDataProvider] = None
+
+
+def get_provider() -> MarketDataProvider:
+    global _PROVIDER
+    if _PROVIDER is None:
+        kind = os.getenv("MARKET_PROVIDER", "yfinance").lower()
+        if kind == "fixture":
+            _PROVIDER = FixtureProvider(pathlib.Path(os.getenv("MARKET_FIXTURE_DIR", "data/fixtures/prices")))
+        else:
+            _PROVIDER = YFinanceProvider()
+    return _PROVIDER
+
+
+def set_provider(provider: MarketDataProvider) -> None:
+    global _PROVIDER
+    _PROVIDER = provider
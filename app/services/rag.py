@@ -2,28 +2,63 @@
 """
 非常轻量的 RAG：
 - 用 RSS 的 title/summary 当作文本来源（不抓整篇网页，足够演示）
-- 用 OpenAI Embeddings + 本地 FAISS 建库
+- 用 OpenAI Embeddings + 全局向量索引建库（所有 ticker 共用，按 ticker / 时间窗口过滤检索）
 - 检索时返回 {source, url, summary} 作为可引用的证据
 """
 
 import os
+import time
+import hashlib
+import logging
 import pathlib
-from typing import List, Dict, Any
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
 
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
-from langchain.docstore.document import Document
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-DATA_DIR = pathlib.Path("data/faiss")
-DATA_DIR.mkdir(parents=True, exist_ok=True)
+from .embed_cache import CachedEmbeddings, SQLiteEmbeddingCache
+from .metrics import span
+from .vector_index import GlobalVectorIndex
+from .workers import WORKER_LEADER, multi_worker
 
 EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")  # 成本低、够用
 
+logger = logging.getLogger("services.rag")
 
-def _embedder() -> OpenAIEmbeddings:
-    # 读取 OPENAI_API_KEY 环境变量
-    return OpenAIEmbeddings(model=EMBED_MODEL)
+
+_EMBEDDER: Optional[Embeddings] = None
+
+
+def _embed_model_id() -> str:
+    # 缓存 key / 向量索引都按它区分模型；fake embedding 与真实模型分开
+    if os.getenv("EMBED_PROVIDER", "openai").lower() == "fake":
+        return f"fake-{int(os.getenv('EMBED_FAKE_DIM', '256'))}"
+    return EMBED_MODEL
+
+
+def _embedder() -> Embeddings:
+    # 读取 OPENAI_API_KEY 环境变量；进程内复用同一个客户端
+    # 外面包一层内容寻址缓存：同一段文本（不论属于哪个 ticker）只 embed 一次
+    # EMBED_PROVIDER=fake：确定性的假 embedding（按文本哈希），离线测试 / 压测用
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        model = _embed_model_id()
+        if os.getenv("EMBED_PROVIDER", "openai").lower() == "fake":
+            inner = DeterministicFakeEmbedding(size=int(os.getenv("EMBED_FAKE_DIM", "256")))
+        else:
+            from langchain_openai import OpenAIEmbeddings  # 只在真正用 OpenAI embedding 时才导入
+
+            inner = OpenAIEmbeddings(model=EMBED_MODEL)
+        if os.getenv("EMBED_CACHE_ENABLED", "1") == "0":
+            _EMBEDDER = inner
+        else:
+            cache = SQLiteEmbeddingCache(pathlib.Path(os.getenv("EMBED_CACHE_PATH", "data/embeddings.sqlite3")))
+            _EMBEDDER = CachedEmbeddings(inner, model, cache)
+    return _EMBEDDER
 
 
 def _docs_from_headlines(ticker: str, headlines: List[Dict[str, Any]]) -> List[Document]:
@@ -48,51 +83,147 @@ def _docs_from_headlines(ticker: str, headlines: List[Dict[str, Any]]) -> List[D
     return docs
 
 
+_SPLITTER = RecursiveCharacterTextSplitter(chunk_size=600, chunk_overlap=80)
+
+
 def _chunk(docs: List[Document]) -> List[Document]:
     # 轻量切分（title+summary )
-    splitter = RecursiveCharacterTextSplitter(chunk_size=600, chunk_overlap=80)
-    return splitter.split_documents(docs)
+    return _SPLITTER.split_documents(docs)
+
+
+def _published_ts(published: Any) -> int:
+    # published 为 ISO 字符串；缺失 / 无法解析时用入库时间代替，保证时间窗口过滤仍然可用
+    if published:
+        try:
+            dt = datetime.fromisoformat(str(published).replace("Z", "+00:00"))
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            return int(dt.timestamp())
+        except ValueError:
+            pass
+    return int(time.time())
+
+
+def _records_from_chunks(chunks: List[Document]) -> List[Dict[str, Any]]:
+    records = []
+    for d in chunks:
+        md = d.metadata or {}
+        url = md.get("url", "") or ""
+        records.append({
+            # 同一 url 下的同一段文本只存一份，与 ticker 无关
+            "key": hashlib.sha1(f"{url}\0{d.page_content}".encode("utf-8")).hexdigest(),
+            "url": url,
+            "source": md.get("source", "") or "",
+            "title": md.get("title", "") or "",
+            "text": d.page_content,
+            "published_ts": _published_ts(md.get("published")),
+        })
+    return records
+
 
+_VECTOR_INDEX_PATH = pathlib.Path(os.getenv("VECTOR_INDEX_PATH", "data/vindex/index.npz"))
+# 多 worker：只有 leader 落盘，其它 worker 的新增经 outbox 交给它
+VECTOR_INDEX = GlobalVectorIndex(
+    _VECTOR_INDEX_PATH,
+    mode=os.getenv("VECTOR_INDEX_MODE", "hnsw"),
+    ann_threshold=int(os.getenv("VECTOR_INDEX_ANN_THRESHOLD", "20000")),
+    is_writer=WORKER_LEADER.try_acquire if multi_worker() else None,
+    outbox_path=_VECTOR_INDEX_PATH.with_suffix(".outbox.sqlite3") if multi_worker() else None,
+    model=_embed_model_id(),
+)
 
-def _index_path(ticker: str) -> pathlib.Path:
-    return DATA_DIR / f"faiss_{ticker.upper()}"
+_QVECS: "OrderedDict[str, List[float]]" = OrderedDict()
+_QVECS_LOCK = threading.Lock()
+_QVECS_MAX = 256
+
+
+def _query_vector(query: str) -> List[float]:
+    # 检索 query 的向量 LRU 缓存；固定的风险 query 命中后检索只剩一次内存内积 / ANN
+    with _QVECS_LOCK:
+        vec = _QVECS.get(query)
+        if vec is not None:
+            _QVECS.move_to_end(query)
+            return vec
+    with span("embedding"):
+        vec = _embedder().embed_query(query)
+    with _QVECS_LOCK:
+        _QVECS[query] = vec
+        while len(_QVECS) > _QVECS_MAX:
+            _QVECS.popitem(last=False)
+    return vec
+
+
+def _max_age_days() -> Optional[float]:
+    v = os.getenv("RAG_MAX_AGE_DAYS", "14")
+    return float(v) if v else None
+
+
+def _min_score() -> Optional[float]:
+    # 余弦分数的下限；默认不设：text-embedding-3-small 下风险 query 与 headline 的分数常在 0.2~0.4，
+    # fake embedding 更是接近 0，固定阈值很容易把证据全部滤掉
+    v = os.getenv("RAG_MIN_SCORE", "")
+    try:
+        return float(v) if v else None
+    except ValueError:
+        return None
+
+
+def risk_query(ticker: str) -> str:
+    # 简单把近期“风险相关”关键词放入查询（也可根据 indicators 动态拼接）
+    return f"{ticker} stock risks volatility earnings regulation macro AI rout"
 
 
 def index_headlines(ticker: str, headlines: List[Dict[str, Any]]) -> None:
     docs = _docs_from_headlines(ticker, headlines)
     if not docs:
         return
-    chunks = _chunk(docs)
-    path = _index_path(ticker)
-
-    emb = _embedder()
-    if path.exists():
-        vs = FAISS.load_local(str(path), emb, allow_dangerous_deserialization=True)
-        # 按 url 去重（只示例一种简单做法）
-        existing = { (d.metadata or {}).get("url") for d in vs.docstore._dict.values() }
-        new_chunks = [d for d in chunks if (d.metadata or {}).get("url") not in existing]
-        if not new_chunks:
-            return
-        vs.add_documents(new_chunks, embedding=emb)
-    else:
-        vs = FAISS.from_documents(chunks, emb)
-    vs.save_local(str(path))
-
-
-def search_evidences(ticker: str, query: str, k: int = 5, min_score: float = 0.3) -> List[Dict[str, Any]]:
-    path = _index_path(ticker)
-    if not path.exists():
-        return []
-    vs = FAISS.load_local(str(path), _embedder(), allow_dangerous_deserialization=True)
-    docs_scores = vs.similarity_search_with_score(query, k=k)
+    with span("chunking"):
+        records = _records_from_chunks(_chunk(docs))
+    VECTOR_INDEX.add(records, [ticker], _embed_documents)
+
+
+def _embed_documents(texts: List[str]) -> List[List[float]]:
+    # 只有索引里没有的新 chunk 才会走到这里
+    with span("embedding"):
+        return _embedder().embed_documents(texts)
+
+
+def search_evidences(
+    ticker: str,
+    query: str,
+    k: int = 5,
+    min_score: Optional[float] = None,
+    as_of: Optional[datetime] = None,
+    max_age_days: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    在全局索引里只检索被 ticker 标记过、且发布时间落在 [as_of - max_age_days, as_of) 内的 chunk。
+    分数是余弦相似度（越大越相似），低于 min_score（默认取 RAG_MIN_SCORE，未设置则不过滤）的丢弃。
+    """
+    min_score = _min_score() if min_score is None else min_score
+    max_age_days = _max_age_days() if max_age_days is None else max_age_days
+    until_ts = int(as_of.timestamp()) if as_of is not None else None
+    ref = until_ts if until_ts is not None else int(time.time())
+    since_ts = ref - int(max_age_days * 86400) if max_age_days else None
+
+    qvec = _query_vector(query)
+    with span("vector_search"):
+        hits = VECTOR_INDEX.search(qvec, k=k, ticker=ticker, since_ts=since_ts, until_ts=until_ts)
     out = []
-    for d, score in docs_scores:
-        # score 越小越相似（FAISS 的距离），可按需要换成阈值判断
-        # 这里用一个简单过滤：如果向量库实现返回的是余弦相似度，就改成 score >= min_score
-        md = d.metadata or {}
+    for md, score in hits:
+        if min_score is not None and score < min_score:
+            continue
         out.append({
             "source": md.get("source", "") or "",
             "url": md.get("url", "") or "",
-            "summary": d.page_content[:240].replace("\n", " ").strip(),
+            "title": md.get("title", "") or "",
+            "summary": md.get("text", "")[:240].replace("\n", " ").strip(),
+            "score": score,
+            "published_ts": md.get("published_ts", 0),
         })
+    if hits and not out:
+        logger.warning(
+            "All %d evidence hits for %s scored below min_score=%.3f (best %.3f); evidence is empty",
+            len(hits), ticker, min_score, max(s for _, s in hits),
+        )
     return out
@@ -0,0 +1,303 @@
+# app/services/relevance.py
+"""
+headline 与 ticker 的相关性过滤（位于 RSS 抓取与 RAG 入库之间）：
+- 一个 Aho-Corasick 自动机覆盖所有 ticker 的代码与公司别名，一次扫描 title + summary 得到命中的 ticker 集合
+  * 多词别名（Tim Cook、Home Depot）大小写不敏感；单词别名（Apple、Uber、Oracle…）常常也是普通英文单词，
+    要求首字母与词典写法一致或整词大写（"Uber" / "UBER" 算，"uber-wealthy" / "apple pie" 不算）
+  * 代码区分大小写，短代码或像英文单词的代码（V、MA、COST…）只认 $V / (V) / NYSE:V 这类写法
+  * 命中结果按 url 缓存，后台 store 里的同一条 headline 只扫描一次
+- select_relevant(ticker, pool)：只保留提到该 ticker 的条目（标题命中优先），
+  太少时用最新的市场新闻补足 RELEVANCE_FALLBACK_ITEMS 条，保证 prompt 里还有宏观背景；
+  split_relevant 把命中条目与补足条目分开返回，只有命中条目入 RAG 索引
+- 别名词典：内置常见大盘股，TICKER_ALIASES_PATH 指向的 JSON（{"TSLA": ["Tesla", ...]}）可追加 / 覆盖
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("services.relevance")
+
+_ALIASES: Dict[str, List[str]] = {
+    "AAPL": ["Apple", "iPhone", "Tim Cook"],
+    "MSFT": ["Microsoft", "Azure", "Satya Nadella"],
+    "TSLA": ["Tesla", "Elon Musk", "Cybertruck"],
+    "NVDA": ["Nvidia", "Jensen Huang"],
+    "AMZN": ["Amazon", "AWS", "Andy Jassy"],
+    "GOOGL": ["Alphabet", "Google", "GOOG", "YouTube"],
+    "GOOG": ["Alphabet", "Google", "GOOGL", "YouTube"],
+    "META": ["Meta Platforms", "Facebook", "Instagram", "WhatsApp", "Zuckerberg"],
+    "JPM": ["JPMorgan", "JP Morgan", "J.P. Morgan", "Jamie Dimon"],
+    "XOM": ["Exxon", "ExxonMobil", "Exxon Mobil"],
+    "UNH": ["UnitedHealth", "UnitedHealthcare"],
+    "V": ["Visa Inc"],
+    "JNJ": ["Johnson & Johnson", "J&J"],
+    "WMT": ["Walmart"],
+    "PG": ["Procter & Gamble", "P&G"],
+    "MA": ["Mastercard"],
+    "HD": ["Home Depot"],
+    "CVX": ["Chevron"],
+    "KO": ["Coca-Cola", "Coca Cola"],
+    "PEP": ["PepsiCo", "Pepsi"],
+    "COST": ["Costco"],
+    "NFLX": ["Netflix"],
+    "AMD": ["Advanced Micro Devices", "Lisa Su"],
+    "INTC": ["Intel"],
+    "AVGO": ["Broadcom"],
+    "ORCL": ["Oracle"],
+    "CRM": ["Salesforce"],
+    "DIS": ["Disney"],
+    "BA": ["Boeing"],
+    "BRK-B": ["Berkshire Hathaway", "Warren Buffett", "BRK.B"],
+    "GS": ["Goldman Sachs"],
+    "BAC": ["Bank of America"],
+    "PFE": ["Pfizer"],
+    "LLY": ["Eli Lilly"],
+    "UBER": ["Uber"],
+    "PLTR": ["Palantir"],
+}
+
+# 直接出现在正文里就算数会误报太多的代码（英文单词 / 常见缩写）
+_WORDLIKE = {"COST", "PEP", "ALL", "NOW", "ARE", "IT", "ON", "A", "T", "F", "C", "GS", "BA", "MA", "HD", "KO", "PG", "V",
+             "DIS", "AI", "CEO", "USA", "GDP", "CPI", "FED", "IPO", "ETF", "SEC", "EPS", "UBER"}
+_SYMBOL_PREFIXES = ("$", "NYSE:", "NYSE: ", "NASDAQ:", "NASDAQ: ", "Nasdaq:", "Nasdaq: ")
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class AhoCorasick:
+    """多模式子串匹配：构建 O(Σ|pattern|)，扫描 O(|text| + 命中数)，与模式数量无关。"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]  # (模式长度, payload)
+        for pat, payload in patterns:
+            if pat:
+                self._insert(pat, payload)
+        self._build()
+
+    def _insert(self, pat: str, payload: Any) -> None:
+        node = 0
+        for ch in pat:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pat), payload))
+
+    def _build(self) -> None:
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter(self, text: str) -> Iterable[Tuple[int, int, Any]]:
+        """产出 (start, end, payload)，text[start:end] 为命中的模式。"""
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for n, payload in out[node]:
+                yield i + 1 - n, i + 1, payload
+
+
+class TickerMatcher:
+    def __init__(self, aliases: Dict[str, List[str]], cache_size: int = 20000):
+        self.tickers = frozenset(t.upper() for t in aliases)
+        patterns: List[Tuple[str, Any]] = []
+        for ticker, names in aliases.items():
+            t = ticker.upper()
+            # payload: (ticker, 代码写法 或 None, 需要核对大小写的单词别名 或 None)
+            patterns.append((t.lower(), (t, t, None)))
+            for name in names:
+                if name.isupper() and name.replace(".", "").replace("-", "").isalnum():
+                    patterns.append((name.lower(), (t, name, None)))  # 另一种代码写法（GOOG / BRK.B）按代码处理
+                elif " " in name.strip():
+                    patterns.append((name.lower(), (t, None, None)))
+                else:
+                    patterns.append((name.lower(), (t, None, name)))
+        self._ac = AhoCorasick(patterns)
+        self._cache: "OrderedDict[str, FrozenSet[Tuple[str, str]]]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _symbol_ok(text: str, start: int, end: int, symbol: str) -> bool:
+        if text[start:end] != symbol:  # 代码必须是大写原文
+            return False
+        if symbol not in _WORDLIKE and len(symbol) >= 3:
+            return True
+        before = text[max(0, start - 8):start]
+        if before.endswith(_SYMBOL_PREFIXES):
+            return True
+        return start > 0 and text[start - 1] == "(" and end < len(text) and text[end] == ")"
+
+    @staticmethod
+    def _alias_ok(text: str, start: int, end: int, alias: str) -> bool:
+        span = text[start:end]
+        return span[0] == alias[0] or span.isupper()
+
+    def match(self, text: str) -> Set[str]:
+        """text 里提到的 ticker 集合。"""
+        if not text:
+            return set()
+        low = text.lower()
+        n = len(text)
+        found: Set[str] = set()
+        for start, end, (ticker, symbol, alias) in self._ac.iter(low):
+            if ticker in found:
+                continue
+            if (start > 0 and _is_word_char(low[start - 1])) or (end < n and _is_word_char(low[end])):
+                continue
+            if symbol is not None and not self._symbol_ok(text, start, end, symbol):
+                continue
+            if alias is not None and not self._alias_ok(text, start, end, alias):
+                continue
+            found.add(ticker)
+        return found
+
+    def match_item(self, item: Dict[str, Any]) -> FrozenSet[Tuple[str, str]]:
+        """一条 headline 命中的 {(ticker, "title"|"summary")}；按 url 缓存。"""
+        url = item.get("url") or ""
+        if url:
+            with self._lock:
+                hit = self._cache.get(url)
+                if hit is not None:
+                    self._cache.move_to_end(url)
+                    return hit
+        title = self.match(item.get("title") or "")
+        summary = self.match(item.get("summary") or "") - title
+        hit = frozenset([(t, "title") for t in title] + [(t, "summary") for t in summary])
+        if url:
+            with self._lock:
+                self._cache[url] = hit
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return hit
+
+
+def _load_aliases() -> Dict[str, List[str]]:
+    aliases = {k: list(v) for k, v in _ALIASES.items()}
+    path = os.getenv("TICKER_ALIASES_PATH")
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                for t, names in json.load(f).items():
+                    aliases[t.upper()] = list(names)
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load ticker aliases from %s: %r", path, e)
+    return aliases
+
+
+_MATCHER: Optional[TickerMatcher] = None
+_MATCHER_LOCK = threading.Lock()
+
+
+def get_matcher() -> TickerMatcher:
+    global _MATCHER
+    if _MATCHER is None:
+        with _MATCHER_LOCK:
+            if _MATCHER is None:
+                _MATCHER = TickerMatcher(_load_aliases())
+    return _MATCHER
+
+
+def _matcher_for(ticker: str) -> TickerMatcher:
+    # 词典之外的 ticker 只按代码本身匹配（单独建一个小自动机）
+    m = get_matcher()
+    return m if ticker in m.tickers else _adhoc_matcher(ticker)
+
+
+_ADHOC: "OrderedDict[str, TickerMatcher]" = OrderedDict()
+
+
+def _adhoc_matcher(ticker: str) -> TickerMatcher:
+    with _MATCHER_LOCK:
+        m = _ADHOC.get(ticker)
+        if m is None:
+            m = _ADHOC[ticker] = TickerMatcher({ticker: []}, cache_size=2000)
+            while len(_ADHOC) > 256:
+                _ADHOC.popitem(last=False)
+        return m
+
+
+def _fallback_items() -> int:
+    try:
+        return max(0, int(os.getenv("RELEVANCE_FALLBACK_ITEMS", "3")))
+    except ValueError:
+        return 3
+
+
+def split_relevant(
+    ticker: str,
+    pool: List[Dict[str, Any]],
+    limit: int = 8,
+    fallback: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    pool 按时间倒序。返回 (matched, padding)：matched 是提到 ticker 的条目（标题命中在前，同档按时间），
+    最多 limit 条；不足 fallback 条时 padding 是用来补足的、pool 里最新的其它条目。
+    padding 只给 prompt 当宏观背景，不能以该 ticker 的名义入向量索引。
+    """
+    ticker = ticker.upper()
+    fallback = _fallback_items() if fallback is None else fallback
+    matcher = _matcher_for(ticker)
+    in_title: List[Dict[str, Any]] = []
+    in_summary: List[Dict[str, Any]] = []
+    for it in pool:
+        hit = matcher.match_item(it)
+        if (ticker, "title") in hit:
+            in_title.append(it)
+        elif (ticker, "summary") in hit:
+            in_summary.append(it)
+    matched = (in_title + in_summary)[:limit]
+    padding: List[Dict[str, Any]] = []
+    if len(matched) < fallback:
+        seen = {it.get("url") for it in matched}
+        for it in pool:
+            if len(matched) + len(padding) >= min(fallback, limit):
+                break
+            if it.get("url") not in seen:
+                padding.append(it)
+    return matched, padding
+
+
+def select_relevant(
+    ticker: str,
+    pool: List[Dict[str, Any]],
+    limit: int = 8,
+    fallback: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """split_relevant 的两部分拼在一起（prompt 用）。"""
+    matched, padding = split_relevant(ticker, pool, limit, fallback)
+    return matched + padding
+
+
+def ticker_feed_templates() -> List[str]:
+    """TICKER_FEED_TEMPLATES：逗号分隔、含 {ticker} 占位符的 RSS 地址（例如个股新闻源），默认不启用。"""
+    return [u.strip() for u in os.getenv("TICKER_FEED_TEMPLATES", "").split(",") if "{ticker}" in u]
+
+
+def ticker_feeds(ticker: str) -> List[str]:
+    return [u.replace("{ticker}", ticker.upper()) for u in ticker_feed_templates()]
@@ -0,0 +1,262 @@
+# app/services/report_archive.py
+"""
+报告归档（列式，Parquet）：每个新组装的 LLMReport 追加一行，供 /reports 查询历史，不再为看历史重新跑 LLM。
+
+- 目录按 hive 风格分区：<root>/date=YYYY-MM-DD/ticker=XXX/part-*.parquet
+- 扁平列：指标、viewpoint、confidence、风险名 / 严重度、证据 URL、新闻 URL，外加整份报告的 JSON
+  （只在需要完整报告时才读这一列）
+- 写入先进内存缓冲，后台线程每 REPORT_ARCHIVE_FLUSH_SEC 秒按分区各写一个文件（写临时文件再 os.replace）；
+  多 worker 时文件名带 pid，互不覆盖；旧日期分区的小文件由 leader 合并成一个
+- 查询用 pyarrow.dataset：ticker / 日期条件先裁剪分区目录，再按 row group 统计过滤，只读请求的列；
+  还没落盘的缓冲行一并返回
+- pyarrow 没装或 REPORT_ARCHIVE_ENABLED=0 时归档关闭（append 为空操作，查询返回空）
+"""
+
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from .workers import WORKER_LEADER
+
+logger = logging.getLogger("services.report_archive")
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # 可选依赖：没有 pyarrow 时不归档
+    pa = None
+
+INDICATOR_COLUMNS = ["price", "change_pct_1d", "volume_zscore", "volatility_20d", "gap_open_pct"]
+SUMMARY_COLUMNS = [
+    "ticker", "date", "generated_at", *INDICATOR_COLUMNS, "viewpoint", "confidence",
+    "risk_names", "risk_severities", "evidence_urls", "news_urls",
+]
+
+
+def _schema() -> "pa.Schema":
+    return pa.schema(
+        [("generated_at", pa.timestamp("us", tz="UTC"))]
+        + [(c, pa.float64()) for c in INDICATOR_COLUMNS]
+        + [
+            ("viewpoint", pa.string()),
+            ("confidence", pa.float64()),
+            ("risk_names", pa.list_(pa.string())),
+            ("risk_severities", pa.list_(pa.string())),
+            ("evidence_urls", pa.list_(pa.string())),
+            ("news_urls", pa.list_(pa.string())),
+            ("report_json", pa.string()),
+        ]
+    )
+
+
+_PARTITION_FIELDS = [("date", "date32"), ("ticker", "string")]
+
+
+def _partitioning() -> "ds.Partitioning":
+    return ds.partitioning(pa.schema([(n, getattr(pa, t)()) for n, t in _PARTITION_FIELDS]), flavor="hive")
+
+
+def _full_schema() -> "pa.Schema":
+    # 文件里的列 + 目录名里的分区列
+    schema = _schema()
+    for n, t in _PARTITION_FIELDS:
+        schema = schema.append(pa.field(n, getattr(pa, t)()))
+    return schema
+
+
+def _row(report: Any) -> Dict[str, Any]:
+    try:
+        generated = datetime.fromisoformat(report.date)
+    except ValueError:
+        generated = datetime.now(timezone.utc)
+    if generated.tzinfo is None:
+        generated = generated.replace(tzinfo=timezone.utc)
+    generated = generated.astimezone(timezone.utc)
+    risks = report.thesis.risks
+    return {
+        "ticker": report.ticker.upper(),
+        "date": generated.date(),
+        "generated_at": generated,
+        **{c: float(getattr(report.indicators, c)) for c in INDICATOR_COLUMNS},
+        "viewpoint": report.thesis.viewpoint,
+        "confidence": float(report.thesis.confidence_0_1),
+        "risk_names": [r.name for r in risks],
+        "risk_severities": [r.severity for r in risks],
+        "evidence_urls": list(dict.fromkeys(e.url for r in risks for e in r.evidences if e.url)),
+        "news_urls": [n.url for n in report.top_news if n.url],
+        "report_json": report.model_dump_json(),
+    }
+
+
+class ReportArchive:
+    def __init__(self, root: pathlib.Path, enabled: bool = True, max_buffer: int = 1000):
+        self.root = pathlib.Path(root)
+        self.enabled = enabled and pa is not None
+        self.max_buffer = max_buffer
+        self._buf: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._seq = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"appended": 0, "flushed": 0, "files": 0, "compactions": 0, "write_errors": 0}
+        if enabled and pa is None:
+            logger.warning("pyarrow is not installed; report archive disabled")
+
+    # ---------- 写 ----------
+    def append(self, report: Any) -> None:
+        if not self.enabled:
+            return
+        row = _row(report)
+        with self._lock:
+            self._buf.append(row)
+            self.stats["appended"] += 1
+            full = len(self._buf) >= self.max_buffer
+        if full:
+            self.flush()
+
+    def _write_table(self, directory: pathlib.Path, table: "pa.Table", name: str) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp = directory / f".{name}.tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, directory / name)
+
+    def flush(self) -> int:
+        """把缓冲按 (date, ticker) 分区各写成一个 parquet 文件，返回写出的行数。"""
+        with self._lock:
+            rows, self._buf = self._buf, []
+        if not rows:
+            return 0
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for r in rows:
+            groups.setdefault((r["date"], r["ticker"]), []).append(r)
+        schema = _schema()
+        with self._write_lock:
+            for (d, ticker), part in groups.items():
+                self._seq += 1
+                name = f"part-{int(time.time() * 1000)}-{os.getpid()}-{self._seq}.parquet"
+                try:
+                    table = pa.Table.from_pylist(part, schema=schema)
+                    self._write_table(self.root / f"date={d.isoformat()}" / f"ticker={ticker}", table, name)
+                    self.stats["files"] += 1
+                    self.stats["flushed"] += len(part)
+                except Exception:
+                    # 写失败的行放回缓冲，下次再试
+                    self.stats["write_errors"] += 1
+                    logger.exception("Report archive write failed for %s/%s", d, ticker)
+                    with self._lock:
+                        self._buf[:0] = part
+        return len(rows)
+
+    def compact(self, before: Optional[date] = None) -> int:
+        """把 before（默认今天，UTC）之前的日期分区里的多个小文件合并成一个，返回合并的分区数。"""
+        before = before or datetime.now(timezone.utc).date()
+        merged = 0
+        with self._write_lock:
+            for day_dir in sorted(self.root.glob("date=*")):
+                try:
+                    if date.fromisoformat(day_dir.name[len("date="):]) >= before:
+                        continue
+                except ValueError:
+                    continue
+                for part_dir in day_dir.glob("ticker=*"):
+                    files = sorted(part_dir.glob("part-*.parquet"))
+                    if len(files) < 2:
+                        continue
+                    table = pa.concat_tables([pq.read_table(f, schema=_schema()) for f in files])
+                    table = table.sort_by("generated_at")
+                    self._write_table(part_dir, table, f"part-compacted-{int(time.time() * 1000)}-{os.getpid()}.parquet")
+                    for f in files:
+                        f.unlink(missing_ok=True)
+                    merged += 1
+        self.stats["compactions"] += merged
+        return merged
+
+    # ---------- 查 ----------
+    def query(
+        self,
+        ticker: Optional[str] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        columns: Optional[Sequence[str]] = None,
+        limit: int = 500,
+    ) -> List[Dict[str, Any]]:
+        """按 ticker / [start, end] 日期过滤，按生成时间倒序返回最多 limit 行（columns 为要读的列）。"""
+        if not self.enabled:
+            return []
+        columns = list(columns or SUMMARY_COLUMNS)
+        schema = _full_schema()
+        tables = []
+        if self.root.exists():
+            # 临时文件以 "." 开头，默认被 dataset 忽略
+            dataset = ds.dataset(self.root, format="parquet", schema=schema, partitioning=_partitioning())
+            expr = None
+            for cond in (
+                ds.field("ticker") == ticker.upper() if ticker else None,
+                ds.field("date") >= pa.scalar(start, pa.date32()) if start else None,
+                ds.field("date") <= pa.scalar(end, pa.date32()) if end else None,
+            ):
+                if cond is not None:
+                    expr = cond if expr is None else expr & cond
+            tables.append(dataset.to_table(columns=columns, filter=expr))
+        with self._lock:
+            pending = [
+                r for r in self._buf
+                if (not ticker or r["ticker"] == ticker.upper())
+                and (not start or r["date"] >= start)
+                and (not end or r["date"] <= end)
+            ]
+        if pending:
+            tables.append(pa.Table.from_pylist(pending, schema=schema).select(columns))
+        if not tables:
+            return []
+        table = pa.concat_tables(tables)
+        if "generated_at" in table.column_names and table.num_rows:
+            table = table.take(pc.sort_indices(table, sort_keys=[("generated_at", "descending")]))
+        return table.slice(0, limit).to_pylist()
+
+    # ---------- 后台落盘 ----------
+    def _run(self, interval: float, compact_every: float) -> None:
+        last_compact = 0.0
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+                if time.monotonic() - last_compact > compact_every and WORKER_LEADER.try_acquire():
+                    self.compact()
+                    last_compact = time.monotonic()
+            except Exception:
+                logger.exception("Report archive flush failed")
+
+    def start(self, flush_interval: float = 10.0, compact_every: float = 3600.0) -> None:
+        if self.enabled and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(flush_interval, compact_every), name="report-archive", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+
+def report_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """query(columns=[..., "report_json"]) 的一行 -> 完整报告 dict。"""
+    return json.loads(row["report_json"])
+
+
+# 进程级单例
+REPORT_ARCHIVE = ReportArchive(
+    pathlib.Path(os.getenv("REPORT_ARCHIVE_DIR", "data/reports")),
+    enabled=os.getenv("REPORT_ARCHIVE_ENABLED", "1") != "0",
+)
@@ -0,0 +1,151 @@
+# app/services/scheduler.py
+"""
+watchlist 预计算：在 FastAPI lifespan 里启动的后台任务，按固定节奏为配置的 ticker 刷新
+行情 -> headlines / RAG 索引 -> thesis，并把组装好的 LLMReport 写进 REPORT_CACHE 的 "thesis" 阶段，
+/analyze/{ticker} 对这些 ticker 直接命中缓存。
+
+- 行情一轮只下载一次（fetch_price_panel 的多 ticker 批量请求），对上游限流最友好
+- 之后每个 ticker 错开 WATCHLIST_STAGGER_SEC 启动，最多 WATCHLIST_CONCURRENCY 个同时跑
+- 刷新期间旧报告继续对外服务；新报告算完后原地替换（缓存里没有时走 single-flight，和用户请求合并）
+- 报告的 TTL 至少覆盖两个刷新周期，刷新失败一次也不会让 watchlist 掉回冷启动
+- 多 worker 时只有 leader（WORKER_LEADER）跑预计算，结果经共享缓存层给其它 worker；leader 退出后下一轮由别的 worker 接手
+
+环境变量：WATCHLIST（逗号分隔，空则不启用）、WATCHLIST_REFRESH_SEC、WATCHLIST_CONCURRENCY、WATCHLIST_STAGGER_SEC
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from .cache import REPORT_CACHE
+from .market import fetch_price_panel
+from .metrics import record_error, span
+from .pipeline import _timeout, run_analysis
+from .poller import HEADLINE_STORE
+from .workers import WORKER_LEADER
+
+logger = logging.getLogger("services.scheduler")
+
+
+class WatchlistScheduler:
+    def __init__(
+        self,
+        tickers: List[str],
+        interval_sec: float = 300.0,
+        concurrency: int = 2,
+        stagger_sec: float = 1.0,
+        headline_wait_sec: float = 10.0,
+    ):
+        self.tickers = list(dict.fromkeys(t.strip().upper() for t in tickers if t.strip()))
+        self.interval_sec = interval_sec
+        self.concurrency = max(1, concurrency)
+        self.stagger_sec = stagger_sec
+        self.headline_wait_sec = headline_wait_sec
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.stats: Dict[str, Any] = {
+            "cycles": 0, "skipped": 0, "refreshed": 0, "failed": 0, "last_cycle_sec": None, "last_cycle_at": None,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tickers)
+
+    def _report_ttl(self) -> int:
+        return int(max(REPORT_CACHE.ttls.get("thesis", 0), 2 * self.interval_sec))
+
+    async def _refresh_prices(self) -> None:
+        frames = await asyncio.wait_for(asyncio.to_thread(fetch_price_panel, self.tickers), _timeout("batch_market"))
+        for t, df in frames.items():
+            # 行情按 prices 阶段自己的 TTL（CACHE_TTL_PRICES）存；_report_ttl 只用于 thesis
+            await REPORT_CACHE.aset("prices", t, df)
+
+    async def _refresh_one(self, ticker: str) -> None:
+        # 证据要跟着最新 headlines 重新检索；行情已经在本轮批量刷新过
+        await asyncio.to_thread(REPORT_CACHE.invalidate, "evidences", ticker)
+        if await asyncio.to_thread(REPORT_CACHE.peek, "thesis", ticker) is None:
+            await REPORT_CACHE.aget_or_compute("thesis", ticker, lambda: run_analysis(ticker), ttl=self._report_ttl())
+        else:
+            await REPORT_CACHE.aset("thesis", ticker, await run_analysis(ticker), ttl=self._report_ttl())
+
+    async def run_once(self) -> int:
+        """刷新一轮，返回成功的 ticker 数。"""
+        t0 = time.perf_counter()
+        # 启动后的第一轮：等轮询器拿到第一批 headlines，否则报告里没有新闻
+        deadline = time.monotonic() + self.headline_wait_sec
+        while not HEADLINE_STORE.ready and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+
+        try:
+            with span("precompute_prices"):
+                await self._refresh_prices()
+        except Exception as e:
+            # 批量行情失败时各 ticker 仍按单只拉取兜底
+            logger.warning("Watchlist price refresh failed: %r", e)
+            record_error("precompute", e)
+
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def _one(i: int, ticker: str) -> bool:
+            await asyncio.sleep(i * self.stagger_sec)
+            async with sem:
+                try:
+                    with span("precompute"):
+                        await self._refresh_one(ticker)
+                    return True
+                except Exception as e:
+                    logger.warning("Watchlist refresh failed for %s: %r", ticker, e)
+                    record_error("precompute", e)
+                    return False
+
+        results = await asyncio.gather(*(_one(i, t) for i, t in enumerate(self.tickers)))
+        ok = sum(results)
+        self.stats["cycles"] += 1
+        self.stats["refreshed"] += ok
+        self.stats["failed"] += len(results) - ok
+        self.stats["last_cycle_sec"] = round(time.perf_counter() - t0, 3)
+        self.stats["last_cycle_at"] = time.time()
+        logger.info("Watchlist refreshed %d/%d tickers in %.1fs", ok, len(results), self.stats["last_cycle_sec"])
+        return ok
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                if WORKER_LEADER.try_acquire():
+                    await self.run_once()
+                else:
+                    self.stats["skipped"] += 1
+            except Exception:
+                logger.exception("Watchlist scheduler loop error")
+            # 按固定节奏：本轮耗时算在间隔里
+            await asyncio.sleep(max(0.0, self.interval_sec - (time.monotonic() - started)))
+
+    def start(self) -> None:
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+WATCHLIST_SCHEDULER = WatchlistScheduler(
+    os.getenv("WATCHLIST", "").split(","),
+    interval_sec=_env_float("WATCHLIST_REFRESH_SEC", 300.0),
+    concurrency=int(_env_float("WATCHLIST_CONCURRENCY", 2)),
+    stagger_sec=_env_float("WATCHLIST_STAGGER_SEC", 1.0),
+)
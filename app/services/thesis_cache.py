@@ -0,0 +1,235 @@
+# app/services/thesis_cache.py
+"""
+按输入指纹缓存 LLM 生成的 thesis：
+- 指纹 = ticker + 量化后的指标 + 进入 prompt 的 headline URL 集合 + evidence URL 集合
+  （调用方传入的是 prompt_builder 按 token 预算打包后的条目）
+  指标只差几个基点时量化结果相同，直接复用上一次的 thesis，不再调用 LLM
+- 可选“足够接近”策略（THESIS_CACHE_NEAR=1）：URL 集合完全相同、每个指标都在各自容差内
+  也算命中；容差通过 THESIS_CACHE_TOLERANCES="price=0.01,volume_zscore=0.5" 覆盖
+- price 的量化步长 / 容差是相对值（0.0005 = 5bp），其余指标是绝对值
+- 命中 / 近似命中 / 未命中，以及每个指标挡掉近似命中的次数，供 /health/cache 调参
+"""
+
+import copy
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+_RELATIVE = {"price"}
+
+# 量化步长：落在同一格子里的指标视为相同输入
+_DEFAULT_QUANTA: Dict[str, float] = {
+    "price": 0.0005,
+    "change_pct_1d": 0.0005,
+    "volatility_20d": 0.005,
+    "volume_zscore": 0.1,
+    "gap_open_pct": 0.0005,
+}
+
+# 近似命中的容差（只在 THESIS_CACHE_NEAR=1 时启用）
+_DEFAULT_TOLERANCES: Dict[str, float] = {
+    "price": 0.005,
+    "change_pct_1d": 0.003,
+    "volatility_20d": 0.02,
+    "volume_zscore": 0.5,
+    "gap_open_pct": 0.003,
+}
+
+def _parse_floats(spec: str) -> Dict[str, float]:
+    # "price=0.01, volume_zscore=0.5" -> {"price": 0.01, "volume_zscore": 0.5}
+    out: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip():
+            try:
+                out[name.strip()] = float(value)
+            except ValueError:
+                continue
+    return out
+
+
+def _quantize(name: str, value: Any, step: float) -> Any:
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return value
+    if not math.isfinite(v):
+        return None
+    if step <= 0:
+        return v
+    if name in _RELATIVE:
+        # 对数刻度上等距分格，相对变化小于 step 的价格落在同一格
+        return round(math.log(v) / math.log1p(step)) if v > 0 else 0
+    return round(v / step)
+
+
+def _url_set(items: Optional[List[Dict[str, Any]]]) -> Tuple[str, ...]:
+    return tuple(sorted({(i.get("url") or i.get("title") or "") for i in (items or [])}))
+
+
+def _within(name: str, a: Any, b: Any, tol: float) -> bool:
+    try:
+        a, b = float(a), float(b)
+    except (TypeError, ValueError):
+        return a == b
+    if name in _RELATIVE:
+        return abs(a - b) <= tol * max(abs(b), 1e-12)
+    return abs(a - b) <= tol
+
+
+class ThesisCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 30 * 60,
+        quanta: Optional[Dict[str, float]] = None,
+        tolerances: Optional[Dict[str, float]] = None,
+        near: bool = False,
+        near_candidates: int = 8,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.quanta = {**_DEFAULT_QUANTA, **(quanta or {})}
+        self.tolerances = {**_DEFAULT_TOLERANCES, **(tolerances or {})}
+        self.near = near
+        self.near_candidates = near_candidates
+        self._lock = threading.Lock()
+        # 指纹 -> (expire_ts, indicators, thesis)
+        self._exact: "OrderedDict[str, Tuple[float, Dict[str, Any], Dict[str, Any]]]" = OrderedDict()
+        # (ticker, headline URLs, evidence URLs) -> 最近的若干个指纹，近似命中只在同组内比较
+        self._groups: Dict[Tuple[str, Tuple[str, ...], Tuple[str, ...]], List[str]] = {}
+        self._stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+        self._near_blocked: Dict[str, int] = {}
+
+    # ---------- 指纹 ----------
+    def fingerprint(
+        self,
+        ticker: str,
+        indicators: Dict[str, Any],
+        headlines: Optional[List[Dict[str, Any]]],
+        evidences: Optional[List[Dict[str, Any]]],
+    ) -> Tuple[str, Tuple[str, Tuple[str, ...], Tuple[str, ...]]]:
+        group = (ticker.upper(), _url_set(headlines), _url_set(evidences))
+        q = {k: _quantize(k, v, self.quanta.get(k, 0.0)) for k, v in sorted((indicators or {}).items())}
+        raw = json.dumps([group[0], q, group[1], group[2]], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest(), group
+
+    # ---------- 读写 ----------
+    def _live(self, fp: str, now: float) -> Optional[Tuple[float, Dict[str, Any], Dict[str, Any]]]:
+        item = self._exact.get(fp)
+        if item is not None and now > item[0]:
+            self._exact.pop(fp, None)
+            self._stats["expired"] += 1
+            return None
+        return item
+
+    def _close_enough(self, indicators: Dict[str, Any], cached: Dict[str, Any]) -> bool:
+        ok = True
+        for name, tol in self.tolerances.items():
+            if name in indicators and not _within(name, indicators[name], cached.get(name), tol):
+                self._near_blocked[name] = self._near_blocked.get(name, 0) + 1
+                ok = False
+        return ok
+
+    def lookup(
+        self,
+        ticker: str,
+        indicators: Dict[str, Any],
+        headlines: Optional[List[Dict[str, Any]]],
+        evidences: Optional[List[Dict[str, Any]]],
+    ) -> Optional[Dict[str, Any]]:
+        """返回缓存的 thesis 副本（调用方可以随意修改）；没有可复用的结果时返回 None。"""
+        fp, group = self.fingerprint(ticker, indicators, headlines, evidences)
+        now = time.time()
+        with self._lock:
+            item = self._live(fp, now)
+            if item is not None:
+                self._exact.move_to_end(fp)
+                self._stats["exact_hits"] += 1
+                return copy.deepcopy(item[2])
+            if self.near:
+                for other in reversed(self._groups.get(group, [])):
+                    cand = self._live(other, now)
+                    if cand is not None and self._close_enough(indicators, cand[1]):
+                        self._exact.move_to_end(other)
+                        self._stats["near_hits"] += 1
+                        return copy.deepcopy(cand[2])
+            self._stats["misses"] += 1
+            return None
+
+    def store(
+        self,
+        ticker: str,
+        indicators: Dict[str, Any],
+        headlines: Optional[List[Dict[str, Any]]],
+        evidences: Optional[List[Dict[str, Any]]],
+        thesis: Dict[str, Any],
+    ) -> None:
+        fp, group = self.fingerprint(ticker, indicators, headlines, evidences)
+        with self._lock:
+            self._exact[fp] = (time.time() + self.ttl, dict(indicators), copy.deepcopy(thesis))
+            self._exact.move_to_end(fp)
+            members = [m for m in self._groups.get(group, []) if m != fp and m in self._exact]
+            members.append(fp)
+            self._groups[group] = members[-self.near_candidates:]
+            self._stats["stores"] += 1
+            while len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+                self._stats["evictions"] += 1
+            if len(self._groups) > self.max_entries:
+                self._groups = {g: [m for m in ms if m in self._exact] for g, ms in self._groups.items()}
+                self._groups = {g: ms for g, ms in self._groups.items() if ms}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._exact.clear()
+            self._groups.clear()
+            self._stats = {k: 0 for k in self._stats}
+            self._near_blocked.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            st = dict(self._stats)
+            size = len(self._exact)
+            blocked = dict(self._near_blocked)
+        lookups = st["exact_hits"] + st["near_hits"] + st["misses"]
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "near_enabled": self.near,
+            "hit_rate": ((st["exact_hits"] + st["near_hits"]) / lookups) if lookups else 0.0,
+            "near_hit_rate": (st["near_hits"] / lookups) if lookups else 0.0,
+            **st,
+            "near_blocked_by": blocked,
+            "quanta": dict(self.quanta),
+            "tolerances": dict(self.tolerances),
+        }
+
+
+def _from_env() -> ThesisCache:
+    try:
+        max_entries = int(os.getenv("THESIS_CACHE_MAX_ENTRIES", "1024"))
+        ttl = float(os.getenv("THESIS_CACHE_TTL_SEC", str(30 * 60)))
+    except ValueError:
+        max_entries, ttl = 1024, 30 * 60
+    return ThesisCache(
+        max_entries=max_entries,
+        ttl=ttl,
+        quanta=_parse_floats(os.getenv("THESIS_CACHE_QUANTA", "")),
+        tolerances=_parse_floats(os.getenv("THESIS_CACHE_TOLERANCES", "")),
+        near=os.getenv("THESIS_CACHE_NEAR", "0") == "1",
+    )
+
+
+# 进程级单例
+THESIS_CACHE = _from_env()
+
+
+def thesis_cache_enabled() -> bool:
+    return os.getenv("THESIS_CACHE_ENABLED", "1") != "0"
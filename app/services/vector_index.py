@@ -0,0 +1,480 @@
+# app/services/vector_index.py
+"""
+全局向量索引（所有 ticker 共用一份）：
+- 每个唯一 chunk（按 url + 文本去重）只存一次向量，float32 且已 L2 归一化（内积 = 余弦相似度）
+- 紧凑的元数据侧表：url / source / title / text / published_ts / tickers
+  另有 ticker -> 行号 的倒排表，过滤时不需要扫描全部元数据
+- 检索先按 ticker + 时间窗口得到候选集：
+    候选不多 -> 直接对候选做精确内积 top-k
+    候选很多且语料超过 ann_threshold -> 用 FAISS IVF / HNSW + IDSelector 做带过滤的 ANN
+- 持久化为单个 .npz（写临时文件后 os.replace），ANN 结构在加载时按需重建；文件里记着 embedding 模型和维度，
+  换了模型（例如 EMBED_PROVIDER 从 fake 切到 openai）时丢弃旧向量、从空索引重建（索引只是 headlines 的派生数据）
+- 多 worker（传入 is_writer + outbox_path）：只有 writer 进程落盘；其它进程照常在本地增量写入
+  （立即可检索），同时把新增 / 新标签通过 SQLite outbox 交给 writer，并在索引文件更新后重新加载，
+  重新加载时把 writer 还没落盘的本地改动补回去
+"""
+
+import json
+import logging
+import os
+import pathlib
+import pickle
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("services.vector_index")
+
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    v = np.asarray(v, dtype=np.float32)
+    norms = np.linalg.norm(v, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return v / norms
+
+
+class _Outbox:
+    """非 writer 进程 -> writer 的改动队列（本机 SQLite，多进程安全）。"""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, payload BLOB)")
+            self._conn = conn
+        return self._conn
+
+    def push(self, payloads: List[Dict[str, Any]]) -> None:
+        if not payloads:
+            return
+        rows = [(pickle.dumps(p, protocol=pickle.HIGHEST_PROTOCOL),) for p in payloads]
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany("INSERT INTO outbox (payload) VALUES (?)", rows)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def drain(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = db.execute("SELECT id, payload FROM outbox ORDER BY id LIMIT ?", (limit,)).fetchall()
+                if rows:
+                    db.execute("DELETE FROM outbox WHERE id <= ?", (rows[-1][0],))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return [pickle.loads(blob) for _, blob in rows]
+
+
+class GlobalVectorIndex:
+    def __init__(
+        self,
+        path: pathlib.Path,
+        mode: str = "hnsw",             # flat | ivf | hnsw
+        ann_threshold: int = 20000,     # 语料超过这个规模才建 ANN 结构
+        exact_limit: int = 4096,        # 过滤后的候选数不超过它时直接精确计算
+        hnsw_m: int = 32,
+        ef_search: int = 64,
+        nprobe: int = 16,
+        is_writer: Optional[Callable[[], bool]] = None,   # 多 worker：当前进程是否负责落盘
+        outbox_path: Optional[pathlib.Path] = None,
+        model: Optional[str] = None,    # embedding 模型标识；与索引文件里记录的不一致时重建
+    ):
+        self.path = pathlib.Path(path)
+        self.model = model
+        self.mode = mode
+        self.ann_threshold = ann_threshold
+        self.exact_limit = exact_limit
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirty = False
+        self._n = 0
+        self._vecs = np.zeros((0, 0), dtype=np.float32)   # 容量按倍增扩展，前 _n 行有效
+        self._published = np.zeros(0, dtype=np.int64)
+        self._meta: Dict[str, List[Any]] = {"key": [], "url": [], "source": [], "title": [], "text": [], "tickers": []}
+        self._key_to_id: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = {}
+        self._ann = None
+        self._ann_n = 0  # ANN 里已经加入的行数
+        self._ann_trained_n = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._is_writer = is_writer or (lambda: True)
+        self._outbox = _Outbox(outbox_path) if outbox_path is not None else None
+        self._role: Optional[str] = None
+        self._loaded_mtime: Optional[int] = None
+        self._journal: List[Dict[str, Any]] = []      # 本地改动，还没交给 writer
+        self._unpersisted: List[Dict[str, Any]] = []  # 已交给 writer，但还没在索引文件里看到
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return self._n
+
+    # ---------- 写入 ----------
+    def _tag(self, row: int, tickers: Iterable[str]) -> None:
+        tags = self._meta["tickers"][row]
+        for t in tickers:
+            t = t.upper()
+            if t not in tags:
+                tags.add(t)
+                self._postings.setdefault(t, []).append(row)
+                self._dirty = True
+
+    def _check_dim(self, dim: int) -> None:
+        have = self._vecs.shape[1]
+        if self._n and have != dim:
+            raise ValueError(
+                f"Embedding dimension {dim} does not match the vector index at {self.path} (dim {have}, "
+                f"model {self.model or 'unknown'}); delete the index file or set VECTOR_INDEX_PATH to rebuild it"
+            )
+
+    def _grow(self, dim: int, extra: int) -> None:
+        need = self._n + extra
+        self._check_dim(dim)
+        if self._n == 0 and self._vecs.shape[1] != dim:
+            self._vecs = np.zeros((0, dim), dtype=np.float32)
+        if need > self._vecs.shape[0]:
+            cap = max(need, 2 * self._vecs.shape[0], 256)
+            vecs = np.zeros((cap, dim), dtype=np.float32)
+            vecs[: self._n] = self._vecs[: self._n]
+            pub = np.zeros(cap, dtype=np.int64)
+            pub[: self._n] = self._published[: self._n]
+            self._vecs, self._published = vecs, pub
+
+    def add(
+        self,
+        records: Sequence[Dict[str, Any]],
+        tickers: Iterable[str],
+        embed_fn: Callable[[List[str]], List[List[float]]],
+    ) -> int:
+        """
+        records: [{key, url, source, title, text, published_ts}]。
+        已存在的 chunk 只追加 ticker 标签、不重新 embed；新 chunk 批量 embed 一次后追加。
+        """
+        self._ensure_loaded()
+        tickers = [t.upper() for t in tickers]
+        with self._lock:
+            new, seen = [], set()
+            for r in records:
+                if r["key"] not in self._key_to_id and r["key"] not in seen:
+                    seen.add(r["key"])
+                    new.append(r)
+            if not new:
+                self._apply_locked(records, None, tickers)
+                return 0
+
+        vecs = _normalize(np.asarray(embed_fn([r["text"] for r in new]), dtype=np.float32))
+
+        with self._lock:
+            # embed 期间可能被别的线程写入，_apply_locked 会跳过已存在的 key
+            added = self._apply_locked(new, vecs, tickers)
+            self._apply_locked(records, None, tickers)
+            return added
+
+    def _apply_locked(self, records: Sequence[Dict[str, Any]], vecs: Optional[np.ndarray], tickers: List[str]) -> int:
+        """写入 / 打标签；vecs 为 None 时只给已存在的行打标签。多 worker 模式下同时记一笔 journal。"""
+        added = 0
+        rows = []
+        for i, r in enumerate(records):
+            row = self._key_to_id.get(r["key"])
+            if row is None:
+                if vecs is None:
+                    continue
+                self._grow(vecs.shape[1], 1)
+                row = self._n
+                self._vecs[row] = vecs[i]
+                self._published[row] = int(r.get("published_ts") or 0)
+                for col in ("key", "url", "source", "title", "text"):
+                    self._meta[col].append(r.get(col) or "")
+                self._meta["tickers"].append(set())
+                self._key_to_id[r["key"]] = row
+                self._n += 1
+                self._dirty = True
+                added += 1
+            self._tag(row, tickers)
+            rows.append(row)
+        if added:
+            self._sync_ann()
+        if self._outbox is not None and rows:
+            rows = list(dict.fromkeys(rows))
+            self._journal.append({
+                "tickers": list(tickers),
+                "records": [
+                    {**{col: self._meta[col][row] for col in ("key", "url", "source", "title", "text")},
+                     "published_ts": int(self._published[row])}
+                    for row in rows
+                ],
+                "vecs": self._vecs[rows].copy(),
+            })
+        return added
+
+    def _persisted_locked(self, payload: Dict[str, Any]) -> bool:
+        for r in payload["records"]:
+            row = self._key_to_id.get(r["key"])
+            if row is None or not set(payload["tickers"]) <= self._meta["tickers"][row]:
+                return False
+        return True
+
+    # ---------- ANN ----------
+    def _sync_ann(self) -> None:
+        if self.mode == "flat" or self._n < self.ann_threshold:
+            return
+        import faiss
+
+        d = self._vecs.shape[1]
+        # IVF 的聚类中心在语料翻倍后重训一次
+        rebuild = self._ann is None or (self.mode == "ivf" and self._n > 2 * self._ann_trained_n)
+        if rebuild:
+            data = self._vecs[: self._n]
+            if self.mode == "ivf":
+                nlist = max(16, int(4 * np.sqrt(self._n)))
+                index = faiss.IndexIVFFlat(faiss.IndexFlatIP(d), d, nlist, faiss.METRIC_INNER_PRODUCT)
+                index.train(data)
+            else:
+                index = faiss.IndexHNSWFlat(d, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.add(data)
+            self._ann, self._ann_n, self._ann_trained_n = index, self._n, self._n
+            logger.info("Built %s index over %d vectors", self.mode, self._n)
+        elif self._ann_n < self._n:
+            self._ann.add(self._vecs[self._ann_n: self._n])
+            self._ann_n = self._n
+
+    def _ann_search(self, q: np.ndarray, k: int, cand: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        import faiss
+
+        sel = faiss.IDSelectorBatch(cand.astype(np.int64)) if cand is not None else None
+        if self.mode == "ivf":
+            params = faiss.SearchParametersIVF(sel=sel, nprobe=self.nprobe)
+        else:
+            params = faiss.SearchParametersHNSW(sel=sel, efSearch=max(self.ef_search, k))
+        D, I = self._ann.search(q[None, :], k, params=params)
+        ok = I[0] >= 0
+        return I[0][ok], D[0][ok]
+
+    # ---------- 检索 ----------
+    def search(
+        self,
+        query_vec: Sequence[float],
+        k: int = 5,
+        ticker: Optional[str] = None,
+        since_ts: Optional[int] = None,
+        until_ts: Optional[int] = None,
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """返回 [(meta, cosine_score)]，按分数降序；ticker / 时间窗口都是可选过滤条件。"""
+        self._ensure_loaded()
+        with self._lock:
+            n = self._n
+            if n == 0:
+                return []
+            q = _normalize(np.asarray(query_vec, dtype=np.float32))
+            self._check_dim(q.shape[-1])
+
+            cand: Optional[np.ndarray] = None
+            if ticker is not None:
+                cand = np.asarray(self._postings.get(ticker.upper(), []), dtype=np.int64)
+            if since_ts is not None or until_ts is not None:
+                ids = cand if cand is not None else np.arange(n, dtype=np.int64)
+                pub = self._published[ids]
+                mask = np.ones(len(ids), dtype=bool)
+                if since_ts is not None:
+                    mask &= pub >= since_ts
+                if until_ts is not None:
+                    mask &= pub < until_ts
+                cand = ids[mask]
+            if cand is not None and len(cand) == 0:
+                return []
+
+            use_ann = self._ann is not None and (cand is None or len(cand) > self.exact_limit)
+            if use_ann:
+                rows, scores = self._ann_search(q, k, cand)
+            else:
+                ids = cand if cand is not None else np.arange(n, dtype=np.int64)
+                sims = self._vecs[ids] @ q
+                top = np.argpartition(-sims, min(k, len(ids)) - 1)[:k] if len(ids) > k else np.arange(len(ids))
+                top = top[np.argsort(-sims[top])]
+                rows, scores = ids[top], sims[top]
+
+            return [(self._row_meta(int(r)), float(s)) for r, s in zip(rows, scores)]
+
+    def _row_meta(self, row: int) -> Dict[str, Any]:
+        m = {col: self._meta[col][row] for col in ("url", "source", "title", "text")}
+        m["published_ts"] = int(self._published[row])
+        m["tickers"] = sorted(self._meta["tickers"][row])
+        return m
+
+    # ---------- 持久化 ----------
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if self.path.exists():
+                try:
+                    self._load()
+                except Exception:
+                    logger.exception("Failed to load vector index from %s; starting empty", self.path)
+            self._loaded = True
+
+    def _load(self) -> None:
+        mtime = self.path.stat().st_mtime_ns
+        with np.load(self.path) as z:
+            vecs = z["vectors"].astype(np.float32)
+            published = z["published"].astype(np.int64)
+            meta = json.loads(z["meta"].tobytes().decode("utf-8"))
+        stored = meta.get("model")
+        if self.model is not None and stored is not None and stored != self.model:
+            logger.warning(
+                "Vector index %s was built with %s (dim %d); current model is %s, rebuilding from empty",
+                self.path, stored, vecs.shape[1], self.model,
+            )
+            self._reset_locked()
+            self._loaded_mtime = mtime
+            self._dirty = True  # 下次落盘时用新模型覆盖旧文件
+            return
+        self._n = len(vecs)
+        self._vecs, self._published = vecs, published
+        self._meta = {col: list(meta[col]) for col in ("key", "url", "source", "title", "text")}
+        self._meta["tickers"] = [set(ts) for ts in meta["tickers"]]
+        self._key_to_id = {k: i for i, k in enumerate(self._meta["key"])}
+        self._postings = {}
+        for row, tags in enumerate(self._meta["tickers"]):
+            for t in tags:
+                self._postings.setdefault(t, []).append(row)
+        self._ann, self._ann_n, self._ann_trained_n = None, 0, 0
+        self._dirty = False
+        self._loaded_mtime = mtime
+        self._sync_ann()
+
+    def _reset_locked(self) -> None:
+        self._n = 0
+        self._vecs = np.zeros((0, 0), dtype=np.float32)
+        self._published = np.zeros(0, dtype=np.int64)
+        self._meta = {"key": [], "url": [], "source": [], "title": [], "text": [], "tickers": []}
+        self._key_to_id, self._postings = {}, {}
+        self._ann, self._ann_n, self._ann_trained_n = None, 0, 0
+
+    def flush(self) -> None:
+        # 多 worker 时只有 writer 写文件，其它进程的改动走 outbox（见 sync）
+        if self._outbox is not None and not self._is_writer():
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            n = self._n
+            meta = {col: self._meta[col][:n] for col in ("key", "url", "source", "title", "text")}
+            meta["tickers"] = [sorted(ts) for ts in self._meta["tickers"][:n]]
+            meta["model"] = self.model
+            vecs = self._vecs[:n].copy()
+            published = self._published[:n].copy()
+            self._dirty = False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                np.savez(
+                    f,
+                    vectors=vecs,
+                    published=published,
+                    meta=np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+                )
+            os.replace(tmp, self.path)
+            self._loaded_mtime = self.path.stat().st_mtime_ns
+        except Exception:
+            with self._lock:
+                self._dirty = True
+            raise
+
+    # ---------- 多 worker 同步 ----------
+    def _reload_if_changed(self, force: bool = False) -> None:
+        if not self.path.exists():
+            return
+        if not force and self.path.stat().st_mtime_ns == self._loaded_mtime:
+            return
+        with self._lock:
+            pending = self._unpersisted + self._journal
+            self._journal = []
+            self._load()
+            self._unpersisted = []
+            # writer 还没落盘的本地改动补回去（_apply_locked 会把它们重新记入 journal，下次 sync 再交一次）
+            for p in pending:
+                if not self._persisted_locked(p):
+                    self._apply_locked(p["records"], p["vecs"], p["tickers"])
+
+    def sync(self) -> None:
+        """单进程：落盘。多 worker：writer 消费 outbox 后落盘；其它进程交出本地改动并在文件更新后重新加载。"""
+        if self._outbox is None:
+            self.flush()
+            return
+        self._ensure_loaded()
+        if self._is_writer():
+            if self._role != "writer":
+                # 刚成为 writer：先接上最新的索引文件，再补上自己的改动
+                self._reload_if_changed(force=True)
+                self._role = "writer"
+            for p in self._outbox.drain():
+                with self._lock:
+                    self._apply_locked(p["records"], p["vecs"], p["tickers"])
+            with self._lock:
+                self._journal, self._unpersisted = [], []
+            self.flush()
+        else:
+            self._role = "reader"
+            with self._lock:
+                journal, self._journal = self._journal, []
+            self._outbox.push(journal)
+            with self._lock:
+                self._unpersisted.extend(journal)
+            self._reload_if_changed()
+
+    # ---------- 后台落盘 ----------
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Vector index sync failed")
+
+    def start(self, flush_interval: float = 30.0) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(flush_interval,), name="vindex-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.sync()
+
+    def stats(self) -> Dict[str, Any]:
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                "vectors": self._n,
+                "dim": int(self._vecs.shape[1]),
+                "model": self.model,
+                "tickers": len(self._postings),
+                "mode": self.mode,
+                "ann_built": self._ann is not None,
+            }
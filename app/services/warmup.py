@@ -0,0 +1,144 @@
+# app/services/warmup.py
+"""
+启动预热：重依赖（pandas / yfinance / langchain / openai / faiss）不在 import app.main 时加载，
+而是在 lifespan 启动后由后台线程按顺序导入并初始化，进程可以先对 /health 作答。
+
+- register(name, modules, init, start, stop)：一个子系统 = 要导入的模块 + 可选的初始化（线程里跑）
+  + 就绪后在事件循环里调用的 start + 退出时的 stop
+- wait(name)：请求路径在用到某个子系统之前 await 它（预热没启动时会顺便启动）
+- report()：每个子系统的状态、耗时以及它新引入的顶层包，供 /ready 和启动日志使用
+"""
+
+import asyncio
+import importlib
+import inspect
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger("services.warmup")
+
+_PROCESS_T0 = time.perf_counter()  # 近似进程起点：app 包里最早被导入的模块之一
+
+
+def _top_level_packages() -> set:
+    return {m.partition(".")[0] for m in list(sys.modules)}
+
+
+class _Subsystem:
+    __slots__ = ("name", "modules", "init", "start", "stop", "event", "status", "ms", "new_packages", "error")
+
+    def __init__(self, name: str, modules: Sequence[str], init, start, stop):
+        self.name = name
+        self.modules = list(modules)
+        self.init: Optional[Callable[[], Any]] = init
+        self.start: Optional[Callable[[], Any]] = start
+        self.stop: Optional[Callable[[], Any]] = stop
+        self.event = asyncio.Event()
+        self.status = "pending"   # pending | warming | ready | failed
+        self.ms: Optional[float] = None
+        self.new_packages: List[str] = []
+        self.error: Optional[str] = None
+
+
+class Warmup:
+    def __init__(self):
+        self._subsystems: "OrderedDict[str, _Subsystem]" = OrderedDict()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.marks: Dict[str, float] = {}
+
+    def register(
+        self,
+        name: str,
+        modules: Sequence[str] = (),
+        init: Optional[Callable[[], Any]] = None,
+        start: Optional[Callable[[], Any]] = None,
+        stop: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        self._subsystems[name] = _Subsystem(name, modules, init, start, stop)
+
+    def mark(self, name: str, ms: Optional[float] = None) -> None:
+        """记录一个启动里程碑（默认为距进程起点的毫秒数）。"""
+        self.marks[name] = round((time.perf_counter() - _PROCESS_T0) * 1000 if ms is None else ms, 1)
+
+    @property
+    def ready(self) -> bool:
+        return all(s.status == "ready" for s in self._subsystems.values())
+
+    def _load(self, s: _Subsystem) -> None:
+        for m in s.modules:
+            importlib.import_module(m)
+        if s.init is not None:
+            s.init()
+
+    async def _warm(self, s: _Subsystem) -> None:
+        s.status = "warming"
+        before = _top_level_packages()
+        t0 = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._load, s)
+            if s.start is not None:
+                s.start()
+            s.status = "ready"
+        except Exception as e:
+            s.status = "failed"
+            s.error = repr(e)
+            logger.warning("Warmup of %s failed: %r", s.name, e)
+        finally:
+            s.ms = round((time.perf_counter() - t0) * 1000, 1)
+            s.new_packages = sorted(
+                p for p in _top_level_packages() - before if not p.startswith("_") and p not in sys.stdlib_module_names
+            )
+            s.event.set()
+
+    async def _run(self) -> None:
+        for s in self._subsystems.values():
+            await self._warm(s)
+        self.mark("warm")
+        logger.info(
+            "Startup: app import %.0f ms, warm after %.0f ms (%s)",
+            self.marks.get("app_import", 0.0), self.marks["warm"],
+            ", ".join(f"{s.name} {s.ms:.0f} ms {s.status}" for s in self._subsystems.values()),
+        )
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def wait(self, name: str) -> None:
+        self.start()
+        await self._subsystems[name].event.wait()
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for s in reversed(self._subsystems.values()):
+            if s.stop is None or s.status not in ("ready", "failed"):
+                continue
+            try:
+                r = s.stop()
+                if inspect.isawaitable(r):
+                    await r
+            except Exception:
+                logger.exception("Stopping %s failed", s.name)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "uptime_ms": round((time.perf_counter() - _PROCESS_T0) * 1000, 1),
+            "startup": dict(self.marks),
+            "subsystems": {
+                s.name: {"status": s.status, "ms": s.ms, "new_packages": s.new_packages, "error": s.error}
+                for s in self._subsystems.values()
+            },
+        }
+
+
+# 进程级单例；子系统在 app.main 里注册
+WARMUP = Warmup()
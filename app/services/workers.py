@@ -0,0 +1,74 @@
+# app/services/workers.py
+"""
+多 worker 部署（uvicorn --workers N）下的进程间协调：
+- APP_WORKERS>1 时视为多 worker 模式（run.sh 会设置）；单进程时这里的一切都是空操作
+- LeaderLock：基于 fcntl.flock 的 leader 选举。锁由持有进程终生持有，进程退出时内核自动释放，
+  其余 worker 之后再调用 try_acquire() 即可接任。
+  只有 leader 做“全局只需做一次”的事：向量索引落盘、watchlist 预计算
+"""
+
+import logging
+import os
+import pathlib
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有 flock，只支持单 worker
+    fcntl = None
+
+logger = logging.getLogger("services.workers")
+
+
+def worker_count() -> int:
+    try:
+        return max(1, int(os.getenv("APP_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+
+def multi_worker() -> bool:
+    return worker_count() > 1
+
+
+class LeaderLock:
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """非阻塞：已经是 leader 或者刚抢到锁时返回 True。"""
+        if not multi_worker() or fcntl is None:
+            return True
+        with self._lock:
+            if self._fd is not None:
+                return True
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode("ascii"))
+            self._fd = fd
+            logger.info("Worker %d is now the leader (%s)", os.getpid(), self.path)
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            if self._fd is not None and fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+                self._fd = None
+
+
+# 进程级单例
+WORKER_LEADER = LeaderLock(pathlib.Path(os.getenv("WORKER_LOCK_DIR", "data/run")) / "leader.lock")
@@ -0,0 +1,69 @@
+# bench/compare.py
+"""
+对比两次基准结果，超过阈值的回退（微基准 p50 变慢 / 端到端 p50、p99 变慢、QPS 下降）返回非零退出码：
+
+    python -m bench.compare data/bench/base.json data/bench/new.json --threshold 0.10
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+# (名称, 旧值, 新值, 相对变化, 是否回退)
+Row = Tuple[str, float, float, float, bool]
+
+
+def _delta(old: float, new: float) -> float:
+    return (new - old) / old if old else 0.0
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[Row]:
+    rows: List[Row] = []
+    for name, b in (base.get("micro") or {}).items():
+        n = (new.get("micro") or {}).get(name)
+        if n is None:
+            continue
+        d = _delta(b["us"]["p50"], n["us"]["p50"])
+        rows.append((f"micro.{name}.p50_us", b["us"]["p50"], n["us"]["p50"], d, d > threshold))
+
+    def key(r: Dict[str, Any]) -> Tuple[str, int]:
+        return r.get("scenario", ""), r["concurrency"]
+
+    new_e2e = {key(r): r for r in new.get("e2e") or []}
+    for b in base.get("e2e") or []:
+        n = new_e2e.get(key(b))
+        if n is None:
+            continue
+        label = f"e2e.{b.get('scenario', '')}.c{b['concurrency']}"
+        for q in ("p50", "p99"):
+            d = _delta(b["latency_ms"][q], n["latency_ms"][q])
+            rows.append((f"{label}.{q}_ms", b["latency_ms"][q], n["latency_ms"][q], d, d > threshold))
+        d = _delta(b["qps"], n["qps"])
+        rows.append((f"{label}.qps", b["qps"], n["qps"], d, d < -threshold))
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Compare two bench result files")
+    ap.add_argument("base")
+    ap.add_argument("new")
+    ap.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+    args = ap.parse_args(argv)
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    rows = compare(base, new, args.threshold)
+    width = max((len(r[0]) for r in rows), default=10)
+    for name, old, cur, d, bad in rows:
+        print(f"{name:<{width}}  {old:>12.2f} -> {cur:>12.2f}  {d:+7.1%}{'  REGRESSION' if bad else ''}")
+    regressions = sum(1 for r in rows if r[4])
+    print(f"{regressions} regression(s) above {args.threshold:.0%} ({base['meta'].get('git')} -> {new['meta'].get('git')})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
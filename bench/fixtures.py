@@ -0,0 +1,111 @@
+# bench/fixtures.py
+"""
+压测 / 基准用的离线数据：
+- prices/<TICKER>.csv  FixtureProvider 格式的日线（Date,Open,High,Low,Close,Volume）
+- rss/<name>.xml       RSS 2.0 原文（带 HTML 摘要，和线上源一样需要 feedparser + 去标签）
+
+默认由固定种子生成，任何机器上内容逐字节一致；record() 可以在有网络时把线上
+yfinance / RSS 录制下来覆盖同名文件，之后同样完全离线回放。
+"""
+
+import pathlib
+import zlib
+from email.utils import format_datetime
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+TICKERS: List[str] = [
+    "AAPL", "MSFT", "TSLA", "NVDA", "AMZN", "GOOGL", "META", "JPM", "XOM", "UNH",
+    "V", "JNJ", "WMT", "PG", "MA", "HD", "CVX", "KO", "PEP", "COST",
+]
+FEEDS: List[str] = ["markets", "news", "topstories"]
+
+_END = pd.Timestamp("2025-06-30")
+_WORDS = (
+    "shares rally slump earnings guidance beat miss revenue margin outlook regulators probe "
+    "chip demand supply tariffs rates inflation fed buyback dividend downgrade upgrade analysts "
+    "delivery recall lawsuit merger acquisition cloud AI data center consumer spending oil"
+).split()
+
+
+def _seed(name: str) -> int:
+    return zlib.crc32(name.encode("utf-8"))
+
+
+def make_prices(ticker: str, days: int = 400) -> pd.DataFrame:
+    """几何布朗运动 + 随机跳空 + 对数正态成交量；同一 ticker 永远得到同一份数据。"""
+    rng = np.random.default_rng(_seed(ticker))
+    idx = pd.bdate_range(end=_END, periods=days, name="Date")
+    ret = rng.normal(0.0004, 0.02, days)
+    close = 50 + 450 * rng.random() * np.exp(np.cumsum(ret))
+    gap = rng.normal(0, 0.006, days)
+    open_ = np.r_[close[0], close[:-1]] * (1 + gap)
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.008, days)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.008, days)))
+    volume = np.round(rng.lognormal(15, 0.4, days))
+    return pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume}, index=idx)
+
+
+def _sentence(rng: np.random.Generator, n: int) -> str:
+    return " ".join(rng.choice(_WORDS, n)).capitalize()
+
+
+def make_feed_xml(name: str, items: int = 40) -> str:
+    rng = np.random.default_rng(_seed(name))
+    entries = []
+    for i in range(items):
+        t = TICKERS[int(rng.integers(len(TICKERS)))]
+        title = f"{t} {_sentence(rng, int(rng.integers(5, 11)))}"
+        summary = "".join(f"<p>{_sentence(rng, int(rng.integers(12, 30)))}.</p>" for _ in range(int(rng.integers(1, 4))))
+        pub = _END - pd.Timedelta(minutes=int(rng.integers(0, 14 * 24 * 60)))
+        entries.append(
+            "<item>"
+            f"<title>{title}</title>"
+            f"<link>https://example.com/{name}/{i}</link>"
+            f"<guid>https://example.com/{name}/{i}</guid>"
+            f"<pubDate>{format_datetime(pub.tz_localize('UTC').to_pydatetime())}</pubDate>"
+            f"<description><![CDATA[{summary}<img src='https://example.com/{i}.png'/>]]></description>"
+            "</item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<rss version="2.0"><channel><title>Bench {name}</title><link>https://example.com/{name}</link>'
+        f'<description>offline fixture</description>{"".join(entries)}</channel></rss>'
+    )
+
+
+def ensure(root: pathlib.Path, tickers: Optional[List[str]] = None) -> pathlib.Path:
+    """缺失的 fixture 文件补齐（已存在的不覆盖，录制下来的数据会被保留）。"""
+    root = pathlib.Path(root)
+    (root / "prices").mkdir(parents=True, exist_ok=True)
+    (root / "rss").mkdir(parents=True, exist_ok=True)
+    for t in tickers or TICKERS:
+        path = root / "prices" / f"{t}.csv"
+        if not path.exists():
+            make_prices(t).to_csv(path, index_label="Date")
+    for name in FEEDS:
+        path = root / "rss" / f"{name}.xml"
+        if not path.exists():
+            path.write_text(make_feed_xml(name), encoding="utf-8")
+    return root
+
+
+def record(root: pathlib.Path, tickers: Optional[List[str]] = None, period: str = "2y") -> None:
+    """需要网络：把线上行情与 RSS 原文录制成 fixture。"""
+    import httpx
+
+    from app.services.news import MARKET_FEEDS
+    from app.services.providers import YFinanceProvider, save_fixture
+
+    root = pathlib.Path(root)
+    frames = YFinanceProvider().history(tickers or TICKERS, period=period)
+    for t, df in frames.items():
+        save_fixture(df, root / "prices", t)
+    (root / "rss").mkdir(parents=True, exist_ok=True)
+    with httpx.Client(timeout=15, follow_redirects=True) as client:
+        for name, url in zip(FEEDS, MARKET_FEEDS):
+            resp = client.get(url)
+            resp.raise_for_status()
+            (root / "rss" / f"{name}.xml").write_bytes(resp.content)
@@ -0,0 +1,311 @@
+# bench/run.py
+"""
+离线基准：微基准（进程内逐函数计时）+ 端到端（真实 uvicorn 进程 + 本地 stub，按并发度压测）。
+
+    python -m bench.run                     # 全部
+    python -m bench.run --quick             # 缩短每项时长、减少请求数
+    python -m bench.run --skip-e2e --out a.json
+    python -m bench.compare a.json b.json   # 对比两次结果
+
+所有外部依赖都被替换：行情 = fixture CSV，RSS = 本地回放，embedding = 确定性假向量，LLM = stub。
+结果写成 JSON（默认 data/bench/results-<时间>.json），包含机器 / git 版本信息。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from bench import fixtures  # noqa: E402
+
+
+# ---------- 工具 ----------
+def _percentiles(xs: List[float]) -> Dict[str, float]:
+    if not xs:
+        return {}
+    s = sorted(xs)
+
+    def q(p: float) -> float:
+        return s[min(len(s) - 1, int(round(p * (len(s) - 1))))]
+
+    return {"mean": statistics.fmean(s), "p50": q(0.5), "p90": q(0.9), "p99": q(0.99), "max": s[-1]}
+
+
+def timeit(fn: Callable[[], Any], min_time: float = 0.5, warmup: int = 3, max_iters: int = 100_000) -> Dict[str, Any]:
+    """反复调用 fn 至少 min_time 秒，返回单次耗时分布（微秒）。"""
+    for _ in range(warmup):
+        fn()
+    samples: List[float] = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_time and len(samples) < max_iters:
+        t0 = time.perf_counter_ns()
+        fn()
+        samples.append((time.perf_counter_ns() - t0) / 1000)
+    stats = _percentiles(samples)
+    return {"iters": len(samples), "us": stats, "ops_per_sec": 1e6 / stats["mean"] if stats["mean"] else 0.0}
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ---------- 微基准 ----------
+def run_micro(fx: pathlib.Path, work: pathlib.Path, min_time: float, quick: bool) -> Dict[str, Any]:
+    os.environ.setdefault("EMBED_PROVIDER", "fake")
+    os.environ.setdefault("EMBED_CACHE_PATH", str(work / "embeddings.sqlite3"))
+
+    import numpy as np
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from app.services import market, rag
+    from app.services.indicators import available_indicators
+    from app.services.live_indicators import BarReplayFeed, IndicatorBook
+    from app.services.news import fetch_rss_headlines
+    from app.services.price_store import PriceStore
+    from app.services.prompt_builder import pack_context
+    from app.services.providers import FixtureProvider
+    from app.services.thesis_cache import ThesisCache
+    from app.services.vector_index import GlobalVectorIndex
+
+    provider = FixtureProvider(fx / "prices")
+    frames = provider.history(fixtures.TICKERS, period="1y")
+    one = market._tail(frames["TSLA"])
+    panel = {f"{t}{i}": market._tail(df) for i in range(5) for t, df in frames.items()}  # 100 个 ticker
+    feeds = [str(p) for p in sorted((fx / "rss").glob("*.xml"))]
+    headlines = fetch_rss_headlines(feeds, limit=40)
+    docs = rag._docs_from_headlines("TSLA", headlines)
+
+    out: Dict[str, Any] = {}
+
+    def add(name: str, fn: Callable[[], Any], **kw: Any) -> None:
+        out[name] = timeit(fn, min_time=min_time, **kw)
+        print(f"  {name:<32} {out[name]['us']['p50']:>12.1f} us  (p99 {out[name]['us']['p99']:.1f})", flush=True)
+
+    print("micro:")
+    add("compute_indicators", lambda: market.compute_indicators(one))
+    add("compute_indicators_panel_100", lambda: market.compute_indicators_panel(panel))
+    add("compute_indicators_panel_100_all", lambda: market.compute_indicators_panel(panel, available_indicators()))
+
+    replay = list(BarReplayFeed({t: frames[t] for t in fixtures.TICKERS[:5]}, steps_per_bar=4))
+    book = IndicatorBook()
+    it = iter(replay * 1000)
+    add("live_indicators_on_bar", lambda: book.on_bar(next(it)))
+
+    store = PriceStore(work / "prices", lambda ts, start, period: provider.history(ts, start=start, period=period), refresh_sec=1e9)
+    store.get_many(fixtures.TICKERS, "1y")
+    add("price_store_get_warm", lambda: store.get("TSLA", "6mo"))
+
+    add("rss_parse_3_feeds", lambda: fetch_rss_headlines(feeds, limit=40), warmup=1)
+    add("rag_chunk", lambda: rag._chunk(docs))
+    add("prompt_pack_context", lambda: pack_context(headlines, [{"summary": h.get("summary"), "url": h["url"], "score": 0.5} for h in headlines[:10]]))
+    tc = ThesisCache(near=True)
+    ind = market.compute_indicators(one)
+    tc.store("TSLA", ind, headlines[:8], [], {"viewpoint": "neutral"})
+    add("thesis_cache_lookup", lambda: tc.lookup("TSLA", ind, headlines[:8], []))
+
+    # 向量检索：确定性假向量建库，分别测精确检索（按 ticker 过滤）与 ANN
+    emb = DeterministicFakeEmbedding(size=256)
+    n = 5_000 if quick else 30_000
+    rng = np.random.default_rng(0)
+    vecs = rng.normal(size=(n, 256)).astype(np.float32)
+    records = [{"key": f"k{i}", "url": f"u{i}", "text": f"t{i}", "published_ts": i} for i in range(n)]
+    q = emb.embed_query("TSLA stock risks volatility earnings regulation macro")
+    for mode, threshold in (("flat", 10**9), ("hnsw", 0)):
+        idx = GlobalVectorIndex(work / f"vindex-{mode}.npz", mode=mode, ann_threshold=threshold, exact_limit=64)
+        for j, t in enumerate(fixtures.TICKERS):
+            part = slice(j * n // len(fixtures.TICKERS), (j + 1) * n // len(fixtures.TICKERS))
+            idx.add(records[part], [t], lambda texts, v=vecs[part]: v[: len(texts)])
+        add(f"vector_search_{mode}_{n}_ticker", lambda idx=idx: idx.search(q, k=5, ticker="TSLA"))
+        add(f"vector_search_{mode}_{n}_all", lambda idx=idx: idx.search(q, k=5))
+    return out
+
+
+# ---------- 端到端 ----------
+def _wait_http(url: str, timeout: float = 60.0, check: Optional[Callable[[Any], bool]] = None) -> None:
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            r = httpx.get(url, timeout=2)
+            if r.status_code == 200 and (check is None or check(r.json())):
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def _spawn(args: List[str], env: Dict[str, str], log: pathlib.Path) -> subprocess.Popen:
+    f = open(log, "wb")
+    return subprocess.Popen([sys.executable, *args], cwd=ROOT, env=env, stdout=f, stderr=subprocess.STDOUT)
+
+
+async def _load(base: str, tickers: List[str], requests: int, concurrency: int) -> Dict[str, Any]:
+    import httpx
+
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    statuses: Dict[str, int] = {}
+    counter = iter(range(requests))
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        for i in counter:
+            t = tickers[i % len(tickers)]
+            t0 = time.perf_counter()
+            try:
+                r = await client.get(f"{base}/analyze/{t}")
+                code = str(r.status_code)
+                for part in (r.headers.get("server-timing") or "").split(","):
+                    name, _, dur = part.strip().partition(";dur=")
+                    if name and dur:
+                        stages.setdefault(name, []).append(float(dur))
+            except Exception as e:
+                code = type(e).__name__
+            latencies.append((time.perf_counter() - t0) * 1000)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "wall_sec": wall,
+        "qps": requests / wall if wall else 0.0,
+        "latency_ms": _percentiles(latencies),
+        "status": statuses,
+        "server_timing_mean_ms": {k: statistics.fmean(v) for k, v in sorted(stages.items())},
+    }
+
+
+def run_e2e(
+    fx: pathlib.Path, work: pathlib.Path, concurrency: List[int], requests: int, llm_latency: float,
+) -> List[Dict[str, Any]]:
+    stub_port = _free_port()
+    logs = work / "logs"
+    logs.mkdir(parents=True, exist_ok=True)
+    stub = _spawn(
+        ["-m", "bench.stub_server", "--port", str(stub_port), "--fixtures", str(fx), "--llm-latency", str(llm_latency)],
+        dict(os.environ), logs / "stub.log",
+    )
+    results: List[Dict[str, Any]] = []
+    try:
+        _wait_http(f"http://127.0.0.1:{stub_port}/health")
+        stub_base = f"http://127.0.0.1:{stub_port}"
+        # uncached：每个请求都跑 RAG + LLM（只有行情走本地存储）；cached：默认缓存配置
+        scenarios = {
+            "uncached": {"CACHE_TTL_THESIS": "0", "CACHE_TTL_EVIDENCES": "0", "THESIS_CACHE_ENABLED": "0"},
+            "cached": {},
+        }
+        for name, extra in scenarios.items():
+            port = _free_port()
+            env = dict(os.environ)
+            env.update({
+                "MARKET_PROVIDER": "fixture",
+                "MARKET_FIXTURE_DIR": str(fx / "prices"),
+                "PRICE_STORE_DIR": str(work / f"{name}-prices"),
+                "PRICE_STORE_REFRESH_SEC": "1e9",
+                "RSS_FEEDS": ",".join(f"{stub_base}/rss/{f}.xml" for f in fixtures.FEEDS),
+                "EMBED_PROVIDER": "fake",
+                "EMBED_CACHE_PATH": str(work / f"{name}-embeddings.sqlite3"),
+                "VECTOR_INDEX_PATH": str(work / f"{name}-vindex.npz"),
+                "RAG_MAX_AGE_DAYS": "",  # fixture 的发布时间是固定的历史时间，不按“现在”过滤
+                "OPENAI_API_KEY": "bench",
+                "OPENAI_BASE_URL": f"{stub_base}/v1",
+                **extra,
+            })
+            app = _spawn(["-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"], env, logs / f"app-{name}.log")
+            try:
+                base = f"http://127.0.0.1:{port}"
+                _wait_http(f"{base}/health")
+                _wait_http(f"{base}/headlines/stats", check=lambda st: st.get("size", 0) > 0)
+                # 预热：每个 ticker 一次（行情 bootstrap、embedding、LLM 连接池）
+                asyncio.run(_load(base, fixtures.TICKERS, len(fixtures.TICKERS), 4))
+                for c in concurrency:
+                    r = asyncio.run(_load(base, fixtures.TICKERS, requests, c))
+                    r["scenario"] = name
+                    results.append(r)
+                    lat = r["latency_ms"]
+                    print(f"  {name:<9} c={c:<4} qps={r['qps']:>8.1f}  p50={lat['p50']:.1f}ms  p99={lat['p99']:.1f}ms  {r['status']}", flush=True)
+            finally:
+                app.terminate()
+                app.wait(timeout=15)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=15)
+    return results
+
+
+# ---------- 入口 ----------
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Offline benchmark for the analysis pipeline")
+    ap.add_argument("--fixtures", default=str(ROOT / "data" / "bench" / "fixtures"))
+    ap.add_argument("--out", default=None, help="result JSON path (default data/bench/results-<ts>.json)")
+    ap.add_argument("--quick", action="store_true")
+    ap.add_argument("--skip-micro", action="store_true")
+    ap.add_argument("--skip-e2e", action="store_true")
+    ap.add_argument("--concurrency", default="1,8,32")
+    ap.add_argument("--requests", type=int, default=None, help="requests per concurrency level")
+    ap.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM latency in seconds")
+    ap.add_argument("--record", action="store_true", help="record live yfinance / RSS into the fixture dir first (needs network)")
+    args = ap.parse_args(argv)
+
+    fx = pathlib.Path(args.fixtures)
+    if args.record:
+        fixtures.record(fx)
+    fixtures.ensure(fx)
+
+    result: Dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+    }
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        work = pathlib.Path(tmp)
+        if not args.skip_micro:
+            result["micro"] = run_micro(fx, work, min_time=0.2 if args.quick else 1.0, quick=args.quick)
+        if not args.skip_e2e:
+            print("e2e:")
+            levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+            n = args.requests or (60 if args.quick else 400)
+            result["e2e"] = run_e2e(fx, work, levels, n, args.llm_latency)
+
+    out = pathlib.Path(args.out) if args.out else ROOT / "data" / "bench" / f"results-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    print(f"results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# bench/stub_server.py
+"""
+离线依赖的本地替身（一个进程）：
+- POST /v1/chat/completions  OpenAI 兼容的 stub LLM：固定 thesis，可配置延迟，支持 stream
+- GET  /rss/<name>.xml        回放 fixture 里保存的 RSS 原文（带 ETag，轮询器的条件请求会得到 304）
+
+    python -m bench.stub_server --port 9100 --fixtures data/bench/fixtures --llm-latency 0.05
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import pathlib
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+
+THESIS = {
+    "thesis": {
+        "viewpoint": "neutral",
+        "reasoning": ["Momentum is mixed over the last month.", "Volume is in line with its 20-day average."],
+        "catalysts": ["Upcoming earnings release"],
+        "risks": [{
+            "name": "Macro",
+            "rationale": "Rate expectations remain the main driver of multiples.",
+            "severity": "medium",
+            "evidences": [],
+        }],
+        "confidence_0_1": 0.55,
+    }
+}
+
+
+def create_app(fixtures: pathlib.Path, llm_latency: float = 0.05, stream_chunks: int = 20) -> FastAPI:
+    app = FastAPI()
+    rss_dir = pathlib.Path(fixtures) / "rss"
+    content = json.dumps(THESIS)
+
+    def _completion(model: str, message: dict) -> dict:
+        return {
+            "id": "bench", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat(req: Request):
+        body = await req.json()
+        model = body.get("model", "stub")
+        if body.get("stream"):
+            step = max(1, len(content) // stream_chunks)
+
+            async def _sse():
+                for i in range(0, len(content), step):
+                    await asyncio.sleep(llm_latency / stream_chunks)
+                    delta = {"role": "assistant", "content": content[i:i + step]} if i == 0 else {"content": content[i:i + step]}
+                    chunk = {"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": model,
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                end = {"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": model,
+                       "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                yield f"data: {json.dumps(end)}\n\ndata: [DONE]\n\n"
+
+            return StreamingResponse(_sse(), media_type="text/event-stream")
+
+        await asyncio.sleep(llm_latency)
+        if body.get("tools"):  # method="function_calling"
+            name = body["tools"][0]["function"]["name"]
+            msg = {"role": "assistant", "content": None, "tool_calls": [
+                {"id": "call_0", "type": "function", "function": {"name": name, "arguments": content}}]}
+        else:                  # method="json_schema" / json_mode
+            msg = {"role": "assistant", "content": content}
+        return _completion(model, msg)
+
+    @app.get("/rss/{name}")
+    async def rss(name: str, req: Request):
+        path = rss_dir / name
+        if not path.is_file():
+            return Response(status_code=404)
+        data = path.read_bytes()
+        etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        if req.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(data, media_type="application/rss+xml", headers={"ETag": etag})
+
+    @app.get("/health")
+    async def health():
+        return {"ok": True}
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--fixtures", default="data/bench/fixtures")
+    ap.add_argument("--llm-latency", type=float, default=0.05)
+    args = ap.parse_args()
+    uvicorn.run(create_app(pathlib.Path(args.fixtures), args.llm_latency), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
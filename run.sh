@@ -1,5 +1,10 @@
 #!/bin/bash
-#启动 FastAPI 后端
-uvicorn app.main:app --host 0.0.0.0 --port 8000 &
+#启动 FastAPI 后端；WORKERS>1 时多进程部署，缓存走本机共享的 SQLite（CACHE_BACKEND=sqlite）
+WORKERS=${WORKERS:-1}
+export APP_WORKERS=$WORKERS
+if [ "$WORKERS" -gt 1 ]; then
+  export CACHE_BACKEND=${CACHE_BACKEND:-sqlite}
+fi
+uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "$WORKERS" &
 #启动 Streamlit 前端
 streamlit run ui/app.py --server.port 8501 --server.address 0.0.0.0
@@ -0,0 +1,96 @@
+import asyncio
+
+from app.services.cache import ReportCache
+from app.services.cache_backend import SQLiteCacheBackend
+
+
+def test_aget_or_compute_coalesces_and_caches():
+    async def main():
+        cache = ReportCache()
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return calls
+
+        out = await asyncio.gather(*(cache.aget_or_compute("thesis", "T", fn) for _ in range(10)))
+        assert out == [1] * 10
+        assert await cache.aget_or_compute("thesis", "T", fn) == 1
+        assert calls == 1
+        assert cache.stats()["stages"]["thesis"]["coalesced"] == 9
+
+    asyncio.run(main())
+
+
+def test_aget_or_compute_leader_cancel_does_not_cancel_followers():
+    async def main():
+        cache = ReportCache()
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.1)
+            return calls
+
+        leader = asyncio.create_task(cache.aget_or_compute("thesis", "T", fn))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(cache.aget_or_compute("thesis", "T", fn)) for _ in range(3)]
+        await asyncio.sleep(0.02)
+        leader.cancel()
+        # 一个跟随者接任 leader 重新计算，其余跟随者共享它的结果
+        assert await asyncio.gather(*followers) == [2, 2, 2]
+        assert leader.cancelled()
+        assert calls == 2
+
+    asyncio.run(main())
+
+
+def test_aget_or_compute_errors_are_shared_but_not_cached():
+    async def main():
+        cache = ReportCache()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise ValueError("x")
+
+        out = await asyncio.gather(*(cache.aget_or_compute("thesis", "E", boom) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(e, ValueError) for e in out)
+        assert cache.get("thesis", "E") is None
+
+    asyncio.run(main())
+
+
+def test_sqlite_backend_coalesces_across_caches_without_blocking_loop(tmp_path):
+    async def main():
+        path = tmp_path / "cache.sqlite3"
+        # 两个 ReportCache 各有自己的连接，模拟两个 worker
+        a = ReportCache(backend=SQLiteCacheBackend(path), lease_sec=5)
+        b = ReportCache(backend=SQLiteCacheBackend(path), lease_sec=5)
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.2)
+            return "v"
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        t = asyncio.create_task(ticker())
+        out = await asyncio.gather(a.aget_or_compute("thesis", "T", fn), b.aget_or_compute("thesis", "T", fn))
+        t.cancel()
+        assert out == ["v", "v"]
+        assert calls == 1
+        assert ticks > 5
+        assert await b.aget("thesis", "T") == "v"
+
+    asyncio.run(main())
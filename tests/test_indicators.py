@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.indicators import SNAPSHOT_FIELDS
+from app.services.market import compute_indicators_history, compute_indicators_panel
+from bench.fixtures import TICKERS, make_prices
+
+
+def _baseline(df: pd.DataFrame) -> dict:
+    # 改成面板引擎之前 compute_indicators 的 pandas rolling 写法
+    close = df["Close"]
+    vol = df["Volume"].astype(float)
+    ret_1d = close.pct_change()
+    ret20_std = ret_1d.rolling(20).std().iloc[-1]
+    vol_mean = vol.rolling(20).mean().iloc[-1]
+    vol_std = vol.rolling(20).std().iloc[-1]
+    if pd.isna(vol_mean) or pd.isna(vol_std) or vol_std == 0:
+        vol_z = 0.0
+    else:
+        vol_z = (float(vol.iloc[-1]) - float(vol_mean)) / float(vol_std)
+    gap = 0.0
+    if len(df) >= 2 and float(close.iloc[-2]) != 0.0:
+        gap = float(df["Open"].iloc[-1]) / float(close.iloc[-2]) - 1.0
+    return {
+        "price": float(close.iloc[-1]),
+        "change_pct_1d": float(ret_1d.iloc[-1]) if pd.notna(ret_1d.iloc[-1]) else 0.0,
+        "volume_zscore": float(vol_z),
+        "volatility_20d": float(ret20_std * np.sqrt(252)) if pd.notna(ret20_std) else 0.0,
+        "gap_open_pct": float(gap),
+    }
+
+
+def _assert_close(got: dict, want: dict) -> None:
+    for k in SNAPSHOT_FIELDS:
+        assert got[k] == pytest.approx(want[k], rel=1e-9, abs=1e-12), k
+
+
+def test_panel_matches_pandas_baseline():
+    frames = {t: make_prices(t) for t in TICKERS}
+    # 长度不一的 ticker 右对齐进同一个面板；短于窗口的按 baseline 记 0
+    frames["AAPL"] = frames["AAPL"].iloc[-25:]
+    frames["MSFT"] = frames["MSFT"].iloc[-15:]
+    frames["TSLA"] = frames["TSLA"].iloc[-2:]
+    frames["NVDA"] = frames["NVDA"].iloc[-1:]
+    flat = frames["KO"].copy()
+    flat["Volume"] = 1e6
+    frames["KO"] = flat
+    out = compute_indicators_panel(frames)
+    assert set(out) == set(frames)
+    for t, df in frames.items():
+        _assert_close(out[t], _baseline(df))
+
+
+def test_history_matches_baseline_on_every_prefix():
+    frames = {t: make_prices(t, days=60) for t in ("AAPL", "XOM")}
+    frames["XOM"] = frames["XOM"].iloc[-35:]
+    hist = compute_indicators_history(frames)
+    for t, df in frames.items():
+        assert hist[t].index.equals(df.index)
+        for i in range(len(df)):
+            _assert_close(hist[t].iloc[i].to_dict(), _baseline(df.iloc[: i + 1]))
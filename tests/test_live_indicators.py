@@ -0,0 +1,45 @@
+import math
+
+from app.services.indicators import SNAPSHOT_FIELDS
+from app.services.live_indicators import BarReplayFeed, IndicatorBook
+from app.services.market import compute_indicators
+from bench.fixtures import make_prices
+
+TICKERS = ["AAPL", "TSLA", "KO"]
+
+
+def _max_diff(a, b):
+    return max(abs(a[k] - b[k]) / max(1.0, abs(b[k])) for k in SNAPSHOT_FIELDS)
+
+
+def test_on_bar_matches_compute_indicators_bar_for_bar():
+    frames = {t: make_prices(t, days=120) for t in TICKERS}
+    book = IndicatorBook()
+    seen = {t: 0 for t in TICKERS}
+    worst = 0.0
+    for bar in BarReplayFeed(frames):
+        snap = book.on_bar(bar)
+        seen[bar.ticker] += 1
+        ref = compute_indicators(frames[bar.ticker].iloc[: seen[bar.ticker]])
+        worst = max(worst, _max_diff(snap, ref))
+    assert all(n == 120 for n in seen.values())
+    assert worst < 1e-9
+
+
+def test_intraday_revisions_end_at_the_daily_values():
+    frames = {t: make_prices(t, days=60) for t in TICKERS}
+    book = IndicatorBook()
+    for bar in BarReplayFeed(frames, steps_per_bar=4):
+        book.on_bar(bar)
+    for t, df in frames.items():
+        assert _max_diff(book.snapshot(t), compute_indicators(df)) < 1e-9
+
+
+def test_from_frame_warm_start_then_push():
+    df = make_prices("MSFT", days=80)
+    book = IndicatorBook()
+    book.warm({"MSFT": df.iloc[:60]})
+    for bar in BarReplayFeed({"MSFT": df.iloc[60:]}):
+        snap = book.on_bar(bar)
+    assert _max_diff(snap, compute_indicators(df)) < 1e-9
+    assert all(math.isfinite(v) for v in snap.values())
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from app.services.llm import LLMOverloaded, _LLMRuntime
+
+
+def _runtime(monkeypatch, timeout: str) -> _LLMRuntime:
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "2")
+    monkeypatch.setenv("LLM_MAX_QUEUE", "100")
+    monkeypatch.setenv("LLM_QUEUE_TIMEOUT_SEC", timeout)
+    return _LLMRuntime()
+
+
+async def _hold(rt: _LLMRuntime, sec: float) -> None:
+    async with rt._aslot():
+        await asyncio.sleep(sec)
+
+
+def test_queue_timeout_rejects_without_leaking_slots(monkeypatch):
+    rt = _runtime(monkeypatch, "0.02")
+
+    async def main():
+        holders = [asyncio.create_task(_hold(rt, 0.1)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloaded):
+            await _hold(rt, 0)
+        await asyncio.gather(*holders)
+        assert rt._async_sem._value == 2
+
+    asyncio.run(main())
+    assert rt.stats["rejected"] == 1 and rt.stats["queued"] == 0 and rt.stats["in_flight"] == 0
+
+
+def test_slots_survive_timeouts_racing_with_releases(monkeypatch):
+    # 持有时间与排队超时相同：大量 acquire 恰好在超时那一刻成功，许可不能因此丢失
+    rt = _runtime(monkeypatch, "0.01")
+
+    async def main():
+        for _ in range(20):
+            out = await asyncio.gather(*(_hold(rt, 0.01) for _ in range(20)), return_exceptions=True)
+            assert all(r is None or isinstance(r, LLMOverloaded) for r in out)
+        await asyncio.sleep(0.05)
+        assert rt._async_sem._value == 2
+        holders = [asyncio.create_task(_hold(rt, 0.05)) for _ in range(2)]
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_hold(rt, 0))
+        await asyncio.sleep(0.005)
+        waiter.cancel()  # 排队中被取消也不能占住槽位
+        await asyncio.gather(waiter, *holders, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert rt._async_sem._value == 2
+
+    asyncio.run(main())
+    assert rt.stats["in_flight"] == 0 and rt.stats["queued"] == 0
+
+
+def test_acquire_that_wins_the_race_with_the_timeout_is_released(monkeypatch):
+    rt = _runtime(monkeypatch, "0.01")
+
+    class _RacySemaphore(asyncio.Semaphore):
+        # 模拟取消与唤醒竞争：超时的取消到达时 acquire 其实已经拿到了许可
+        async def acquire(self):
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                self._value -= 1
+                return True
+            return await super().acquire()
+
+    async def main():
+        rt._async_sem = _RacySemaphore(0)
+        assert await rt._acquire_async(0.01) is False
+        await asyncio.sleep(0.01)
+        assert rt._async_sem._value == 0  # 拿到的那个许可已经还回去
+
+    asyncio.run(main())
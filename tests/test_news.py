@@ -0,0 +1,43 @@
+from app.services.news import parse_feed, select_headlines
+
+RSS = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>t</title>
+<item><title>old</title><link>https://x/1</link><pubDate>Mon, 06 Jan 2025 10:00:00 GMT</pubDate></item>
+<item><title>newest</title><link>https://x/3</link><pubDate>Wed, 08 Jan 2025 10:00:00 +0000</pubDate></item>
+<item><title>undated</title><link>https://x/4</link></item>
+<item><title>mid</title><link>https://x/2</link><pubDate>Tue, 07 Jan 2025 05:00:00 -0500</pubDate></item>
+<item><title>old dup</title><link>https://x/1</link><pubDate>Mon, 06 Jan 2025 10:00:00 GMT</pubDate></item>
+</channel></rss>"""
+
+ATOM = b"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom"><title>t</title>
+<entry><title>a</title><link href="https://y/a"/><updated>2025-01-06T10:00:00Z</updated></entry>
+<entry><title>b &amp; c</title><link href="https://y/b"/><published>2025-01-07T10:00:00Z</published></entry>
+</feed>"""
+
+
+def test_rss_items_are_deduped_and_sorted_newest_first():
+    out = select_headlines(parse_feed(RSS), limit=10)
+    assert [h["title"] for h in out] == ["newest", "mid", "old", "undated"]
+    assert out[0]["published"] == "2025-01-08T10:00:00+00:00"
+    assert out[-1]["published"] is None
+    assert [h["title"] for h in select_headlines(parse_feed(RSS), limit=2)] == ["newest", "mid"]
+
+
+def test_atom_items_are_sorted_newest_first():
+    out = select_headlines(parse_feed(ATOM), limit=10)
+    assert [h["title"] for h in out] == ["b & c", "a"]
+
+
+def test_entity_declarations_are_not_expanded():
+    bomb = b"""<?xml version="1.0"?>
+<!DOCTYPE rss [
+  <!ENTITY a "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa">
+  <!ENTITY b "&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;">
+  <!ENTITY c "&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;">
+]>
+<rss version="2.0"><channel><title>t</title>
+<item><title>&c;</title><link>https://x/1</link></item>
+</channel></rss>"""
+    out = select_headlines(parse_feed(bomb), limit=10)
+    assert all(len(h["title"]) < 1000 for h in out)
@@ -0,0 +1,39 @@
+import asyncio
+
+from fastapi import HTTPException
+
+from app.services import pipeline
+from app.services.cache import ReportCache
+from bench.fixtures import make_prices
+
+
+def test_closing_batch_stream_cancels_unfinished_tickers(monkeypatch):
+    tickers = ["AAPL", "MSFT", "TSLA", "NVDA"]
+    started, cancelled = [], []
+
+    async def news_stage(t):
+        started.append(t)
+        if t == "AAPL":
+            raise HTTPException(status_code=503, detail="busy")
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.append(t)
+            raise
+
+    monkeypatch.setenv("BATCH_CONCURRENCY", "8")
+    monkeypatch.setattr(pipeline, "REPORT_CACHE", ReportCache())
+    monkeypatch.setattr(pipeline, "fetch_price_panel", lambda ts: {t: make_prices(t, days=60) for t in ts})
+    monkeypatch.setattr(pipeline, "news_stage", news_stage)
+
+    async def main():
+        gen = pipeline.run_batch(tickers)
+        first = await gen.__anext__()
+        assert (first.ticker, first.status) == ("AAPL", 503)
+        await gen.aclose()  # 客户端断开
+        await asyncio.sleep(0)
+        assert sorted(cancelled) == sorted(tickers[1:])
+        assert not [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    asyncio.run(main())
+    assert sorted(started) == sorted(tickers)
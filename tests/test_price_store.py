@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from app.services.price_store import PriceStore
+
+_END = pd.Timestamp.now().normalize()
+_HISTORY = pd.bdate_range(end=_END, periods=6 * 260)
+
+
+def _frame(index):
+    x = np.arange(len(index), dtype=float) + 100.0
+    return pd.DataFrame({"Open": x, "High": x + 1, "Low": x - 1, "Close": x, "Volume": 1e6}, index=index)
+
+
+class _Fetcher:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, tickers, start, period):
+        self.calls.append((tuple(tickers), start, period))
+        if start is not None:
+            idx = _HISTORY[_HISTORY >= start]
+        elif period == "max":
+            idx = _HISTORY
+        else:
+            n = {"1y": 1, "2y": 2, "5y": 5}[period]
+            idx = _HISTORY[_HISTORY >= _END - pd.DateOffset(years=n)]
+        return {t: _frame(idx) for t in tickers}
+
+
+def test_longer_period_backfills_once(tmp_path):
+    fetcher = _Fetcher()
+    store = PriceStore(tmp_path, fetcher, refresh_sec=1e9, bootstrap_period="1y")
+
+    one = store.get("AAPL", "1y")
+    assert one.index[0] >= _END - pd.DateOffset(years=1)
+
+    five = store.get("AAPL", "5y")
+    assert five.index[0] < _END - pd.DateOffset(years=4)
+    assert fetcher.calls[-1] == (("AAPL",), None, "5y")
+    assert store.stats["backfills"] == 1
+
+    # 已覆盖的更短 period 不再下载
+    n = len(fetcher.calls)
+    assert len(store.get("AAPL", "2y")) < len(five)
+    store.get("AAPL", "6mo")
+    assert len(fetcher.calls) == n
+
+    assert len(store.get("AAPL", "max")) == len(_HISTORY)
+    assert fetcher.calls[-1][2] == "max"
+    store.get("AAPL", "5y")
+    assert len(fetcher.calls) == n + 1
@@ -0,0 +1,16 @@
+from app.services.prompt_builder import headline_line, pack_context
+
+
+def test_long_title_is_truncated_but_url_is_kept(monkeypatch):
+    monkeypatch.setenv("PROMPT_ITEM_MAX_TOKENS", "10")
+    h = {
+        "title": "Tesla " + "shares slide as regulators widen their probe " * 20,
+        "source": "Reuters",
+        "published": "2025-01-06T10:00:00+00:00",
+        "url": "https://example.com/tesla-probe",
+    }
+    line = headline_line(h, 10)
+    assert line.endswith("| Reuters | 2025-01-06T10:00:00+00:00 | https://example.com/tesla-probe")
+    assert "…" in line and len(line) < 200
+    ctx = pack_context([h], [], budget=500)
+    assert ctx.headlines_bullets == line
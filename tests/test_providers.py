@@ -0,0 +1,46 @@
+import sys
+import types
+
+import pandas as pd
+
+from app.services.providers import YFinanceProvider, normalize_ohlcv
+
+
+def _ohlcv(index):
+    n = len(index)
+    return pd.DataFrame({"Open": [1.0] * n, "High": 2.0, "Low": 0.5, "Close": 1.5, "Volume": 100.0}, index=index)
+
+
+def test_daily_bars_from_download_and_ticker_history_share_a_date_index():
+    days = ["2025-01-06", "2025-01-07", "2025-07-07"]  # 冬令时 / 夏令时各有
+    download = normalize_ohlcv(_ohlcv(pd.DatetimeIndex(days)), "AAPL")
+    history = normalize_ohlcv(_ohlcv(pd.DatetimeIndex(days).tz_localize("America/New_York")), "AAPL")
+    assert history.index.equals(download.index)
+    assert history.index.tz is None
+    assert list(history.index.strftime("%Y-%m-%d %H:%M")) == [f"{d} 00:00" for d in days]
+
+
+def test_intraday_bars_are_converted_to_utc():
+    idx = pd.DatetimeIndex(["2025-01-06 09:30"]).tz_localize("America/New_York")
+    out = normalize_ohlcv(_ohlcv(idx), "AAPL", interval="1h")
+    assert out.index[0] == pd.Timestamp("2025-01-06 14:30")
+
+
+def test_fallback_chain_keeps_requested_period(monkeypatch):
+    calls = []
+
+    class _Ticker:
+        def __init__(self, ticker):
+            pass
+
+        def history(self, **kw):
+            calls.append(("history", kw["period"], kw["interval"]))
+            return pd.DataFrame()
+
+    def download(ticker, **kw):
+        calls.append(("download", kw.get("period"), kw["interval"]))
+        return pd.DataFrame()
+
+    monkeypatch.setitem(sys.modules, "yfinance", types.SimpleNamespace(download=download, Ticker=_Ticker))
+    assert YFinanceProvider().history(["AAPL"], period="5y") == {}
+    assert calls == [("download", "5y", "1d"), ("history", "5y", "1d"), ("download", "5y", "1d")]
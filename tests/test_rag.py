@@ -0,0 +1,40 @@
+import logging
+from datetime import datetime, timezone
+
+import pytest
+
+from app.services import rag
+from app.services.vector_index import GlobalVectorIndex
+
+
+@pytest.fixture
+def fake_rag(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBED_PROVIDER", "fake")
+    monkeypatch.setenv("EMBED_CACHE_ENABLED", "0")
+    monkeypatch.delenv("RAG_MIN_SCORE", raising=False)
+    monkeypatch.setattr(rag, "_EMBEDDER", None)
+    monkeypatch.setattr(rag, "VECTOR_INDEX", GlobalVectorIndex(tmp_path / "i.npz", mode="flat", model="fake-256"))
+    now = datetime.now(timezone.utc).isoformat()
+    headlines = [
+        {"title": f"Tesla {w} as regulators probe Autopilot", "summary": "Shares fell.", "url": f"https://x/{i}",
+         "source": "t", "published": now}
+        for i, w in enumerate(["slides", "drops", "recalls cars", "faces lawsuit", "misses deliveries", "cuts prices"])
+    ]
+    rag.index_headlines("TSLA", headlines)
+    return headlines
+
+
+def test_default_has_no_score_cutoff(fake_rag):
+    hits = rag.search_evidences("TSLA", rag.risk_query("TSLA"), k=5)
+    assert len(hits) == 5
+    # fake embedding 的余弦分数集中在 0 附近（256 维随机向量），以前写死的 0.3 会把它们全部滤掉
+    assert max(h["score"] for h in hits) < 0.3
+
+
+def test_env_cutoff_that_drops_everything_is_logged(fake_rag, monkeypatch, caplog):
+    monkeypatch.setenv("RAG_MIN_SCORE", "0.3")
+    with caplog.at_level(logging.WARNING, logger="services.rag"):
+        assert rag.search_evidences("TSLA", rag.risk_query("TSLA"), k=5) == []
+    assert "below min_score=0.300" in caplog.text
+    monkeypatch.setenv("RAG_MIN_SCORE", "-1")
+    assert len(rag.search_evidences("TSLA", rag.risk_query("TSLA"), k=5)) == 5
@@ -0,0 +1,49 @@
+from app.services.relevance import TickerMatcher, _ALIASES, select_relevant
+
+
+def test_single_word_aliases_need_their_capitalisation():
+    m = TickerMatcher(_ALIASES)
+    assert m.match("Uber beats estimates") == {"UBER"}
+    assert m.match("UBER SHARES JUMP") == {"UBER"}
+    assert m.match("Where the uber-wealthy park their cash") == set()
+    assert m.match("An apple a day; the oracle of Omaha; intel on rates") == set()
+    assert m.match("New iPhone lineup") == {"AAPL"}
+
+
+def test_phrase_aliases_and_symbols():
+    m = TickerMatcher(_ALIASES)
+    assert m.match("home depot lifts guidance") == {"HD"}
+    assert m.match("Costs rise at HD supply chains") == set()
+    assert m.match("Card networks: $V and (MA) slip") == {"V", "MA"}
+    assert m.match("NVDA and TSLA lead the Nasdaq") == {"NVDA", "TSLA"}
+
+
+def test_select_relevant_prefers_title_hits_then_fills_with_market_news():
+    pool = [
+        {"url": "1", "title": "Fed holds rates", "summary": ""},
+        {"url": "2", "title": "Chip stocks rally", "summary": "Nvidia up 3%"},
+        {"url": "3", "title": "Nvidia unveils new GPU", "summary": ""},
+    ]
+    assert [it["url"] for it in select_relevant("NVDA", pool, fallback=0)] == ["3", "2"]
+    assert [it["url"] for it in select_relevant("AAPL", pool, fallback=2)] == ["1", "2"]
+
+
+def test_padding_items_are_never_indexed_under_the_ticker(monkeypatch):
+    import asyncio
+
+    from app.services import pipeline
+
+    indexed = {}
+    monkeypatch.setattr(pipeline, "index_headlines", lambda t, hs: indexed.setdefault(t, []).extend(h["url"] for h in hs))
+    monkeypatch.setattr(pipeline, "search_evidences", lambda *a, **k: [])
+    pool = [
+        {"url": "https://p/1", "title": "Fed holds rates", "summary": ""},
+        {"url": "https://p/2", "title": "Oil slides", "summary": ""},
+        {"url": "https://p/3", "title": "Nvidia unveils new GPU", "summary": ""},
+    ]
+    headlines = select_relevant("NVDA", pool, fallback=3)
+    assert [h["url"] for h in headlines] == ["https://p/3", "https://p/1", "https://p/2"]
+    pipeline.REPORT_CACHE.invalidate("evidences", "NVDA")
+    asyncio.run(pipeline.rag_stage("NVDA", headlines))
+    pipeline.REPORT_CACHE.invalidate("evidences", "NVDA")
+    assert indexed == {"NVDA": ["https://p/3"]}
@@ -0,0 +1,19 @@
+import asyncio
+import time
+
+from app.services import scheduler
+from app.services.cache import ReportCache
+from bench.fixtures import make_prices
+
+
+def test_refreshed_prices_use_the_prices_stage_ttl(monkeypatch):
+    cache = ReportCache(ttls={"prices": 60, "thesis": 600})
+    monkeypatch.setattr(scheduler, "REPORT_CACHE", cache)
+    monkeypatch.setattr(scheduler, "fetch_price_panel", lambda ts: {t: make_prices(t, days=30) for t in ts})
+    s = scheduler.WatchlistScheduler(["AAPL", "MSFT"], interval_sec=3600)
+    assert s._report_ttl() == 7200
+
+    asyncio.run(s._refresh_prices())
+    for t in ("AAPL", "MSFT"):
+        expire_ts, _ = cache._data[("prices", t)]
+        assert expire_ts - time.time() <= 60
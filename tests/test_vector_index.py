@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from app.services.vector_index import GlobalVectorIndex
+
+
+def _records(n, prefix="k"):
+    return [{"key": f"{prefix}{i}", "url": f"https://x/{prefix}{i}", "text": f"t{i}", "published_ts": i} for i in range(n)]
+
+
+def _embed(dim):
+    rng = np.random.default_rng(dim)
+    return lambda texts: rng.normal(size=(len(texts), dim)).tolist()
+
+
+def test_search_filters_by_ticker(tmp_path):
+    idx = GlobalVectorIndex(tmp_path / "i.npz", mode="flat", model="fake-8")
+    idx.add(_records(3, "a"), ["AAPL"], _embed(8))
+    idx.add(_records(2, "m"), ["MSFT"], _embed(8))
+    hits = idx.search(np.ones(8), k=10, ticker="msft")
+    assert sorted(m["url"] for m, _ in hits) == ["https://x/m0", "https://x/m1"]
+
+
+def test_model_change_rebuilds_instead_of_crashing(tmp_path):
+    path = tmp_path / "i.npz"
+    old = GlobalVectorIndex(path, mode="flat", model="fake-256")
+    old.add(_records(3), ["AAPL"], _embed(256))
+    old.flush()
+
+    new = GlobalVectorIndex(path, mode="flat", model="text-embedding-3-small")
+    assert len(new) == 0
+    assert new.add(_records(3), ["AAPL"], _embed(1536)) == 3
+    assert len(new.search(np.ones(1536), k=2, ticker="AAPL")) == 2
+    new.flush()
+
+    again = GlobalVectorIndex(path, mode="flat", model="text-embedding-3-small")
+    assert again.stats()["dim"] == 1536 and len(again) == 3
+
+
+def test_dimension_mismatch_raises_clear_error(tmp_path):
+    idx = GlobalVectorIndex(tmp_path / "i.npz", mode="flat")
+    idx.add(_records(2), ["AAPL"], _embed(4))
+    with pytest.raises(ValueError, match="dimension 6"):
+        idx.add(_records(2, "b"), ["AAPL"], _embed(6))
+    with pytest.raises(ValueError, match="dimension 6"):
+        idx.search(np.ones(6), k=1)
@@ -1,11 +1,12 @@
 # ui/app.py
 import os
+import json
 import time
 import requests
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
 import plotly.express as px
-import yfinance as yf
 from datetime import datetime, timedelta
 
 API_BASE = os.getenv("API_BASE", "http://127.0.0.1:8000")
@@ -30,121 +31,68 @@ def pct(x):
     except Exception:
         return "-"
 
-def load_analysis(ticker: str):
-    url = f"{API_BASE}/analyze/{ticker}"
-    r = requests.get(url, timeout=40)
-    r.raise_for_status()
-    return r.json()
+def stream_analysis(ticker: str):
+    # NDJSON：每行一个事件（indicators / news / evidences / thesis_partial / report / error）
+    url = f"{API_BASE}/analyze/{ticker}/stream"
+    with requests.get(url, stream=True, timeout=(5, 60)) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if line:
+                yield json.loads(line)
 
+@st.cache_data(ttl=60, show_spinner=False)
 def load_price_history(ticker: str, period: str = "6mo"):
-    
-    df = yf.download(ticker, period=period, interval="1d", auto_adjust=True, progress=False)
-    if df is None or df.empty:
+    # 后端直接读它的本地 price store（Arrow IPC，只取收盘价）；同一 (ticker, period) 一分钟内不重复请求
+    r = requests.get(f"{API_BASE}/prices/{ticker}", params={"period": period, "fields": "Close"}, timeout=(5, 30))
+    if r.status_code == 404:
         return None
-
- 
-    df = df.reset_index()
-    if "Date" in df.columns:
-        df = df.rename(columns={"Date": "date"})
-    elif "date" not in df.columns:
-        
-        if "index" in df.columns:
-            df = df.rename(columns={"index": "date"})
-        else:
-            
-            df["date"] = pd.to_datetime(df.iloc[:, 0], errors="coerce")
-
-    
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = [
-            "_".join([str(c) for c in col if c not in (None, "", "None")]).strip("_")
-            for col in df.columns
-        ]
-
-  
-    if "Close" not in df.columns:
-        
-        cand = next((c for c in df.columns if str(c).lower().startswith("close")), None)
-        if cand:
-            df = df.rename(columns={cand: "Close"})
-        elif "Adj Close" in df.columns:
-            df = df.rename(columns={"Adj Close": "Close"})
-        else:
-           
-            return None
-
-    
-    out = df[["date", "Close"]].dropna()
-    
-    out["date"] = pd.to_datetime(out["date"], errors="coerce")
-    out = out.dropna(subset=["date"])
-    return out
-
-# Auto run once
-if submit or ticker:
-    try:
-        with st.spinner(f"Calling API … {ticker}"):
-            data = load_analysis(ticker)
-            time.sleep(0.1)
-
-        # --- Top row: Price chart & Indicators ---
-        col_left, col_right = st.columns([2.2, 1.3])
-
-        # Price chart (history)
-        with col_left:
-            st.subheader(f"📈 {ticker} — Price History ({period})")
-            hist = load_price_history(ticker, period=period)
-            if hist is None or hist.empty:
-                st.info("No history data.")
-            else:
-                fig = px.line(hist, x="date", y="Close", title=None)
-                fig.update_layout(margin=dict(l=10, r=10, t=10, b=10), height=360)
-                st.plotly_chart(fig, use_container_width=True)
-
-        # Indicators
-        with col_right:
-            st.subheader("🔎 Indicators")
-            ind = data.get("indicators", {})
-            m1, m2 = st.columns(2)
-            with m1:
-                st.metric("Price", f"{ind.get('price', 0):,.2f}")
-                st.metric("Vol Zscore", f"{ind.get('volume_zscore', 0):.2f}")
-                st.metric("Gap Open", pct(ind.get("gap_open_pct", 0)))
-            with m2:
-                st.metric("Change 1D", pct(ind.get("change_pct_1d", 0)))
-                st.metric("Volatility 20d", f"{ind.get('volatility_20d', 0):.3f}")
-                st.metric("Updated (UTC)", data.get("date", ""))
-
-        st.divider()
-
-        # --- News list ---
-        st.subheader("📰 Top News")
-        news = data.get("top_news", [])
-        if not news:
-            st.info("No news fetched.")
-        else:
-            # show as a dataframe-like table with links
-            rows = []
-            for n in news:
-                rows.append({
-                    "Title": f"[{n.get('title','')}]({n.get('url','')})",
-                    "Source": n.get("source",""),
-                    "Published": n.get("published","") or n.get("published_at",""),
-                })
-            df_news = pd.DataFrame(rows)
-            st.markdown(df_news.to_markdown(index=False), unsafe_allow_html=True)
-
-        st.divider()
-
-        # --- LLM Thesis ---
-        st.subheader("🤖 LLM Thesis")
-        th = data.get("thesis", {}) or {}
-        viewpoint = th.get("viewpoint", "neutral")
-        conf = th.get("confidence_0_1", 0.5)
+    r.raise_for_status()
+    return pa.ipc.open_stream(r.content).read_pandas()
+
+def render_indicators(ph, ind: dict, updated: str = ""):
+    with ph.container():
+        m1, m2 = st.columns(2)
+        with m1:
+            st.metric("Price", f"{ind.get('price', 0):,.2f}")
+            st.metric("Vol Zscore", f"{ind.get('volume_zscore', 0):.2f}")
+            st.metric("Gap Open", pct(ind.get("gap_open_pct", 0)))
+        with m2:
+            st.metric("Change 1D", pct(ind.get("change_pct_1d", 0)))
+            st.metric("Volatility 20d", f"{ind.get('volatility_20d', 0):.3f}")
+            st.metric("Updated (UTC)", updated)
+
+def render_news(ph, news: list):
+    if not news:
+        ph.info("No news fetched.")
+        return
+    # show as a dataframe-like table with links
+    rows = []
+    for n in news:
+        rows.append({
+            "Title": f"[{n.get('title','')}]({n.get('url','')})",
+            "Source": n.get("source",""),
+            "Published": n.get("published","") or n.get("published_at",""),
+        })
+    df_news = pd.DataFrame(rows)
+    ph.markdown(df_news.to_markdown(index=False), unsafe_allow_html=True)
+
+def render_evidences(ph, evs: list):
+    if not evs:
+        ph.caption("No evidences retrieved.")
+        return
+    with ph.expander(f"Evidence pool ({len(evs)})"):
+        for e in evs:
+            st.markdown(f"- _{e.get('source','')}_: [{e.get('title') or e.get('url','')}]({e.get('url','')}) — {e.get('summary','')}")
+
+def render_thesis(ph, th: dict, partial: bool = False):
+    with ph.container():
+        viewpoint = th.get("viewpoint") or "neutral"
+        conf = th.get("confidence_0_1")
 
         # viewpoint badge
         vp_color = {"bullish": "green", "bearish": "red", "neutral": "gray"}.get(viewpoint, "blue")
-        st.markdown(f"**Viewpoint:** <span style='color:{vp_color}'>{viewpoint.upper()}</span> &nbsp;&nbsp; **Confidence:** {conf:.2f}", unsafe_allow_html=True)
+        conf_txt = f"{conf:.2f}" if isinstance(conf, (int, float)) else "…"
+        st.markdown(f"**Viewpoint:** <span style='color:{vp_color}'>{viewpoint.upper()}</span> &nbsp;&nbsp; **Confidence:** {conf_txt}", unsafe_allow_html=True)
 
         # reasoning
         reasoning = th.get("reasoning", [])
@@ -165,13 +113,15 @@ if submit or ticker:
         if risks:
             st.markdown("**Risks**")
             for r in risks:
+                r = r or {}
                 name = r.get("name","")
                 sev = r.get("severity","")
                 rationale = r.get("rationale","")
                 st.write(f"- **{name}** (severity: {sev}) — {rationale}")
 
-                evs = r.get("evidences", [])
+                evs = r.get("evidences", []) or []
                 for e in evs:
+                    e = e or {}
                     src = e.get("source","")
                     url = e.get("url","")
                     quote = e.get("quote","")
@@ -181,6 +131,72 @@ if submit or ticker:
                     if quote:
                         bullet += f" — “{quote}”"
                     st.markdown(bullet)
+        if partial:
+            st.caption("Generating …")
+
+# Auto run once
+if submit or ticker:
+    try:
+        # --- Top row: Price chart & Indicators ---
+        col_left, col_right = st.columns([2.2, 1.3])
+
+        # Price chart (history)
+        with col_left:
+            st.subheader(f"📈 {ticker} — Price History ({period})")
+            chart_ph = st.empty()
+
+        # Indicators
+        with col_right:
+            st.subheader("🔎 Indicators")
+            ind_ph = st.empty()
+            ind_ph.caption("Loading indicators …")
+
+        st.divider()
+
+        # --- News list ---
+        st.subheader("📰 Top News")
+        news_ph = st.empty()
+        news_ph.caption("Loading headlines …")
+        ev_ph = st.empty()
+
+        st.divider()
+
+        # --- LLM Thesis ---
+        st.subheader("🤖 LLM Thesis")
+        thesis_ph = st.empty()
+        thesis_ph.caption("Waiting for market data and news …")
+
+        # 价格走势图：一次本地 /prices 调用（有缓存），先于分析流渲染
+        hist = load_price_history(ticker, period=period)
+        if hist is None or hist.empty:
+            chart_ph.info("No history data.")
+        else:
+            fig = px.line(hist, x="date", y="Close", title=None)
+            fig.update_layout(margin=dict(l=10, r=10, t=10, b=10), height=360)
+            chart_ph.plotly_chart(fig, use_container_width=True)
+
+        # 各部分按事件到达顺序渲染；thesis_partial 限频，避免每个 token 都重绘
+        last_draw = 0.0
+        for ev in stream_analysis(ticker):
+            kind, data = ev.get("event"), ev.get("data")
+            if kind == "indicators":
+                render_indicators(ind_ph, data or {})
+                thesis_ph.caption("Generating thesis …")
+            elif kind == "news":
+                render_news(news_ph, data or [])
+            elif kind == "evidences":
+                render_evidences(ev_ph, data or [])
+            elif kind == "thesis_partial" and time.monotonic() - last_draw > 0.2:
+                render_thesis(thesis_ph, data or {}, partial=True)
+                last_draw = time.monotonic()
+            elif kind == "report":
+                data = data or {}
+                render_indicators(ind_ph, data.get("indicators", {}), data.get("date", ""))
+                render_news(news_ph, data.get("top_news", []))
+                render_thesis(thesis_ph, data.get("thesis", {}) or {})
+            elif kind == "error":
+                retry = f" (retry in {ev['retry_after']}s)" if ev.get("retry_after") else ""
+                thesis_ph.error(f"API error: {ev.get('status')} — {ev.get('error')}{retry}")
 
     except requests.HTTPError as http_err:
         st.error(f"API error: {http_err.response.status_code} — {http_err.response.text[:400]}")